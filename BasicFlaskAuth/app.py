@@ -120,5 +120,5 @@ def requires_auth(f):
 @app.route('/headers')
 @requires_auth
 def headers(payload):
-    print(payload)
+    app.logger.debug('token payload: %s', payload)
     return 'Access Granted'
\ No newline at end of file
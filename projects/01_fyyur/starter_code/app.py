@@ -2,10 +2,15 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import io
 import json
+import time
+import base64
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from itertools import groupby
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, current_app
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
@@ -13,21 +18,37 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from models import *
+from bulk import import_rows
+from sqlstats import init_query_stats, query_budget
+from metrics import init_metrics
+from streaming import wants_ndjson, ndjson_response, NDJSON_MIMETYPE
+from fragments import init_fragment_cache, cached_page, invalidate_fragments, clear_fragments
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-
-# TODO: connect to a local postgresql database (done)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://reema@localhost:5432/fyyur'
-
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-from models import *
+moment = Moment()
+migrate = Migrate()
+
+
+def engine_options(config):
+  # builds the SQLAlchemy engine options from the DB_* settings of the config,
+  # so the pool of every worker can be sized against postgres max_connections
+  options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+  if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # sqlite uses its own pool classes which don't take these options
+    return options
+  options.setdefault('pool_size', config['DB_POOL_SIZE'])
+  options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+  options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+  options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+  options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+  if config['DB_STATEMENT_TIMEOUT'] and config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+    connect_args = dict(options.get('connect_args', {}))
+    connect_args.setdefault('options', '-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT']))
+    options['connect_args'] = connect_args
+  return options
 
 
 #----------------------------------------------------------------------------#
@@ -47,401 +68,621 @@ def format_datetime(value, format='medium'):
       format="EE MM, dd, y h:mma"
   return babel.dates.format_datetime(date, format)
 
-app.jinja_env.filters['datetime'] = format_datetime
-
 #----------------------------------------------------------------------------#
-# Controllers.
+# Helpers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
-def index():
-  return render_template('pages/home.html')
-
-
-#  Venues
-#  ----------------------------------------------------------------
-
-@app.route('/venues')
-def venues():
-  # TODO: replace with real venues data (done)
-  # num_shows should be aggregated based on number of upcoming shows per venue.
-  # here u returned a a query with two columns 
-  states_and_cities = db.session.query(Venue.city, Venue.state)
-  ## here i used a trick which is using set() in python to have distinct values and convert it back to list 
-  ## i used this link as ref: https://stackoverflow.com/questions/12897374/get-unique-values-from-a-list-in-python
-  states_and_cities = list(set(states_and_cities))
-  data = []
-
-  for element in states_and_cities:
-    # here i went throgh each element in states_and_cities list to have 
-    # to use it as fliter for Venue.id, Venue.name columns 
-      venues = db.session.query(Venue.id, Venue.name).filter(Venue.city == element[0],Venue.state == element[1])
-      data.append({
-        "state": element[1],
-        "city": element[0],
-        "venues": venues
-      })
-
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. (done)
-  search_term = request.form.get('search_term', '')
-  # here i used this link: https://stackoverflow.com/questions/16573095/case-insensitive-flask-sqlalchemy-query
-  # to find how to search for similar words 
-  results = Venue.query.filter(Venue.name.ilike(f'%{search_term}%'))
-  response={
-    "count": results.count(),
+def split_shows(shows):
+  # splits already loaded show rows into past and upcoming lists
+  # using a single "now" so a show can never end up in both lists
+  now = datetime.now()
+  past_shows = [show for show in shows if show.start_at <= now]
+  upcoming_shows = [show for show in shows if show.start_at > now]
+  return past_shows, upcoming_shows
+
+def invalidate_venue_pages(venue_id, artist_ids=None):
+  # drops the cached pages showing the venue: its own page, the venues and
+  # shows listings and the pages of the artists playing there
+  if artist_ids is None:
+    artist_ids = [artist_id for (artist_id,) in
+                  db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  invalidate_fragments('venue', [venue_id])
+  invalidate_fragments('artist', artist_ids)
+  invalidate_fragments('venues')
+  invalidate_fragments('shows')
+
+def invalidate_artist_pages(artist_id):
+  # drops the cached pages showing the artist: its own page, the shows
+  # listing and the pages of the venues it plays at
+  venue_ids = [venue_id for (venue_id,) in
+               db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+  invalidate_fragments('artist', [artist_id])
+  invalidate_fragments('venue', venue_ids)
+  invalidate_fragments('shows')
+
+def encode_cursor(*values):
+  # cursors are the sort key of the last row of a page, as url safe base64 json
+  return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, *types):
+  # decodes a cursor made by encode_cursor() and converts each value with the
+  # matching type, a cursor that was tampered with is a bad request
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if len(values) != len(types):
+      abort(400)
+    return tuple(convert(value) for convert, value in zip(types, values))
+  except (ValueError, TypeError):
+    abort(400)
+
+def keyset_page(query, columns, after, key):
+  # returns the page of rows sorted on columns that comes after the "after"
+  # values, plus the cursor of the next page (None on the last page).
+  # one extra row is fetched to know whether there is a next page
+  if after is not None:
+    query = query.filter(db.tuple_(*columns) > after)
+  page_size = current_app.config['PAGE_SIZE']
+  rows = query.order_by(*columns).limit(page_size + 1).all()
+  next_cursor = None
+  if len(rows) > page_size:
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(*key(rows[-1]))
+  return rows, next_cursor
+
+def search_by_name(model, search_term):
+  # the ilike filter is served by the pg_trgm GIN index on name, matches are
+  # ranked by trigram similarity and the total number of matches comes from
+  # a window function, so the count and the page come back in one query
+  total = db.func.count().over().label('total')
+  rank = db.func.similarity(model.name, search_term)
+  results = db.session.query(model.id, model.name, total) \
+                      .filter(model.name.ilike(f'%{search_term}%')) \
+                      .order_by(rank.desc(), model.name) \
+                      .limit(current_app.config['SEARCH_RESULTS_LIMIT']) \
+                      .all()
+  return {
+    "count": results[0].total if results else 0,
     "data": results
   }
 
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # TODO: replace with real venue data from the venues table, using venue_id (done)
-  # shows the venue page with the given venue_id
-  venue = Venue.query.get(venue_id)
-  # past shows
-  past_shows = db.session.query(Show).join(Venue).filter((Show.start_at <= datetime.now()))
-
-  # upcomping shows
-  upcomping_shows = db.session.query(Show).join(Venue).filter((Show.start_at > datetime.now()))
-
-  # to avoid null values i checked here if there is a venue.seeking_talent_text value or not
-  if venue.seeking_a_talent:
-    data ={
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website_link,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_a_talent,
-      "seeking_description": venue.seeking_talent_text,
-      "image_link": venue.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcomping_shows,
-      "past_shows_count": past_shows.count(),
-      "upcoming_shows_count": upcomping_shows.count(),
-    }
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+def create_app(config='config'):
+  # create and configure the app, config is an import name, an object,
+  # or a dict of settings that override the ones of config.py
+  app = Flask(__name__)
+  if isinstance(config, dict):
+    app.config.from_object('config')
+    app.config.update(config)
   else:
-    data ={
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website_link,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": False,
-      "seeking_description": '',
-      "image_link": venue.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcomping_shows,
-      "past_shows_count": past_shows.count(),
-      "upcoming_shows_count": upcomping_shows.count(),
-    }
-  return render_template('pages/show_venue.html', venue=data)
-
-#  Create Venue
-#  ----------------------------------------------------------------
-
-@app.route('/venues/create', methods=['GET'])
-def create_venue_form():
-  form = VenueForm()
-  return render_template('forms/new_venue.html', form=form)
-
-@app.route('/venues/create', methods=['POST'])
-def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead (done)
-  # TODO: modify data to be the data object returned from db insertion (done)
-  try:
-    # here i checked first if  seeking_a_talent checked or not and i assign to it boolean values
-    if request.form.get('seeking_a_talent'):
-      seeking_a_talent = True
-    else:
-      seeking_a_talent = False
-    # here i created the new object
-    new_venue = Venue(name=request.form['name'], city=request.form['city'], state=request.form['state'],
-                      address=request.form['address'], phone=request.form['phone'], genres=request.form.getlist('genres'), 
-                      facebook_link=request.form['facebook_link'], website_link=request.form['website_link'],
-                      image_link=request.form['image_link'], seeking_a_talent=seeking_a_talent,
-                      seeking_talent_text=request.form.get('seeking_talent_text', ''))
-    ## add and commit to DB
-    db.session.add(new_venue)
-    db.session.commit()
-    flash('Artist ' + new_venue.name + ' was successfully listed!')
-  except:
-    # TODO: on unsuccessful db insert, flash an error instead. (done)
-    # rollback in case of any error
-    db.session.rollback()
-    flash('An error occurred. Venue ' + request.form['name'] + ' could not be added.')
-  finally:
-   db.session.close()
-  return render_template('pages/home.html')
-
-@app.route('/venues/<venue_id>', methods=['DELETE'])
-def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using (done)
-  try:
-    ## sime end point which takes the venue id and deleted it 
-    Venue.query.filter_by(id=venue_id).delete()
-    db.session.commit()
-    flash('Venue was successfully deleted!')
-  except:
-    flash('An error occurred. Venue could not be deleted.')
-  finally:
-    db.session.close()
-  return redirect(url_for('venues'))
-  return None
-
-
-
-#  Artists
-#  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
-  # TODO: replace with real data returned from querying the database(done)
-  # return all artists in the DB
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.(done)
-  #here i used this link: https://stackoverflow.com/questions/16573095/case-insensitive-flask-sqlalchemy-query
-  # to find how to search for similar words 
-  search_term = request.form.get('search_term', '')
-  results = Artist.query.filter(Artist.name.ilike(f'%{search_term}%'))
-  response={
-    "count": results.count(),
-    "data": results
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  # TODO: replace with real venue data from the venues table, using venue_id(done)
-  # here i retrived the artists data with the given id
-  artist =  Artist.query.get(artist_id)
-
-  # past shows
-  past_shows = db.session.query(Show).join(Artist).filter((Show.start_at <= datetime.now()))
-
-  # upcomping shows
-  upcomping_shows = db.session.query(Show).join(Artist).filter((Show.start_at > datetime.now()))
-
-  data={
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website_link,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_a_venue,
-    "seeking_description": artist.seeking_venue_text,
-    "image_link": artist.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcomping_shows,
-    "past_shows_count": past_shows.count(),
-    "upcoming_shows_count":  upcomping_shows.count(),
-  }
-  return render_template('pages/show_artist.html', artist=data)
-
-#  Update
-#  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
-def edit_artist(artist_id):
-  form = ArtistForm()
-  # here i filled the form fields with the data form the given artist ID 
-  artist = Artist.query.get(artist_id)
-  form.name.data = artist.name
-  form.genres.data = artist.genres
-  form.city.data = artist.city
-  form.state.data = artist.state
-  form.phone.data = artist.phone
-  form.website_link.data = artist.website_link
-  form.facebook_link.data = artist.facebook_link,
-  form.seeking_a_venue.data = artist.seeking_a_venue,
-  form.seeking_venue_text.data = artist.seeking_venue_text,
-  form.image_link.data = artist.image_link
-  # TODO: populate form with fields from artist with ID <artist_id> (done)
-  return render_template('forms/edit_artist.html', form=form, artist=artist)
-
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
-def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing (done)
-  try:
-    # here i retrived the request data to update the artist object
+    app.config.from_object(config)
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+  db.init_app(app)
+  migrate.init_app(app, db)
+  moment.init_app(app)
+  init_query_stats(app)
+  init_metrics(app)
+  init_fragment_cache(app)
+  app.jinja_env.filters['datetime'] = format_datetime
+
+  @app.route('/')
+  def index():
+    return render_template('pages/home.html')
+
+
+  #  Venues
+  #  ----------------------------------------------------------------
+
+  @app.route('/venues')
+  @query_budget(1)
+  def venues():
+    # TODO: replace with real venues data (done)
+    # num_shows should be aggregated based on number of upcoming shows per venue.
+    # the number of upcoming shows is a column kept up to date on the venue, so
+    # one query without a join returns every venue, already sorted by state and
+    # city so the areas can be grouped without more queries
+    # the page is cached until a venue is added, edited or deleted
+    def render():
+      venues = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                                Venue.upcoming_shows_count.label('num_upcoming_shows')) \
+                         .order_by(Venue.state, Venue.city, Venue.name) \
+                         .all()
+      data = []
+
+      for (state, city), area_venues in groupby(venues, key=lambda venue: (venue.state, venue.city)):
+        data.append({
+          "state": state,
+          "city": city,
+          "venues": [{
+            "id": venue.id,
+            "name": venue.name,
+            "num_upcoming_shows": venue.num_upcoming_shows
+          } for venue in area_venues]
+        })
+
+      return render_template('pages/venues.html', areas=data)
+
+    return cached_page('venues', None, render)
+
+  @app.route('/venues/search', methods=['POST'])
+  def search_venues():
+    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive. (done)
+    search_term = request.form.get('search_term', '')
+    # here i used this link: https://stackoverflow.com/questions/16573095/case-insensitive-flask-sqlalchemy-query
+    # to find how to search for similar words 
+    response = search_by_name(Venue, search_term)
+
+    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+
+  @app.route('/venues/<int:venue_id>')
+  def show_venue(venue_id):
+    # TODO: replace with real venue data from the venues table, using venue_id (done)
+    # shows the venue page with the given venue_id
+    # the page is cached until the venue, one of its shows or artists changes
+    def render():
+      venue = Venue.query.get(venue_id)
+      if venue is None:
+        abort(404)
+      # only this venue's shows are loaded, together with the artist columns the page needs
+      shows = db.session.query(Show.start_at, Show.artist_id,
+                               Artist.name.label('artist_name'),
+                               Artist.image_link.label('artist_image_link')) \
+                        .join(Artist, Show.artist_id == Artist.id) \
+                        .filter(Show.venue_id == venue_id) \
+                        .order_by(Show.start_at) \
+                        .all()
+      past_shows, upcomping_shows = split_shows(shows)
+
+      # to avoid null values i checked here if there is a venue.seeking_talent_text value or not
+      if venue.seeking_a_talent:
+        data ={
+          "id": venue.id,
+          "name": venue.name,
+          "genres": venue.genres,
+          "address": venue.address,
+          "city": venue.city,
+          "state": venue.state,
+          "phone": venue.phone,
+          "website": venue.website_link,
+          "facebook_link": venue.facebook_link,
+          "seeking_talent": venue.seeking_a_talent,
+          "seeking_description": venue.seeking_talent_text,
+          "image_link": venue.image_link,
+          "past_shows": past_shows,
+          "upcoming_shows": upcomping_shows,
+          "past_shows_count": len(past_shows),
+          "upcoming_shows_count": len(upcomping_shows),
+        }
+      else:
+        data ={
+          "id": venue.id,
+          "name": venue.name,
+          "genres": venue.genres,
+          "address": venue.address,
+          "city": venue.city,
+          "state": venue.state,
+          "phone": venue.phone,
+          "website": venue.website_link,
+          "facebook_link": venue.facebook_link,
+          "seeking_talent": False,
+          "seeking_description": '',
+          "image_link": venue.image_link,
+          "past_shows": past_shows,
+          "upcoming_shows": upcomping_shows,
+          "past_shows_count": len(past_shows),
+          "upcoming_shows_count": len(upcomping_shows),
+        }
+      return render_template('pages/show_venue.html', venue=data)
+
+    return cached_page('venue', venue_id, render)
+
+  #  Create Venue
+  #  ----------------------------------------------------------------
+
+  @app.route('/venues/create', methods=['GET'])
+  def create_venue_form():
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+  @app.route('/venues/create', methods=['POST'])
+  def create_venue_submission():
+    # TODO: insert form data as a new Venue record in the db, instead (done)
+    # TODO: modify data to be the data object returned from db insertion (done)
+    try:
+      # here i checked first if  seeking_a_talent checked or not and i assign to it boolean values
+      if request.form.get('seeking_a_talent'):
+        seeking_a_talent = True
+      else:
+        seeking_a_talent = False
+      # here i created the new object
+      new_venue = Venue(name=request.form['name'], city=request.form['city'], state=request.form['state'],
+                        address=request.form['address'], phone=request.form['phone'], genres=request.form.getlist('genres'), 
+                        facebook_link=request.form['facebook_link'], website_link=request.form['website_link'],
+                        image_link=request.form['image_link'], seeking_a_talent=seeking_a_talent,
+                        seeking_talent_text=request.form.get('seeking_talent_text', ''))
+      ## add and commit to DB
+      db.session.add(new_venue)
+      db.session.commit()
+      invalidate_fragments('venues')
+      flash('Artist ' + new_venue.name + ' was successfully listed!')
+    except:
+      # TODO: on unsuccessful db insert, flash an error instead. (done)
+      # rollback in case of any error
+      db.session.rollback()
+      flash('An error occurred. Venue ' + request.form['name'] + ' could not be added.')
+    finally:
+     db.session.close()
+    return render_template('pages/home.html')
+
+  @app.route('/venues/<venue_id>', methods=['DELETE'])
+  def delete_venue(venue_id):
+    # TODO: Complete this endpoint for taking a venue_id, and using (done)
+    try:
+      ## sime end point which takes the venue id and deleted it 
+      # the database deletes the venue's shows, so its artists are counted again
+      artist_ids = [artist_id for (artist_id,) in
+                    db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+      Venue.query.filter_by(id=venue_id).delete()
+      refresh_show_counts(venue_ids=[], artist_ids=artist_ids)
+      db.session.commit()
+      invalidate_venue_pages(int(venue_id), artist_ids)
+      flash('Venue was successfully deleted!')
+    except:
+      flash('An error occurred. Venue could not be deleted.')
+    finally:
+      db.session.close()
+    return redirect(url_for('venues'))
+    return None
+
+
+
+  #  Artists
+  #  ----------------------------------------------------------------
+  @app.route('/artists')
+  def artists():
+    # TODO: replace with real data returned from querying the database(done)
+    # return all artists in the DB
+    # artists are paginated by (name, id), with NULL names as '', so each
+    # page is a range scan of the ix_Artist_sort_name_id index
+    after = None
+    if request.args.get('after'):
+      after = decode_cursor(request.args['after'], str, int)
+    query = db.session.query(Artist.id, Artist.name)
+    if wants_ndjson():
+      # every artist after the cursor, streamed instead of one page
+      if after is not None:
+        query = query.filter(db.tuple_(artist_sort_name, Artist.id) > after)
+      query = query.order_by(artist_sort_name, Artist.id)
+      response = ndjson_response(query, lambda artist: {'id': artist.id, 'name': artist.name})
+      return response or Response('', mimetype=NDJSON_MIMETYPE)
+    data, next_cursor = keyset_page(query, (artist_sort_name, Artist.id), after,
+                                    key=lambda artist: (artist.name or '', artist.id))
+    return render_template('pages/artists.html', artists=data, next_cursor=next_cursor)
+
+  @app.route('/artists/search', methods=['POST'])
+  def search_artists():
+    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.(done)
+    #here i used this link: https://stackoverflow.com/questions/16573095/case-insensitive-flask-sqlalchemy-query
+    # to find how to search for similar words 
+    search_term = request.form.get('search_term', '')
+    response = search_by_name(Artist, search_term)
+    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+
+  @app.route('/artists/<int:artist_id>')
+  def show_artist(artist_id):
+    # TODO: replace with real venue data from the venues table, using venue_id(done)
+    # here i retrived the artists data with the given id
+    # the page is cached until the artist, one of its shows or venues changes
+    def render():
+      artist =  Artist.query.get(artist_id)
+      if artist is None:
+        abort(404)
+
+      # only this artist's shows are loaded, together with the venue columns the page needs
+      shows = db.session.query(Show.start_at, Show.venue_id,
+                               Venue.name.label('venue_name'),
+                               Venue.image_link.label('venue_image_link')) \
+                        .join(Venue, Show.venue_id == Venue.id) \
+                        .filter(Show.artist_id == artist_id) \
+                        .order_by(Show.start_at) \
+                        .all()
+      past_shows, upcomping_shows = split_shows(shows)
+
+      data={
+        "id": artist.id,
+        "name": artist.name,
+        "genres": artist.genres,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website_link,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_a_venue,
+        "seeking_description": artist.seeking_venue_text,
+        "image_link": artist.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcomping_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcomping_shows),
+      }
+      return render_template('pages/show_artist.html', artist=data)
+
+    return cached_page('artist', artist_id, render)
+
+  #  Update
+  #  ----------------------------------------------------------------
+  @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+  def edit_artist(artist_id):
+    form = ArtistForm()
+    # here i filled the form fields with the data form the given artist ID 
     artist = Artist.query.get(artist_id)
-    artist.name = request.form['name']
-    artist.city = request.form['city']
-    artist.state = request.form['state']
-    artist.phone = request.form['phone']
-    artist.genres = request.form.getlist('genres')
-    artist.image_link = request.form['image_link']
-    artist.facebook_link = request.form['facebook_link']
-    artist.website_link = request.form['website_link']
-    # here i checked if seeking_a_venue checkbock checked to fill it with boolean values
-    if request.form.get('seeking_a_venue'):
-      artist.seeking_a_venue = True
-    else:
-      artist.seeking_a_venue = False
-    artist.seeking_venue_text = request.form.get('seeking_venue_text', '')
-    flash('Artist ' + artist.name + ' was successfully updated!')
-    db.session.commit()
-  except:
-    db.session.rollback()
-    flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated!')
-  finally:
-    db.session.close()
-  return redirect(url_for('show_artist', artist_id=artist_id))
-
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
-def edit_venue(venue_id):
-  form = VenueForm()
-  venue = Venue.query.get(venue_id)
-  # here i filled the form fields with the data form the given venue ID 
-  form.name.data = venue.name
-  form.genres.data = venue.genres
-  form.address.data = venue.address
-  form.city.data = venue.city
-  form.state.data = venue.state
-  form.phone.data = venue.phone
-  form.website_link.data = venue.website_link
-  form.facebook_link.data = venue.facebook_link,
-  form.seeking_a_talent.data = venue.seeking_a_talent,
-  form.seeking_a_talent_text.data = venue.seeking_talent_text,
-  form.image_link.data = venue.image_link
-  # TODO: populate form with values from venue with ID <venue_id> (done)
-  return render_template('forms/edit_venue.html', form=form, venue=venue)
-
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
-def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing (done)
-  try:
-    # here i retrived the request data to update the venue object
+    form.name.data = artist.name
+    form.genres.data = artist.genres
+    form.city.data = artist.city
+    form.state.data = artist.state
+    form.phone.data = artist.phone
+    form.website_link.data = artist.website_link
+    form.facebook_link.data = artist.facebook_link,
+    form.seeking_a_venue.data = artist.seeking_a_venue,
+    form.seeking_venue_text.data = artist.seeking_venue_text,
+    form.image_link.data = artist.image_link
+    # TODO: populate form with fields from artist with ID <artist_id> (done)
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+  @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+  def edit_artist_submission(artist_id):
+    # TODO: take values from the form submitted, and update existing (done)
+    try:
+      # here i retrived the request data to update the artist object
+      artist = Artist.query.get(artist_id)
+      artist.name = request.form['name']
+      artist.city = request.form['city']
+      artist.state = request.form['state']
+      artist.phone = request.form['phone']
+      artist.genres = request.form.getlist('genres')
+      artist.image_link = request.form['image_link']
+      artist.facebook_link = request.form['facebook_link']
+      artist.website_link = request.form['website_link']
+      # here i checked if seeking_a_venue checkbock checked to fill it with boolean values
+      if request.form.get('seeking_a_venue'):
+        artist.seeking_a_venue = True
+      else:
+        artist.seeking_a_venue = False
+      artist.seeking_venue_text = request.form.get('seeking_venue_text', '')
+      flash('Artist ' + artist.name + ' was successfully updated!')
+      db.session.commit()
+      invalidate_artist_pages(artist_id)
+    except:
+      db.session.rollback()
+      flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated!')
+    finally:
+      db.session.close()
+    return redirect(url_for('show_artist', artist_id=artist_id))
+
+  @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+  def edit_venue(venue_id):
+    form = VenueForm()
     venue = Venue.query.get(venue_id)
-    venue.name = request.form['name']
-    venue.city = request.form['city']
-    venue.address = request.form['address']
-    venue.state = request.form['state']
-    venue.phone = request.form['phone']
-    venue.genres = request.form.getlist('genres')
-    venue.image_link = request.form['image_link']
-    venue.facebook_link = request.form['facebook_link']
-    venue.website_link = request.form['website_link']
-    if request.form.get('seeking_a_talent'):
-      venue.seeking_a_talent = True
-    else:
-      venue.seeking_a_talent = False
-    venue.seeking_talent_text = request.form.get('seeking_a_talent_text', '')
-    flash('Venue ' + venue.name + ' was successfully updated!')
-    db.session.commit()
-  except:
-    db.session.rollback()
-    flash('An error occurred. venue ' + request.form['name'] + ' could not be updated!')
-  finally:
-    db.session.close()
-  return redirect(url_for('show_venue', venue_id=venue_id))
-
-
-#  Create Artist
-#  ----------------------------------------------------------------
-@app.route('/artists/create', methods=['GET'])
-def create_artist_form():
-  form = ArtistForm()
-  return render_template('forms/new_artist.html', form=form)
-
-@app.route('/artists/create', methods=['POST'])
-def create_artist_submission():
-  # TODO: insert form data as a new Venue record in the db, instead(done)
-  # TODO: modify data to be the data object returned from db insertion(done)
-  try:
-    # checking seeking_a_venue value
-    if request.form.get('seeking_a_venue'):
-      seeking_a_venue = True
-    else:
-      seeking_a_venue = False
-    # create a new object fot artist 
-    new_artist = Artist(name=request.form['name'], city=request.form['city'], state=request.form['state'],
-                        phone=request.form['phone'], genres=request.form.getlist('genres'), image_link=request.form['image_link'],
-                        facebook_link=request.form['facebook_link'], website_link=request.form['website_link'],
-                        seeking_a_venue=seeking_a_venue,
-                        seeking_venue_text=request.form.get('seeking_venue_text', ''))
-    # add object to session and commit
-    db.session.add(new_artist)
-    db.session.commit()
-    flash('Artist ' + new_artist.name + ' was successfully listed!')
-    # TODO: on unsuccessful db insert, flash an error instead. (done)
-  except:
-    db.session.rollback()
-    flash('An error occurred. Artist ' + request.form['name']+ ' could not be added.')
-  finally:
-   db.session.close()
-  return render_template('pages/home.html')
-
-
-#  Shows
-#  ----------------------------------------------------------------
-
-@app.route('/shows')
-def shows():
-  # TODO: replace with real venues data. (done)
-  data = Show.query.order_by(Show.start_at).all()
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
-def create_shows():
-  # renders form. do not touch.
-  form = ShowForm()
-  return render_template('forms/new_show.html', form=form)
-
-@app.route('/shows/create', methods=['POST'])
-def create_show_submission():
-  # TODO: insert form data as a new Show record in the db, instead (done)
-  try:
-    # create a new show object
-    new_show = Show(artist_id=request.form['artist_id'], venue_id=request.form['venue_id'], start_at=request.form['start_time'])
-    # add and commit to db session
-    db.session.add(new_show)
+    # here i filled the form fields with the data form the given venue ID 
+    form.name.data = venue.name
+    form.genres.data = venue.genres
+    form.address.data = venue.address
+    form.city.data = venue.city
+    form.state.data = venue.state
+    form.phone.data = venue.phone
+    form.website_link.data = venue.website_link
+    form.facebook_link.data = venue.facebook_link,
+    form.seeking_a_talent.data = venue.seeking_a_talent,
+    form.seeking_a_talent_text.data = venue.seeking_talent_text,
+    form.image_link.data = venue.image_link
+    # TODO: populate form with values from venue with ID <venue_id> (done)
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+  @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+  def edit_venue_submission(venue_id):
+    # TODO: take values from the form submitted, and update existing (done)
+    try:
+      # here i retrived the request data to update the venue object
+      venue = Venue.query.get(venue_id)
+      venue.name = request.form['name']
+      venue.city = request.form['city']
+      venue.address = request.form['address']
+      venue.state = request.form['state']
+      venue.phone = request.form['phone']
+      venue.genres = request.form.getlist('genres')
+      venue.image_link = request.form['image_link']
+      venue.facebook_link = request.form['facebook_link']
+      venue.website_link = request.form['website_link']
+      if request.form.get('seeking_a_talent'):
+        venue.seeking_a_talent = True
+      else:
+        venue.seeking_a_talent = False
+      venue.seeking_talent_text = request.form.get('seeking_a_talent_text', '')
+      flash('Venue ' + venue.name + ' was successfully updated!')
+      db.session.commit()
+      invalidate_venue_pages(venue_id)
+    except:
+      db.session.rollback()
+      flash('An error occurred. venue ' + request.form['name'] + ' could not be updated!')
+    finally:
+      db.session.close()
+    return redirect(url_for('show_venue', venue_id=venue_id))
+
+
+  #  Create Artist
+  #  ----------------------------------------------------------------
+  @app.route('/artists/create', methods=['GET'])
+  def create_artist_form():
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+  @app.route('/artists/create', methods=['POST'])
+  def create_artist_submission():
+    # TODO: insert form data as a new Venue record in the db, instead(done)
+    # TODO: modify data to be the data object returned from db insertion(done)
+    try:
+      # checking seeking_a_venue value
+      if request.form.get('seeking_a_venue'):
+        seeking_a_venue = True
+      else:
+        seeking_a_venue = False
+      # create a new object fot artist 
+      new_artist = Artist(name=request.form['name'], city=request.form['city'], state=request.form['state'],
+                          phone=request.form['phone'], genres=request.form.getlist('genres'), image_link=request.form['image_link'],
+                          facebook_link=request.form['facebook_link'], website_link=request.form['website_link'],
+                          seeking_a_venue=seeking_a_venue,
+                          seeking_venue_text=request.form.get('seeking_venue_text', ''))
+      # add object to session and commit
+      db.session.add(new_artist)
+      db.session.commit()
+      flash('Artist ' + new_artist.name + ' was successfully listed!')
+      # TODO: on unsuccessful db insert, flash an error instead. (done)
+    except:
+      db.session.rollback()
+      flash('An error occurred. Artist ' + request.form['name']+ ' could not be added.')
+    finally:
+     db.session.close()
+    return render_template('pages/home.html')
+
+
+  #  Shows
+  #  ----------------------------------------------------------------
+
+  @app.route('/shows')
+  @query_budget(1)
+  def shows():
+    # TODO: replace with real venues data. (done)
+    # shows are paginated by (start_at, id) and the artist and venue columns
+    # the page shows are joined in, instead of lazy loading them per show
+    after = None
+    if request.args.get('after'):
+      after = decode_cursor(request.args['after'], datetime.fromisoformat, int)
+    # every page of the listing is cached until a show, venue or artist changes
+    def render():
+      query = db.session.query(Show.id, Show.start_at, Show.artist_id, Show.venue_id,
+                               Artist.name.label('artist_name'),
+                               Artist.image_link.label('artist_image_link'),
+                               Venue.name.label('venue_name')) \
+                        .join(Artist, Show.artist_id == Artist.id) \
+                        .join(Venue, Show.venue_id == Venue.id)
+      data, next_cursor = keyset_page(query, (Show.start_at, Show.id), after,
+                                      key=lambda show: (show.start_at.isoformat(), show.id))
+      return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+
+    return cached_page('shows', None, render, variant=after)
+
+  @app.route('/shows/create')
+  def create_shows():
+    # renders form. do not touch.
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+  @app.route('/shows/create', methods=['POST'])
+  def create_show_submission():
+    # TODO: insert form data as a new Show record in the db, instead (done)
+    try:
+      # create a new show object
+      new_show = Show(artist_id=request.form['artist_id'], venue_id=request.form['venue_id'], start_at=request.form['start_time'])
+      # add and commit to db session
+      db.session.add(new_show)
+      db.session.commit()
+      invalidate_fragments('venue', [new_show.venue_id])
+      invalidate_fragments('artist', [new_show.artist_id])
+      invalidate_fragments('shows')
+      flash('Show of artist_id' + request.form['artist_id']  + ' was successfully listed!')
+      # TODO: on unsuccessful db insert, flash an error instead.(done)
+    except:
+      db.session.rollback()
+      flash('An error occurred. Show of artist_id' + request.form['artist_id'] + ' could not be added.')
+    finally:
+     db.session.close()
+    return render_template('pages/home.html')
+
+  #  Bulk import
+  #  ----------------------------------------------------------------
+
+  @app.route('/<any(venues, artists, shows):kind>/import', methods=['POST'])
+  def bulk_import(kind):
+    # imports a csv (Content-Type: text/csv) or ndjson body of venues, artists or shows
+    # and returns a report with the number of inserted rows and the errors per line
+    data_format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if data_format not in ('csv', 'ndjson'):
+      abort(400)
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = import_rows(kind, stream, data_format)
+    if report['inserted'] and kind != 'artists':
+      # new venues change the venues listing, new shows any venue or artist page
+      clear_fragments()
+    return jsonify(report)
+
+  @app.cli.command('import-data')
+  @click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+  @click.argument('file', type=click.File('r', encoding='utf-8'))
+  @click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']),
+                help='Defaults to csv for .csv files and ndjson otherwise.')
+  def import_data_command(kind, file, data_format):
+    """Import venues, artists or shows from a csv or ndjson file."""
+    if data_format is None:
+      data_format = 'csv' if file.name.endswith('.csv') else 'ndjson'
+    report = import_rows(kind, file, data_format)
+    for error in report['errors']:
+      click.echo(f"line {error['line']}: {error['errors']}", err=True)
+    if report['errors_omitted']:
+      click.echo(f"... and {report['errors_omitted']} more failed rows", err=True)
+    click.echo(f"{report['inserted']} {kind} inserted, {report['failed']} failed "
+               f"in {report['seconds']}s ({report['rows_per_second']} rows/s)")
+
+  @app.cli.command('refresh-show-counts')
+  def refresh_show_counts_command():
+    """Count the upcoming and past shows of every venue and artist again."""
+    # run periodically (e.g. from cron) so shows that started move from upcoming to past
+    start = time.perf_counter()
+    refresh_show_counts()
     db.session.commit()
-    flash('Show of artist_id' + request.form['artist_id']  + ' was successfully listed!')
-    # TODO: on unsuccessful db insert, flash an error instead.(done)
-  except:
-    db.session.rollback()
-    flash('An error occurred. Show of artist_id' + request.form['artist_id'] + ' could not be added.')
-  finally:
-   db.session.close()
-  return render_template('pages/home.html')
-
-@app.errorhandler(404)
-def not_found_error(error):
-    return render_template('errors/404.html'), 404
-
-@app.errorhandler(500)
-def server_error(error):
-    return render_template('errors/500.html'), 500
-
-
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+    click.echo(f"show counts refreshed in {time.perf_counter() - start:.2f}s")
+
+  @app.errorhandler(404)
+  def not_found_error(error):
+      return render_template('errors/404.html'), 404
+
+  @app.errorhandler(500)
+  def server_error(error):
+      return render_template('errors/500.html'), 500
+
+  #  Metrics
+  #  ----------------------------------------------------------------
+
+  @app.route('/metrics/pool')
+  def pool_metrics():
+    # connection pool usage of this worker
+    pool = db.engine.pool
+    return jsonify({
+      'pool': type(pool).__name__,
+      'size': pool.size() if hasattr(pool, 'size') else None,
+      'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+      'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+      'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+      'max_overflow': app.config['SQLALCHEMY_ENGINE_OPTIONS'].get('max_overflow'),
+      'status': pool.status()
+    })
+
+
+  if not app.debug:
+      file_handler = FileHandler('error.log')
+      file_handler.setFormatter(
+          Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      )
+      app.logger.setLevel(logging.INFO)
+      file_handler.setLevel(logging.INFO)
+      app.logger.addHandler(file_handler)
+      app.logger.info('errors')
+
+  return app
+
+app = create_app()
 
 #----------------------------------------------------------------------------#
 # Launch.
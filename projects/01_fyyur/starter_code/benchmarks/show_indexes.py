@@ -0,0 +1,114 @@
+'''
+Benchmark for the Show table indexes added in migration 3f1c9a7d2b64.
+
+It seeds a database with venues, artists and (by default) 1M shows, then runs
+the queries used by the venue/artist detail pages and the /shows listing
+twice: once without the indexes and once with them. For every query it prints
+the plan Postgres picked and the best time out of a few runs.
+
+Run it against a throwaway database, the Venue/Artist/Show tables are dropped:
+
+  createdb fyyur_bench
+  python benchmarks/show_indexes.py --url postgresql://localhost:5432/fyyur_bench
+'''
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+INDEXES = [
+  'CREATE INDEX "ix_Show_venue_id_start_at" ON "Show" (venue_id, start_at)',
+  'CREATE INDEX "ix_Show_artist_id_start_at" ON "Show" (artist_id, start_at)',
+  'CREATE INDEX "ix_Show_start_at" ON "Show" (start_at)',
+]
+
+QUERIES = {
+  'venue detail': '''
+    SELECT "Show".start_at, "Show".artist_id, "Artist".name, "Artist".image_link
+    FROM "Show" JOIN "Artist" ON "Show".artist_id = "Artist".id
+    WHERE "Show".venue_id = :entity_id ORDER BY "Show".start_at''',
+  'artist detail': '''
+    SELECT "Show".start_at, "Show".venue_id, "Venue".name, "Venue".image_link
+    FROM "Show" JOIN "Venue" ON "Show".venue_id = "Venue".id
+    WHERE "Show".artist_id = :entity_id ORDER BY "Show".start_at''',
+  'shows listing': '''
+    SELECT "Show".id, "Show".start_at FROM "Show"
+    ORDER BY "Show".start_at LIMIT 50''',
+}
+
+
+def seed(conn, venues, artists, shows):
+  # the whole dataset is generated inside postgres, so seeding 1M rows
+  # takes seconds instead of a million round trips
+  conn.execute(text('DROP TABLE IF EXISTS "Show", "Venue", "Artist"'))
+  conn.execute(text('CREATE TABLE "Venue" (id serial PRIMARY KEY, name varchar, image_link varchar(500))'))
+  conn.execute(text('CREATE TABLE "Artist" (id serial PRIMARY KEY, name varchar, image_link varchar(500))'))
+  conn.execute(text('''
+    CREATE TABLE "Show" (
+      id serial PRIMARY KEY,
+      start_at timestamp NOT NULL,
+      artist_id integer REFERENCES "Artist" (id) ON DELETE CASCADE,
+      venue_id integer REFERENCES "Venue" (id) ON DELETE CASCADE)'''))
+  conn.execute(text('''
+    INSERT INTO "Venue" (name, image_link)
+    SELECT 'venue ' || i, 'https://example.com/venue/' || i FROM generate_series(1, :n) AS i'''), {'n': venues})
+  conn.execute(text('''
+    INSERT INTO "Artist" (name, image_link)
+    SELECT 'artist ' || i, 'https://example.com/artist/' || i FROM generate_series(1, :n) AS i'''), {'n': artists})
+  conn.execute(text('''
+    INSERT INTO "Show" (start_at, artist_id, venue_id)
+    SELECT now() - interval '3 years' + random() * interval '6 years',
+           1 + floor(random() * :artists)::int,
+           1 + floor(random() * :venues)::int
+    FROM generate_series(1, :n)'''), {'n': shows, 'artists': artists, 'venues': venues})
+  conn.execute(text('ANALYZE "Venue"; ANALYZE "Artist"; ANALYZE "Show"'))
+
+
+def run_queries(conn, entity_id, repeat):
+  results = {}
+  for name, query in QUERIES.items():
+    plan = conn.execute(text('EXPLAIN ' + query), {'entity_id': entity_id}).fetchall()
+    best = None
+    for _ in range(repeat):
+      start = time.perf_counter()
+      conn.execute(text(query), {'entity_id': entity_id}).fetchall()
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+    results[name] = (plan[0][0], best)
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--url', default='postgresql://localhost:5432/fyyur_bench')
+  parser.add_argument('--shows', type=int, default=1000000)
+  parser.add_argument('--venues', type=int, default=5000)
+  parser.add_argument('--artists', type=int, default=20000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  engine = create_engine(args.url)
+  with engine.begin() as conn:
+    start = time.perf_counter()
+    seed(conn, args.venues, args.artists, args.shows)
+    print(f'seeded {args.shows} shows in {time.perf_counter() - start:.1f}s')
+
+  with engine.begin() as conn:
+    before = run_queries(conn, args.venues // 2, args.repeat)
+    for index in INDEXES:
+      conn.execute(text(index))
+    conn.execute(text('ANALYZE "Show"'))
+  with engine.begin() as conn:
+    after = run_queries(conn, args.venues // 2, args.repeat)
+
+  for name in QUERIES:
+    plan_before, time_before = before[name]
+    plan_after, time_after = after[name]
+    print(f'\n{name}')
+    print(f'  before: {time_before * 1000:9.2f} ms  {plan_before}')
+    print(f'  after:  {time_after * 1000:9.2f} ms  {plan_after}')
+    print(f'  speedup: {time_before / time_after:.1f}x')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,223 @@
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#----------------------------------------------------------------------------#
+
+import csv
+import json
+import time
+from werkzeug.datastructures import MultiDict
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Venue, Artist, Show, refresh_show_counts
+from forms import VenueForm, ArtistForm, ShowForm
+
+# number of valid rows inserted with one executemany
+BATCH_SIZE = 1000
+# fields that take several values, in csv files they are separated by commas
+MULTI_VALUE_FIELDS = ('genres',)
+# errors listed in a report, the errors of the other failed rows are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+#  Row to column mapping
+#  ----------------------------------------------------------------
+# each importer turns a validated form into the columns of its table,
+# the form field names are the same as the ones of the create pages
+
+def venue_columns(form):
+  return {
+    'name': form.name.data,
+    'city': form.city.data,
+    'state': form.state.data,
+    'address': form.address.data,
+    'phone': form.phone.data,
+    'genres': form.genres.data,
+    'image_link': form.image_link.data,
+    'facebook_link': form.facebook_link.data,
+    'website_link': form.website_link.data,
+    'seeking_a_talent': form.seeking_a_talent.data,
+    'seeking_talent_text': form.seeking_a_talent_text.data or '',
+  }
+
+def artist_columns(form):
+  return {
+    'name': form.name.data,
+    'city': form.city.data,
+    'state': form.state.data,
+    'phone': form.phone.data,
+    'genres': form.genres.data,
+    'image_link': form.image_link.data,
+    'facebook_link': form.facebook_link.data,
+    'website_link': form.website_link.data,
+    'seeking_a_venue': form.seeking_a_venue.data,
+    'seeking_venue_text': form.seeking_venue_text.data or '',
+  }
+
+def show_columns(form):
+  return {
+    'artist_id': int(form.artist_id.data),
+    'venue_id': int(form.venue_id.data),
+    'start_at': form.start_time.data,
+  }
+
+def check_show_references(rows):
+  # the artists and venues of a whole batch are checked with two IN queries,
+  # returns the errors of the rows pointing at ids that don't exist
+  artist_ids = {columns['artist_id'] for _, columns in rows}
+  venue_ids = {columns['venue_id'] for _, columns in rows}
+  artists = {artist_id for (artist_id,) in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  venues = {venue_id for (venue_id,) in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+  errors = {}
+  for line, columns in rows:
+    if columns['artist_id'] not in artists:
+      errors.setdefault(line, {})['artist_id'] = ['No artist with this id.']
+    if columns['venue_id'] not in venues:
+      errors.setdefault(line, {})['venue_id'] = ['No venue with this id.']
+  return errors
+
+def count_imported_shows(rows):
+  # the shows were inserted without the ORM, so the show counts of their
+  # venues and artists are updated with one UPDATE per table
+  refresh_show_counts(venue_ids={columns['venue_id'] for _, columns in rows},
+                      artist_ids={columns['artist_id'] for _, columns in rows})
+  db.session.commit()
+
+# kind: (form, model, columns, check before the insert, update after the insert)
+IMPORTERS = {
+  'venues': (VenueForm, Venue, venue_columns, None, None),
+  'artists': (ArtistForm, Artist, artist_columns, None, None),
+  'shows': (ShowForm, Show, show_columns, check_show_references, count_imported_shows),
+}
+
+
+#  Reading and validating rows
+#  ----------------------------------------------------------------
+
+def read_rows(stream, data_format):
+  # yields (line number, row dict, parse error) for every row of a csv or ndjson stream
+  if data_format == 'csv':
+    for line, row in enumerate(csv.DictReader(stream), start=2):
+      yield line, row, None
+  else:
+    for line, text in enumerate(stream, start=1):
+      if not text.strip():
+        continue
+      try:
+        row = json.loads(text)
+      except ValueError as error:
+        yield line, None, str(error)
+        continue
+      if not isinstance(row, dict):
+        yield line, None, 'Each line must be a JSON object.'
+      else:
+        yield line, row, None
+
+def form_data(row):
+  # converts a csv or json row to the form data the create pages would post
+  data = MultiDict()
+  for key, value in row.items():
+    if value is None or value is False:
+      # unchecked boxes are simply not posted
+      continue
+    elif value is True:
+      data[key] = 'y'
+    elif isinstance(value, list):
+      data.setlist(key, [str(item) for item in value])
+    elif key in MULTI_VALUE_FIELDS:
+      data.setlist(key, [item.strip() for item in str(value).split(',') if item.strip()])
+    else:
+      data[key] = str(value)
+  return data
+
+def validate_row(form_class, columns, row):
+  # returns (columns, None) for a valid row, or (None, errors)
+  form = form_class(formdata=form_data(row), meta={'csrf': False})
+  valid = form.validate()
+  errors = dict(form.errors)
+  # required fields that weren't posted at all would otherwise fall back to their defaults
+  for name, field in form._fields.items():
+    if field.flags.required and not field.raw_data:
+      errors[name] = ['This field is required.']
+  if not valid or errors:
+    return None, errors
+  try:
+    return columns(form), None
+  except (TypeError, ValueError) as error:
+    return None, {'row': [str(error)]}
+
+
+#  Inserting
+#  ----------------------------------------------------------------
+
+def insert_batch(model, rows, report):
+  # the batch goes in as one executemany, if the database refuses it the rows
+  # are inserted one by one so only the failing ones are reported
+  table = model.__table__
+  try:
+    db.session.execute(table.insert(), [columns for _, columns in rows])
+    db.session.commit()
+    report['inserted'] += len(rows)
+    return
+  except SQLAlchemyError:
+    db.session.rollback()
+
+  for line, columns in rows:
+    try:
+      db.session.execute(table.insert(), columns)
+      db.session.commit()
+      report['inserted'] += 1
+    except SQLAlchemyError as error:
+      db.session.rollback()
+      add_error(report, line, {'database': [str(getattr(error, 'orig', error))]})
+
+def add_error(report, line, errors):
+  report['failed'] += 1
+  if len(report['errors']) < MAX_REPORTED_ERRORS:
+    report['errors'].append({'line': line, 'errors': errors})
+  else:
+    report['errors_omitted'] += 1
+
+def import_rows(kind, stream, data_format, batch_size=BATCH_SIZE):
+  '''
+  imports the venues, artists or shows of a csv or ndjson stream
+  rows are validated with the forms of the create pages and inserted in
+  batches, invalid rows are reported and don't stop the import: the first
+  MAX_REPORTED_ERRORS are listed with their line, errors_omitted counts the others
+  '''
+  form_class, model, columns, check_batch, after_batch = IMPORTERS[kind]
+  report = {'kind': kind, 'inserted': 0, 'failed': 0, 'errors': [], 'errors_omitted': 0}
+  start = time.perf_counter()
+  batch = []
+
+  def flush():
+    rows = batch[:]
+    del batch[:]
+    if check_batch is not None:
+      errors = check_batch(rows)
+      for line in sorted(errors):
+        add_error(report, line, errors[line])
+      rows = [(line, row) for line, row in rows if line not in errors]
+    if rows:
+      insert_batch(model, rows, report)
+      if after_batch is not None:
+        after_batch(rows)
+
+  for line, row, parse_error in read_rows(stream, data_format):
+    if parse_error is not None:
+      add_error(report, line, {'row': [parse_error]})
+      continue
+    row_columns, errors = validate_row(form_class, columns, row)
+    if errors:
+      add_error(report, line, errors)
+      continue
+    batch.append((line, row_columns))
+    if len(batch) >= batch_size:
+      flush()
+  if batch:
+    flush()
+  # the rows of a batch that fail its check are only known once it is flushed,
+  # after the parse errors of the lines read since
+  report['errors'].sort(key=lambda error: error['line'])
+
+  report['seconds'] = round(time.perf_counter() - start, 3)
+  report['rows_per_second'] = round(report['inserted'] / report['seconds']) if report['seconds'] else 0
+  return report
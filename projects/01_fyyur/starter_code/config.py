@@ -1,13 +1,42 @@
 import os
-SECRET_KEY = os.urandom(32)
+# every worker must share the same key for sessions and flash messages,
+# so it should be set in the environment when running several workers
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Enable debug mode with FLASK_DEBUG=1.
+DEBUG = os.environ.get('FLASK_DEBUG') == '1'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 # Connect to the database
 
 
 # TODO: connect to a local postgresql database (done)
-SQLALCHEMY_DATABASE_URI = 'postgresql://reema@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://reema@localhost:5432/fyyur')
+
+# Connection pool of each worker, the workers together may open up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections, keep that under
+# the max_connections of postgres
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+# seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+# seconds after which a connection is replaced, below the server/proxy idle timeout
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# test connections with a cheap round trip before handing them out
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+# milliseconds a single statement may run before postgres cancels it, 0 disables it
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 5000))
+
+# maximum number of rows returned by the venue and artist search pages
+SEARCH_RESULTS_LIMIT = 50
+
+# number of rows per page on the /artists and /shows listings
+PAGE_SIZE = 30
+
+# rendered venue, artist and show pages are cached in each worker, up to this
+# many characters in total; a cached page is rendered again at the latest
+# after FRAGMENT_CACHE_TTL seconds (so other workers see edits and shows move
+# from upcoming to past), edits in the same worker invalidate it right away
+FRAGMENT_CACHE_MAX_SIZE = int(os.environ.get('FRAGMENT_CACHE_MAX_SIZE', 32 * 1024 * 1024))
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 60))
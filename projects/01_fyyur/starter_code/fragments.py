@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Rendered page fragments cache.
+#----------------------------------------------------------------------------#
+
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from flask import current_app, session
+from markupsafe import Markup
+
+
+class FragmentCache:
+  '''
+  FragmentCache
+      rendered HTML fragments kept in memory, keyed by the kind and id of the
+      entity they show (e.g. ('venue', 7)), a variant (e.g. the page cursor of
+      a listing), the generation of the cache and the version of the entity
+
+      invalidate(kind, id) gives the entity a new version, so its fragments
+      are never read again, even one that was being rendered at that time,
+      and the old entries are pushed out by the LRU; clear() does the same
+      for every entity by starting a new generation
+
+      versions are taken from one counter, so a number is never reused, and
+      the version of an entity is dropped ttl seconds after it was set, once
+      every fragment stored under an older one has expired
+
+      the cache is a LRU bounded by the total length of the fragments
+      (max_size characters), and entries also expire after ttl seconds
+  '''
+
+  def __init__(self, max_size, ttl):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    # (kind, id) -> (version, time it was set)
+    self._versions = {}
+    self._next_version = itertools.count(1)
+    self._next_prune = 0
+    self.generation = 0
+    self._lock = threading.Lock()
+
+  def get(self, kind, id, render, variant=None):
+    # returns the cached fragment, or calls render() to get and cache it
+    now = time.monotonic()
+    with self._lock:
+      version, _set_at = self._versions.get((kind, id), (0, 0))
+      key = (kind, id, variant, self.generation, version)
+      entry = self._entries.get(key)
+      if entry is not None and entry[1] > now:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+      self.misses += 1
+
+    # rendered outside the lock, two requests can render the same fragment
+    html = Markup(render())
+    if len(html) <= self.max_size:
+      with self._lock:
+        self._store(key, html, now + self.ttl)
+    return html
+
+  def _store(self, key, html, expires_at):
+    old = self._entries.pop(key, None)
+    if old is not None:
+      self.size -= len(old[0])
+    self._entries[key] = (html, expires_at)
+    self.size += len(html)
+    while self.size > self.max_size:
+      _key, (evicted, _expires_at) = self._entries.popitem(last=False)
+      self.size -= len(evicted)
+
+  def invalidate(self, kind, ids=None):
+    # drops the fragments of the given ids of kind, or of kind itself (e.g. a listing)
+    now = time.monotonic()
+    with self._lock:
+      for id in ids if ids is not None else (None,):
+        self._versions[(kind, id)] = (next(self._next_version), now)
+      if now >= self._next_prune:
+        self._prune_versions(now)
+
+  def _prune_versions(self, now):
+    # an entity whose version is dropped goes back to version 0, the
+    # fragments stored under 0 before its first invalidate() have expired
+    expired = [key for key, (_version, set_at) in self._versions.items() if set_at + self.ttl <= now]
+    for key in expired:
+      del self._versions[key]
+    self._next_prune = now + self.ttl
+
+  def clear(self):
+    # drops every fragment, a render started before stores it under the old generation
+    with self._lock:
+      self._entries.clear()
+      self.generation += 1
+      self.size = 0
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'entries': len(self._entries),
+      'size': self.size,
+      'max_size': self.max_size
+    }
+
+
+def init_fragment_cache(app):
+  # one cache per worker, sized and timed by the FRAGMENT_CACHE_* settings
+  app.extensions['fragments'] = FragmentCache(app.config['FRAGMENT_CACHE_MAX_SIZE'],
+                                              app.config['FRAGMENT_CACHE_TTL'])
+  return app.extensions['fragments']
+
+
+def cached_page(kind, id, render, variant=None):
+  # the page rendered by render(), served from the cache of the app; the
+  # flash messages of the layout are the only part of a page that differs
+  # between requests, so a request with messages waiting renders the page
+  if session.get('_flashes'):
+    return render()
+  return current_app.extensions['fragments'].get(kind, id, render, variant)
+
+
+def invalidate_fragments(kind, ids=None):
+  current_app.extensions['fragments'].invalidate(kind, ids)
+
+
+def clear_fragments():
+  current_app.extensions['fragments'].clear()
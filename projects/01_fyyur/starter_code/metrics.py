@@ -0,0 +1,193 @@
+# generated from projects/shared/metrics.py by projects/shared/sync.py, edit that file instead
+'''
+metrics
+    per-route request metrics for the Flask apps, exposed in the Prometheus
+    text format at /metrics:
+
+        http_requests_total{method,route,status}        counter
+        http_requests_in_flight{method,route}           gauge
+        http_request_duration_seconds{method,route}     histogram
+
+    route is the URL rule (e.g. /venues/<int:venue_id>), not the path, so the
+    number of series stays bounded
+
+    every thread records into its own counters, so the hot path takes no
+    lock; the counters of all threads are only added up when /metrics is
+    read. each worker process has its own counters, so with several workers
+    every worker is a separate scrape target
+'''
+import time
+import threading
+from bisect import bisect_left
+
+from flask import g, request, Response
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Counters:
+  '''
+  Counters
+      the counters of one thread
+      - requests: (method, route, status) -> count
+      - in_flight: (method, route) -> count
+      - latency: (method, route) -> [count per bucket..., count over the last bucket, sum]
+  '''
+  def __init__(self):
+    self.requests = {}
+    self.in_flight = {}
+    self.latency = {}
+
+  def add(self, other):
+    for key, count in dict(other.requests).items():
+      self.requests[key] = self.requests.get(key, 0) + count
+    for key, count in dict(other.in_flight).items():
+      self.in_flight[key] = self.in_flight.get(key, 0) + count
+    for key, observed in dict(other.latency).items():
+      observed = list(observed)
+      if key in self.latency:
+        self.latency[key] = [a + b for a, b in zip(self.latency[key], observed)]
+      else:
+        self.latency[key] = observed
+
+
+class RequestMetrics:
+  def __init__(self, buckets=DEFAULT_BUCKETS):
+    self.buckets = tuple(buckets)
+    self._local = threading.local()
+    self._threads = []
+    # counters of the threads that have exited
+    self._retired = Counters()
+    self._lock = threading.Lock()
+
+  def _counters(self):
+    counters = getattr(self._local, 'counters', None)
+    if counters is None:
+      # taken once per thread, not per request
+      counters = self._local.counters = Counters()
+      with self._lock:
+        self._retire_exited_threads()
+        self._threads.append((threading.current_thread(), counters))
+    return counters
+
+  def _retire_exited_threads(self):
+    # the dev server runs every request in a new thread, the counters of
+    # exited threads are folded into one so they don't pile up
+    running = []
+    for thread, counters in self._threads:
+      if thread.is_alive():
+        running.append((thread, counters))
+      else:
+        self._retired.add(counters)
+    self._threads = running
+
+  def started(self, key):
+    counters = self._counters()
+    counters.in_flight[key] = counters.in_flight.get(key, 0) + 1
+
+  def finished(self, key, status, seconds):
+    counters = self._counters()
+    counters.in_flight[key] -= 1
+    status_key = key + (str(status),)
+    counters.requests[status_key] = counters.requests.get(status_key, 0) + 1
+    observed = counters.latency.get(key)
+    if observed is None:
+      observed = counters.latency[key] = [0] * (len(self.buckets) + 1) + [0.0]
+    observed[bisect_left(self.buckets, seconds)] += 1
+    observed[-1] += seconds
+
+  def totals(self):
+    '''
+    returns the counters of all the threads added up
+    '''
+    total = Counters()
+    with self._lock:
+      self._retire_exited_threads()
+      total.add(self._retired)
+      for _, counters in self._threads:
+        total.add(counters)
+    return total
+
+  def render(self):
+    '''
+    returns the metrics in the Prometheus text exposition format
+    '''
+    total = self.totals()
+    lines = [
+        '# HELP http_requests_total Requests handled, by route and status code.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (method, route, status), count in sorted(total.requests.items()):
+      lines.append('http_requests_total{%s} %d' % (labels(method=method, route=route, status=status), count))
+
+    lines += [
+        '# HELP http_requests_in_flight Requests being handled.',
+        '# TYPE http_requests_in_flight gauge',
+    ]
+    for (method, route), count in sorted(total.in_flight.items()):
+      lines.append('http_requests_in_flight{%s} %d' % (labels(method=method, route=route), count))
+
+    lines += [
+        '# HELP http_request_duration_seconds Time taken to handle requests.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (method, route), observed in sorted(total.latency.items()):
+      cumulative = 0
+      for bound, count in zip(self.buckets + ('+Inf',), observed):
+        cumulative += count
+        le = bound if bound == '+Inf' else '%g' % bound
+        lines.append('http_request_duration_seconds_bucket{%s} %d'
+                     % (labels(method=method, route=route, le=le), cumulative))
+      route_labels = labels(method=method, route=route)
+      lines.append('http_request_duration_seconds_sum{%s} %.6f' % (route_labels, observed[-1]))
+      lines.append('http_request_duration_seconds_count{%s} %d' % (route_labels, cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+def labels(**values):
+  return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                  for name, value in values.items())
+
+
+def route_label():
+  # requests that match no route are counted together
+  if request.url_rule is None:
+    return '<unmatched>'
+  return request.url_rule.rule
+
+
+def init_metrics(app, path='/metrics', buckets=DEFAULT_BUCKETS):
+  '''
+  init_metrics(app)
+      records the metrics of every request of the app and serves them at path
+  '''
+  metrics = RequestMetrics(buckets)
+
+  @app.before_request
+  def start_request_timer():
+    g.metrics_key = (request.method, route_label())
+    g.metrics_start = time.perf_counter()
+    metrics.started(g.metrics_key)
+
+  @app.after_request
+  def record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+  @app.teardown_request
+  def stop_request_timer(error=None):
+    key = g.pop('metrics_key', None)
+    if key is None:
+      return
+    # after_request isn't called when the request failed with an exception
+    status = g.pop('metrics_status', 500)
+    metrics.finished(key, status, time.perf_counter() - g.pop('metrics_start'))
+
+  def export_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+  app.add_url_rule(path, 'metrics', export_metrics)
+  app.extensions['metrics'] = metrics
+  return metrics
@@ -0,0 +1,25 @@
+"""add an index on the sort key of the artists listing
+
+Revision ID: a83d5f0c6e19
+Revises: d41f6b8e2a57
+Create Date: 2026-10-18 19:48:05.731862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83d5f0c6e19'
+down_revision = 'd41f6b8e2a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /artists pages are sorted on (coalesce(name, ''), id), NULL names included
+    op.create_index('ix_Artist_sort_name_id', 'Artist', [sa.text("coalesce(name, '')"), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_sort_name_id', table_name='Artist')
@@ -0,0 +1,37 @@
+"""add upcoming and past show counts to venues and artists
+
+Revision ID: d41f6b8e2a57
+Revises: 9b2e4c1a7f35
+Create Date: 2026-10-18 19:12:40.318224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6b8e2a57'
+down_revision = '9b2e4c1a7f35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    # the counts of the existing shows, `flask refresh-show-counts` keeps them current afterwards
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(f'''
+            UPDATE "{table}" SET
+              upcoming_shows_count = (SELECT count(*) FROM "Show"
+                                      WHERE "Show".{column} = "{table}".id AND "Show".start_at > now()),
+              past_shows_count = (SELECT count(*) FROM "Show"
+                                  WHERE "Show".{column} = "{table}".id AND "Show".start_at <= now())
+        ''')
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
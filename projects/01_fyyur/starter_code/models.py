@@ -2,11 +2,22 @@
 #----------------------------------------------------------------------------#
 # Models section
 #----------------------------------------------------------------------------#
-from app import db
+from datetime import datetime
+import dateutil.parser
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from sqlalchemy.orm import backref
 
+# the app binds to db in create_app()
+db = SQLAlchemy()
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # trigram index used by the case-insensitive name search
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -20,6 +31,9 @@ class Venue(db.Model):
     genres = db.Column(db.ARRAY(db.String(120)))
     seeking_a_talent = db.Column(db.Boolean, default=False)
     seeking_talent_text = db.Column(db.String(500), nullable=True)
+    # kept up to date by the Show events below and refresh_show_counts()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref=backref('venue', uselist=False))
 
     def __repr__(self):
@@ -29,6 +43,11 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    # trigram index used by the case-insensitive name search
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -41,11 +60,19 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_a_venue =  db.Column(db.Boolean, default=False)
     seeking_venue_text = db.Column(db.String(500), nullable=True)
+    # kept up to date by the Show events below and refresh_show_counts()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='artist')
 
     def __repr__(self):
         return f'<Artist ID: {self.id}, Artist name: {self.name}>'
 
+# the /artists listing is sorted on (artist_sort_name, id): name is nullable and
+# NULL never compares greater than a page cursor, so NULL names sort as ''
+artist_sort_name = db.func.coalesce(Artist.name, '')
+db.Index('ix_Artist_sort_name_id', db.func.coalesce(Artist.name, ''), Artist.id)
+
 # TODO: implement any missing fields, as a database migration using Flask-Migrate (done)
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration(done)
@@ -53,9 +80,15 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    # detail pages filter on venue_id / artist_id and sort on start_at,
+    # and the /shows listing sorts on start_at only
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_at', 'venue_id', 'start_at'),
+        db.Index('ix_Show_artist_id_start_at', 'artist_id', 'start_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    start_at = db.Column(db.DateTime, nullable=False)
+    start_at = db.Column(db.DateTime, nullable=False, index=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'))
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'))
 
@@ -63,3 +96,55 @@ class Show(db.Model):
         return f'<Show ID: {self.id}>'
 
 
+
+
+#----------------------------------------------------------------------------#
+# Show counts
+#----------------------------------------------------------------------------#
+# upcoming_shows_count and past_shows_count of venues and artists are changed
+# when a show is inserted or deleted through the ORM; shows inserted or
+# deleted with plain SQL, and shows that became past since, are counted again
+# by refresh_show_counts(), which `flask refresh-show-counts` runs periodically
+
+def show_count_column(show):
+    start_at = show.start_at
+    # the create form posts start_time as a string
+    if isinstance(start_at, str):
+        start_at = dateutil.parser.parse(start_at)
+    return 'upcoming_shows_count' if start_at > datetime.now() else 'past_shows_count'
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+    column = show_count_column(show)
+    for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+        table = model.__table__
+        connection.execute(table.update()
+                                .where(table.c.id == entity_id)
+                                .values({column: table.c[column] + 1}))
+
+@event.listens_for(Show, 'after_delete')
+def uncount_deleted_show(mapper, connection, show):
+    # the show may have been counted as upcoming and be past by now, so the
+    # counts of its venue and artist are counted again instead of decremented
+    refresh_show_counts(venue_ids=[show.venue_id], artist_ids=[show.artist_id], connection=connection)
+
+def refresh_show_counts(venue_ids=None, artist_ids=None, connection=None):
+    '''
+    counts the shows of the given venues and artists again, with one UPDATE per
+    table; None means all of them and an empty list none, the caller commits
+    the UPDATEs run on connection when it is given (e.g. in a flush), on the session otherwise
+    '''
+    if connection is None:
+        connection = db.session
+    now = datetime.now()
+    for model, foreign_key, ids in ((Venue, Show.venue_id, venue_ids), (Artist, Show.artist_id, artist_ids)):
+        if ids is not None and not ids:
+            continue
+        upcoming = db.select([db.func.count(Show.id)]) \
+                     .where(db.and_(foreign_key == model.id, Show.start_at > now)).as_scalar()
+        past = db.select([db.func.count(Show.id)]) \
+                 .where(db.and_(foreign_key == model.id, Show.start_at <= now)).as_scalar()
+        update = model.__table__.update().values(upcoming_shows_count=upcoming, past_shows_count=past)
+        if ids is not None:
+            update = update.where(model.id.in_(list(ids)))
+        connection.execute(update)
@@ -0,0 +1,102 @@
+import os
+import json
+import unittest
+
+from app import create_app
+from models import db, Artist, Venue, Show
+import bulk
+
+# the tests drop and create every table, so they need a database of their own
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', 'postgresql://localhost:5432/fyyur_test')
+
+ARTIST = {
+  'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA', 'genres': 'Rock n Roll',
+  'facebook_link': 'https://www.facebook.com/GunsNPetals', 'website_link': 'https://www.gunsnpetalsband.com',
+}
+
+
+def artists_csv(*names):
+  header = 'name,city,state,genres,facebook_link,website_link\n'
+  return header + ''.join('{},{city},{state},"{genres}",{facebook_link},{website_link}\n'.format(name, **ARTIST)
+                          for name in names)
+
+
+class BulkImportTestCase(unittest.TestCase):
+  """This class represents the bulk import test case"""
+
+  def setUp(self):
+    self.app = create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL, 'TESTING': True})
+    self.client = self.app.test_client()
+    with self.app.app_context():
+      db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+      db.session.commit()
+      db.drop_all()
+      db.create_all()
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+
+  def count(self, model):
+    with self.app.app_context():
+      return model.query.count()
+
+  def test_import_csv(self):
+    """ Test a csv body is imported and its invalid rows reported by line """
+    body = artists_csv('Guns N Petals', 'The Wild Sax Band') + ',San Francisco,CA,Jazz,,\n'
+    response = self.client.post('/artists/import', data=body, content_type='text/csv')
+    report = response.get_json()
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual((report['inserted'], report['failed']), (2, 1))
+    self.assertEqual(report['errors'][0]['line'], 4)
+    self.assertIn('name', report['errors'][0]['errors'])
+    self.assertEqual(self.count(Artist), 2)
+
+  def test_import_shows_ndjson(self):
+    """ Test shows pointing at missing artists or venues are reported, the others imported """
+    self.client.post('/artists/import', data=artists_csv('Guns N Petals'), content_type='text/csv')
+    with self.app.app_context():
+      venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street')
+      db.session.add(venue)
+      db.session.commit()
+      venue_id = venue.id
+      artist_id = Artist.query.one().id
+    lines = [
+      {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:00:00'},
+      {'artist_id': artist_id + 1, 'venue_id': venue_id, 'start_time': '2035-04-08 20:00:00'},
+      'not json',
+    ]
+    body = '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    report = self.client.post('/shows/import', data=body, content_type='application/x-ndjson').get_json()
+
+    self.assertEqual((report['inserted'], report['failed']), (1, 2))
+    self.assertEqual([error['line'] for error in report['errors']], [2, 3])
+    self.assertEqual(self.count(Show), 1)
+    with self.app.app_context():
+      self.assertEqual(Venue.query.get(venue_id).upcoming_shows_count, 1)
+
+  def test_reported_errors_are_capped(self):
+    """ Test only the first MAX_REPORTED_ERRORS errors are listed, the others counted """
+    body = '\n'.join(['[]'] * (bulk.MAX_REPORTED_ERRORS + 5) + [json.dumps(ARTIST)])
+    report = self.client.post('/artists/import', data=body).get_json()
+
+    self.assertEqual((report['inserted'], report['failed']), (1, bulk.MAX_REPORTED_ERRORS + 5))
+    self.assertEqual(len(report['errors']), bulk.MAX_REPORTED_ERRORS)
+    self.assertEqual(report['errors_omitted'], 5)
+
+  def test_import_data_command(self):
+    """ Test the import-data command imports a csv file """
+    runner = self.app.test_cli_runner()
+    with runner.isolated_filesystem():
+      with open('artists.csv', 'w') as file:
+        file.write(artists_csv('Guns N Petals', 'The Wild Sax Band'))
+      result = runner.invoke(args=['import-data', 'artists', 'artists.csv'])
+
+    self.assertEqual(result.exit_code, 0)
+    self.assertIn('2 artists inserted, 0 failed', result.output)
+    self.assertEqual(self.count(Artist), 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,116 @@
+import time
+import unittest
+
+from fragments import FragmentCache
+
+
+class Renderer:
+  # a render() function counting its calls, with an optional side effect while it runs
+  def __init__(self, html, during=None):
+    self.html = html
+    self.during = during
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    if self.during is not None:
+      self.during()
+    return self.html
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+  """This class represents the rendered fragments cache test case"""
+
+  def setUp(self):
+    self.cache = FragmentCache(max_size=1024, ttl=60)
+
+  def test_hit(self):
+    """ Test a fragment is rendered once, then read from the cache """
+    render = Renderer('<p>venue 1</p>')
+
+    self.assertEqual(self.cache.get('venue', 1, render), '<p>venue 1</p>')
+    self.assertEqual(self.cache.get('venue', 1, render), '<p>venue 1</p>')
+    self.assertEqual(render.calls, 1)
+    self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+  def test_variants(self):
+    """ Test the variants of a fragment are cached apart """
+    first, second = Renderer('<p>page 1</p>'), Renderer('<p>page 2</p>')
+
+    self.assertEqual(self.cache.get('venues', None, first, variant=1), '<p>page 1</p>')
+    self.assertEqual(self.cache.get('venues', None, second, variant=2), '<p>page 2</p>')
+    self.assertEqual((first.calls, second.calls), (1, 1))
+
+  def test_invalidate(self):
+    """ Test invalidate drops the fragments of the given ids only """
+    venue_1, venue_2, listing = Renderer('<p>1</p>'), Renderer('<p>2</p>'), Renderer('<ul></ul>')
+    for render in (venue_1, venue_2):
+      self.cache.get('venue', render.html[3], render)
+    self.cache.get('venues', None, listing)
+
+    self.cache.invalidate('venue', ['1'])
+    self.cache.invalidate('venues')
+    self.cache.get('venue', '1', venue_1)
+    self.cache.get('venue', '2', venue_2)
+    self.cache.get('venues', None, listing)
+    self.assertEqual((venue_1.calls, venue_2.calls, listing.calls), (2, 1, 2))
+
+  def test_invalidate_while_rendering(self):
+    """ Test a fragment invalidated while it is rendered is not read again """
+    stale = Renderer('<p>old</p>', during=lambda: self.cache.invalidate('venue', [1]))
+    fresh = Renderer('<p>new</p>')
+
+    self.assertEqual(self.cache.get('venue', 1, stale), '<p>old</p>')
+    self.assertEqual(self.cache.get('venue', 1, fresh), '<p>new</p>')
+
+  def test_clear(self):
+    """ Test clear drops every fragment """
+    render = Renderer('<p>venue 1</p>')
+    self.cache.get('venue', 1, render)
+
+    self.cache.clear()
+    self.assertEqual(self.cache.stats()['entries'], 0)
+    self.assertEqual(self.cache.size, 0)
+    self.cache.get('venue', 1, render)
+    self.assertEqual(render.calls, 2)
+
+  def test_clear_while_rendering(self):
+    """ Test a fragment rendered across clear and invalidate is not read again """
+    def clear_and_invalidate():
+      self.cache.clear()
+      self.cache.invalidate('venue', [1])
+    self.cache.invalidate('venue', [1])
+    stale = Renderer('<p>old</p>', during=clear_and_invalidate)
+    fresh = Renderer('<p>new</p>')
+
+    self.assertEqual(self.cache.get('venue', 1, stale), '<p>old</p>')
+    self.assertEqual(self.cache.get('venue', 1, fresh), '<p>new</p>')
+
+  def test_versions_are_pruned(self):
+    """ Test the versions of entities are dropped once their old fragments expired """
+    cache = FragmentCache(max_size=1024, ttl=0.1)
+    cache.invalidate('venue', range(100))
+    self.assertEqual(len(cache._versions), 100)
+
+    time.sleep(0.15)
+    cache.invalidate('venue', [100])
+    self.assertEqual(list(cache._versions), [('venue', 100)])
+    render = Renderer('<p>venue 1</p>')
+    cache.get('venue', 1, render)
+    cache.get('venue', 1, render)
+    self.assertEqual(render.calls, 1)
+
+  def test_max_size(self):
+    """ Test the least recently used fragments are evicted past max_size """
+    cache = FragmentCache(max_size=10, ttl=60)
+    first, second = Renderer('x' * 6), Renderer('y' * 6)
+    cache.get('venue', 1, first)
+    cache.get('venue', 2, second)
+    cache.get('venue', 1, first)
+
+    self.assertEqual(first.calls, 2)
+    self.assertLessEqual(cache.size, 10)
+
+
+if __name__ == "__main__":
+  unittest.main()
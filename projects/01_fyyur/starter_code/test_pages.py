@@ -0,0 +1,117 @@
+import os
+import re
+import base64
+import unittest
+from html import unescape
+from datetime import datetime, timedelta
+
+from app import create_app, encode_cursor
+from models import db, Artist, Venue, Show
+from sqlstats import QueryBudgetExceeded
+
+# the tests drop and create every table, so they need a database of their own
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', 'postgresql://localhost:5432/fyyur_test')
+
+
+class PagesTestCase(unittest.TestCase):
+  """This class represents the listing pages test case"""
+
+  def setUp(self):
+    # a route running more queries than its @query_budget raises QueryBudgetExceeded
+    self.app = create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL, 'TESTING': True,
+                           'SQLSTATS_STRICT': True, 'PAGE_SIZE': 2})
+    self.client = self.app.test_client()
+    with self.app.app_context():
+      db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+      db.session.commit()
+      db.drop_all()
+      db.create_all()
+
+  def tearDown(self):
+    with self.app.app_context():
+      db.session.remove()
+
+  def add_shows(self, count):
+    # a venue and an artist per show, half of the shows in the past
+    with self.app.app_context():
+      now = datetime.now()
+      for i in range(count):
+        venue = Venue(name='Venue {}'.format(i), city='San Francisco', state='CA', address='{} Folsom Street'.format(i))
+        artist = Artist(name='Artist {}'.format(i), city='San Francisco', state='CA')
+        start_at = now + timedelta(days=i + 1) * (1 if i % 2 else -1)
+        db.session.add(Show(venue=venue, artist=artist, start_at=start_at))
+      db.session.commit()
+
+  def follow_pages(self, path, pattern):
+    # the ids matched by pattern on every page of a listing, following its next page links
+    ids = []
+    while path is not None:
+      response = self.client.get(path)
+      self.assertEqual(response.status_code, 200)
+      html = response.get_data(as_text=True)
+      ids += [int(id) for id in re.findall(pattern, html)]
+      next_page = re.search(r'href="([^"]*\?after=[^"]*)"', html)
+      path = unescape(next_page.group(1)) if next_page else None
+    return ids
+
+  def test_artists_pages(self):
+    """ Test the artists pages list every artist once, the ones without a name first """
+    with self.app.app_context():
+      # three artists without a name, so a page ends between them
+      for name in (None, 'The Wild Sax Band', None, 'Guns N Petals', None, 'Matt Quevedo'):
+        db.session.add(Artist(name=name))
+      db.session.commit()
+      expected = [artist.id for artist in Artist.query.order_by(db.func.coalesce(Artist.name, ''), Artist.id)]
+
+    self.assertEqual(self.follow_pages('/artists', r'href="/artists/(\d+)"'), expected)
+
+  def test_shows_pages(self):
+    """ Test the shows pages list every show once, by start time """
+    self.add_shows(5)
+    with self.app.app_context():
+      expected = [show.venue_id for show in Show.query.order_by(Show.start_at, Show.id)]
+
+    self.assertEqual(self.follow_pages('/shows', r'href="/venues/(\d+)"'), expected)
+
+  def test_tampered_cursor(self):
+    """ Test a cursor that wasn't made by the listing is a bad request """
+    self.add_shows(1)
+    not_json = base64.urlsafe_b64encode(b'not json').decode()
+    for path in ('/artists?after=not-base64', '/artists?after=' + not_json,
+                 '/artists?after=' + encode_cursor('Guns N Petals'),
+                 '/artists?after=' + encode_cursor(['Guns N Petals'], 'one'),
+                 '/shows?after=' + encode_cursor('not a date', 1),
+                 '/shows?after=' + base64.urlsafe_b64encode(b'5').decode()):
+      self.assertEqual(self.client.get(path).status_code, 400, path)
+
+  def test_venues_query_budget(self):
+    """ Test the venues page runs one query, and none once it is cached """
+    self.add_shows(4)
+    response = self.client.get('/venues')
+    cached = self.client.get('/venues')
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.headers['X-DB-Query-Budget'], '1')
+    self.assertEqual(response.headers['X-DB-Query-Count'], '1')
+    self.assertEqual(cached.headers['X-DB-Query-Count'], '0')
+
+  def test_shows_query_budget(self):
+    """ Test every page of the shows runs one query, the artists and venues joined in """
+    self.add_shows(5)
+    response = self.client.get('/shows')
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.headers['X-DB-Query-Count'], '1')
+    self.assertIn(b'?after=', response.data)
+
+  def test_query_budget_exceeded(self):
+    """ Test a route going over its budget fails the test """
+    self.add_shows(1)
+    # the view functions are made by create_app(), this one is of this test only
+    self.app.view_functions['venues'].query_budget = 0
+    with self.assertRaises(QueryBudgetExceeded):
+      self.client.get('/venues')
+
+
+if __name__ == "__main__":
+  unittest.main()
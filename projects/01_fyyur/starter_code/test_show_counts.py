@@ -0,0 +1,103 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from models import db, Artist, Venue, Show, refresh_show_counts
+
+# the tests drop and create every table, so they need a database of their own
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', 'postgresql://localhost:5432/fyyur_test')
+
+
+class ShowCountsTestCase(unittest.TestCase):
+  """This class represents the show counts of venues and artists test case"""
+
+  def setUp(self):
+    self.app = create_app({'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL, 'TESTING': True})
+    self.client = self.app.test_client()
+    self.context = self.app.app_context()
+    self.context.push()
+    db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.session.commit()
+    db.drop_all()
+    db.create_all()
+
+  def tearDown(self):
+    db.session.remove()
+    self.context.pop()
+
+  def add(self, *objects):
+    db.session.add_all(objects)
+    db.session.commit()
+    return objects[0]
+
+  def venue(self, name='The Musical Hop'):
+    return self.add(Venue(name=name, city='San Francisco', state='CA', address='1015 Folsom Street'))
+
+  def artist(self, name='Guns N Petals'):
+    return self.add(Artist(name=name, city='San Francisco', state='CA'))
+
+  def counts(self, model, id):
+    # (upcoming, past) as stored on the row
+    db.session.expire_all()
+    entity = model.query.get(id)
+    return entity.upcoming_shows_count, entity.past_shows_count
+
+  def test_inserted_shows_are_counted(self):
+    """ Test a show added through the ORM is counted as upcoming or past on its venue and artist """
+    venue, artist = self.venue(), self.artist()
+    self.add(Show(venue=venue, artist=artist, start_at=datetime.now() + timedelta(days=7)),
+             Show(venue=venue, artist=artist, start_at=datetime.now() - timedelta(days=7)))
+
+    self.assertEqual(self.counts(Venue, venue.id), (1, 1))
+    self.assertEqual(self.counts(Artist, artist.id), (1, 1))
+
+  def test_deleted_show_that_became_past(self):
+    """ Test deleting a show counted as upcoming that started since doesn't make a count negative """
+    venue, artist = self.venue(), self.artist()
+    show = self.add(Show(venue=venue, artist=artist, start_at=datetime.now() + timedelta(days=7)))
+    # the show started, the periodic refresh didn't run yet
+    db.session.execute(Show.__table__.update().values(start_at=datetime.now() - timedelta(hours=1)))
+    db.session.commit()
+    db.session.expire_all()
+
+    db.session.delete(Show.query.get(show.id))
+    db.session.commit()
+    self.assertEqual(self.counts(Venue, venue.id), (0, 0))
+    self.assertEqual(self.counts(Artist, artist.id), (0, 0))
+
+  def test_refresh_show_counts(self):
+    """ Test refresh_show_counts counts the given ids again, or every row for None """
+    first, second, artist = self.venue('The Musical Hop'), self.venue('Park Square Live'), self.artist()
+    db.session.execute(Show.__table__.insert(), [
+      {'venue_id': first.id, 'artist_id': artist.id, 'start_at': datetime.now() + timedelta(days=1)},
+      {'venue_id': second.id, 'artist_id': artist.id, 'start_at': datetime.now() - timedelta(days=1)},
+    ])
+    db.session.commit()
+
+    refresh_show_counts(venue_ids=[first.id], artist_ids=[])
+    db.session.commit()
+    self.assertEqual(self.counts(Venue, first.id), (1, 0))
+    self.assertEqual(self.counts(Venue, second.id), (0, 0))
+    self.assertEqual(self.counts(Artist, artist.id), (0, 0))
+
+    refresh_show_counts()
+    db.session.commit()
+    self.assertEqual(self.counts(Venue, second.id), (0, 1))
+    self.assertEqual(self.counts(Artist, artist.id), (1, 1))
+
+  def test_delete_venue_recounts_its_artists(self):
+    """ Test deleting a venue counts the artists of its deleted shows again """
+    venue, other_venue, artist = self.venue('The Musical Hop'), self.venue('Park Square Live'), self.artist()
+    self.add(Show(venue=venue, artist=artist, start_at=datetime.now() + timedelta(days=1)),
+             Show(venue=other_venue, artist=artist, start_at=datetime.now() - timedelta(days=1)))
+    venue_id, artist_id = venue.id, artist.id
+
+    response = self.client.delete('/venues/{}'.format(venue_id))
+    self.assertEqual(response.status_code, 302)
+    self.assertIsNone(Venue.query.get(venue_id))
+    self.assertEqual(self.counts(Artist, artist_id), (0, 1))
+
+
+if __name__ == "__main__":
+  unittest.main()
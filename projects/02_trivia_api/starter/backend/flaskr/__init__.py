@@ -1,27 +1,103 @@
 import os
+import json
+import click
+import hashlib
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import event
 import random
 
-from models import setup_db, Question, Category, db
+from models import setup_db, Question, Category, db, count_questions, question_ids, clear_question_caches, on_commit
+from .cache import TTLCache
+from .bank import import_questions, export_questions
+from .sqlstats import init_query_stats
+from .metrics import init_metrics
+from .streaming import wants_ndjson, ndjson_response
+from .jsonprovider import init_json, RowEncoder, jsonify_encoded
 
 QUESTIONS_PER_PAGE = 10
+QUIZ_RANDOM_DRAWS = 5
+CATEGORIES_CACHE_TTL = 300
+# the fields of Question.format(), the endpoints read them as rows
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+# encodes the rows of question_rows() as the JSON of Question.format()
+question_encoder = RowEncoder(QUESTION_FIELDS)
+
+categories_cache = TTLCache(ttl=CATEGORIES_CACHE_TTL)
+
+def load_categories():
+  # loads the categories from the DB together with an ETag of their content
+  categories = Category.query.all()
+  if len(categories) != 0:
+    categories = {category.id: category.type for category in categories}
+    etag = hashlib.sha1(json.dumps(categories, sort_keys=True).encode()).hexdigest()
+    return {'categories': categories, 'etag': etag}
+  else:
+    return {'categories': None, 'etag': None}
 
 def get_all_categories(): 
   # This function is to get all categories 
   # it was created for get_categories() and get_questions()
   # to avoid redundant code
-  categories = Category.query.all()
-  if len(categories) != 0:
-    return {category.id: category.type for category in categories}
+  # categories rarely change, so they are served from categories_cache
+  return categories_cache.get('categories', load_categories)['categories']
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def invalidate_categories_cache(mapper, connection, target):
+  # once the change is committed, see on_commit()
+  on_commit(target, categories_cache.invalidate)
+
+def question_rows():
+  # a query of the QUESTION_FIELDS columns, so no Question object is built per row
+  return db.session.query(*[getattr(Question, field) for field in QUESTION_FIELDS])
+
+def pick_random_question_id(category, previous_questions):
+  # This function picks a random question id that is not in previous_questions
+  # it draws from the cached id list of the category, so no question is loaded
+  # from the DB until one is picked
+  ids = question_ids(category)
+  previous_questions = set(previous_questions)
+  # a few random draws are enough unless most of the category was already played
+  for _ in range(QUIZ_RANDOM_DRAWS):
+    if not ids:
+      break
+    question_id = random.choice(ids)
+    if question_id not in previous_questions:
+      return question_id
+  # otherwise pick from the remaining ids, None when the category is exhausted
+  remaining = [question_id for question_id in ids if question_id not in previous_questions]
+  if remaining:
+    return random.choice(remaining)
   else:
     return None
 
+def pick_random_question(category, previous_questions):
+  # This function returns the row (see question_rows()) of the question
+  # picked by pick_random_question_id
+  # the cached id list can still hold a question deleted by another process,
+  # then the list is reloaded from the DB and the question is drawn again
+  for reload in (False, True):
+    if reload:
+      clear_question_caches()
+    question_id = pick_random_question_id(category, previous_questions)
+    if question_id is None:
+      return None
+    question = question_rows().filter(Question.id == question_id).first()
+    if question is not None:
+      return question
+  return None
+
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
   setup_db(app)
+  init_query_stats(app)
+  init_metrics(app)
+  init_json(app)
   
   # set up CORS, allowing all origins
   cors = CORS(app, resources={'/': {'origins': '*'}})
@@ -37,27 +113,38 @@ def create_app(test_config=None):
   @app.route('/categories')
   # this endpoint to get all categories in the DB
   def get_categories():
-    categories = get_all_categories()
+    cached = categories_cache.get('categories', load_categories)
+    categories = cached['categories']
 
-    if len(categories) == 0:
+    if not categories:
             abort(404)
     else:
-      return jsonify({
+      # clients sending the ETag back in If-None-Match get a 304 with no body
+      response = jsonify({
         'success': True,
         'categories': categories
         })
+      response.set_etag(cached['etag'])
+      return response.make_conditional(request)
 
 
   def questions_pagination(request):
     # this fucntion is for question pagination 
-    # 10 questions per page
+    # 10 questions per page, only the rows of the requested page are loaded.
+    # ?after_id=<id> returns the page that starts after the given question id,
+    # otherwise ?page=<n> is used as an offset
+    # the rows are read with question_rows(), not as Question objects
     page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE 
-    end = start + QUESTIONS_PER_PAGE 
-    questions = Question.query.all()
-    questions_for_current_page = questions[start:end]
+    after_id = request.args.get('after_id', type=int)
+    query = question_rows().order_by(Question.id)
+    if after_id is not None:
+      query = query.filter(Question.id > after_id)
+    elif page < 1:
+      return []
+    else:
+      query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
 
-    return questions_for_current_page
+    return query.limit(QUESTIONS_PER_PAGE).all()
 
   @app.route('/questions')
   # this endpoint is to get questions and it uses
@@ -68,15 +155,13 @@ def create_app(test_config=None):
     if len(questions_for_current_page) == 0 or not categories:
             abort(404)
     else:
-      questions_for_current_page = [question.format() for question in questions_for_current_page]
-      total_questions = db.session.query(Question).count() 
-      categories = get_all_categories()
-      return jsonify({
+      total_questions = count_questions()
+      # the rows are encoded to JSON as they are, without a dict per question
+      return jsonify_encoded({
             'success': True,
-            'questions': questions_for_current_page,
             'total_questions': total_questions,
             'categories': categories,
-        })
+        }, questions=question_encoder.encode_list(questions_for_current_page))
 
 
   @app.route("/questions/<int:question_id>", methods=['DELETE'])
@@ -124,17 +209,22 @@ def create_app(test_config=None):
   def search_for_a_question():
     if request.get_json()['searchTerm']:
       search_term = request.get_json()['searchTerm']
-      result = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+      query = question_rows().filter(Question.question.ilike(f'%{search_term}%'))
+      if wants_ndjson():
+        # one question per line, streamed from the DB
+        response = ndjson_response(query.order_by(Question.id), question_encoder)
+        if response is None:
+          abort(404)
+        return response
+      result = query.all()
       # here i checked if there is a result 
       if len(result) != 0:
-        formatted_result = [question.format() for question in result]
-        total_questions = len(formatted_result)
+        total_questions = len(result)
 
-        return jsonify({
+        return jsonify_encoded({
           'success': True,
-          'questions': formatted_result,
           'total_questions': total_questions,
-              })
+              }, questions=question_encoder.encode_list(result))
       else:
         abort(404)
 
@@ -142,18 +232,23 @@ def create_app(test_config=None):
   @app.route("/categories/<int:category_id>/questions")
   # this endpoint is to get questions per category
   def get_questions_for_a_category(category_id):
-    questions = Question.query.filter_by(category=str(category_id)).all()
+    query = question_rows().filter(Question.category == str(category_id))
+    if wants_ndjson():
+      # one question per line, streamed from the DB
+      response = ndjson_response(query.order_by(Question.id), question_encoder)
+      if response is None:
+        abort(404)
+      return response
+    questions = query.all()
     # if the questions not empty
     if len(questions) != 0:
-      formatted_questions = [question.format() for question in questions]
-      total_questions = len(formatted_questions)
+      total_questions = len(questions)
 
-      return jsonify({
+      return jsonify_encoded({
           'success': True,
-          'questions': formatted_questions,
           'total_questions': total_questions,
           'current_category': category_id
-      })
+      }, questions=question_encoder.encode_list(questions))
     else:
       abort(404)
     
@@ -167,26 +262,56 @@ def create_app(test_config=None):
     if request.get_json()['quiz_category'] is not None and request.get_json()['previous_questions'] is not None:
       quiz_category = request.get_json()['quiz_category']
       previous_questions = request.get_json()['previous_questions']
-      # check the id of category
-      if quiz_category['id'] != 0:
-        # here i filter the quetions to be in the given category and i use notin_() to exclude the previous_questions
-        questions = Question.query.filter(Question.category==quiz_category['id'],  Question.id.notin_((previous_questions))).all()
+      # check the id of category, 0 means all categories
+      if str(quiz_category['id']) != '0':
+        category = str(quiz_category['id'])
       else:
-        # if no category was given then, i excluded only the previous_questions
-        questions = Question.query.filter(Question.id.notin_((previous_questions))).all()
-      if len(questions) != 0:
-        # here i use random.randint() to get a random index
-        random_question = questions[random.randint(0, len(questions)-1)]
-        return jsonify({
+        category = None
+      random_question = pick_random_question(category, previous_questions)
+      if random_question is not None:
+        return jsonify_encoded({
           'success': True,
-          'question': random_question.format()
-        })
+        }, question=question_encoder.encode(random_question))
       else:
         abort(404)
 
     else:
       abort(404)
 
+  @app.cli.command('import-questions')
+  @click.argument('file', type=click.File('r', encoding='utf-8'))
+  @click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']),
+                help='Defaults to csv for .csv files and ndjson otherwise.')
+  def import_questions_command(file, data_format):
+    """Import a question bank from a NDJSON or CSV file.
+
+    Running servers keep their cached question count and quiz question ids,
+    so they see the new questions after QUESTION_CACHE_TTL seconds.
+    """
+    if data_format is None:
+      data_format = 'csv' if file.name.endswith('.csv') else 'ndjson'
+    report = import_questions(file, data_format)
+    for error in report['errors']:
+      click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if report['errors_omitted']:
+      click.echo(f"... and {report['errors_omitted']} more failed rows", err=True)
+    click.echo(f"{report['inserted']} questions inserted, {report['duplicates']} duplicates skipped, "
+               f"{report['failed']} failed in {report['seconds']}s ({report['rows_per_second']} rows/s)")
+
+
+  @app.cli.command('export-questions')
+  @click.argument('file', type=click.File('w', encoding='utf-8'))
+  @click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']),
+                help='Defaults to csv for .csv files and ndjson otherwise.')
+  def export_questions_command(file, data_format):
+    """Export the question bank to a NDJSON or CSV file."""
+    if data_format is None:
+      data_format = 'csv' if file.name.endswith('.csv') else 'ndjson'
+    report = export_questions(file, data_format)
+    click.echo(f"{report['exported']} questions exported in {report['seconds']}s "
+               f"({report['rows_per_second']} rows/s)")
+
+
   ## errorhandler for 404
   @app.errorhandler(404)
   def not_found(error):
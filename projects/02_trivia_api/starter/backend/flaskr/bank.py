@@ -0,0 +1,198 @@
+import csv
+import json
+import time
+import hashlib
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Question, Category, db, clear_question_caches
+
+# number of questions inserted with one executemany
+BATCH_SIZE = 5000
+# number of texts looked up per IN query, SQLite before 3.32 allows 999 bind parameters
+LOOKUP_SIZE = 500
+# the import report lists the errors of the first failed rows, and counts the others
+MAX_REPORTED_ERRORS = 100
+FIELDS = ('question', 'answer', 'category', 'difficulty')
+
+
+'''
+Question bank import / export
+    question banks are streamed as NDJSON (one question object per line) or
+    CSV (with a question,answer,category,difficulty header), category is the
+    category name, e.g. "Science"
+'''
+
+def text_key(text):
+  # questions are deduplicated on their text, only a digest of it is kept in memory
+  return hashlib.sha1(text.strip().encode()).digest()
+
+
+def read_rows(stream, data_format):
+  # yields (line number, row dict, parse error) for every row of the stream
+  if data_format == 'csv':
+    for line, row in enumerate(csv.DictReader(stream), start=2):
+      yield line, row, None
+  else:
+    for line, text in enumerate(stream, start=1):
+      if not text.strip():
+        continue
+      try:
+        row = json.loads(text)
+      except ValueError as error:
+        yield line, None, str(error)
+        continue
+      if isinstance(row, dict):
+        yield line, row, None
+      else:
+        yield line, None, 'each line must be a JSON object'
+
+
+class CategoryMap:
+  # maps category names (or ids) to ids, unknown names are created
+  def __init__(self):
+    self.ids = {}
+    for category in Category.query.all():
+      self.ids[category.type.lower()] = category.id
+    self.known_ids = set(self.ids.values())
+
+  def get_id(self, name):
+    name = str(name).strip()
+    if name.isdigit() and int(name) in self.known_ids:
+      return int(name)
+    if name.lower() not in self.ids:
+      category = Category(type=name)
+      db.session.add(category)
+      db.session.flush()
+      self.ids[name.lower()] = category.id
+      self.known_ids.add(category.id)
+    return self.ids[name.lower()]
+
+
+def validate_row(row, categories):
+  # returns the columns of a valid row, or raises ValueError with the reason
+  values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+  missing = [field for field in FIELDS if not values[field]]
+  if missing:
+    raise ValueError('missing ' + ', '.join(missing))
+  difficulty = int(values['difficulty'])
+  if not 1 <= difficulty <= 5:
+    raise ValueError('difficulty must be between 1 and 5')
+  return {
+    'question': values['question'],
+    'answer': values['answer'],
+    'category': str(categories.get_id(values['category'])),
+    'difficulty': difficulty
+  }
+
+
+def existing_keys(texts):
+  # the keys of the texts already in the DB, looked up LOOKUP_SIZE texts per IN query
+  keys = set()
+  for start in range(0, len(texts), LOOKUP_SIZE):
+    chunk = texts[start:start + LOOKUP_SIZE]
+    keys.update(text_key(text) for (text,) in
+                db.session.query(Question.question).filter(Question.question.in_(chunk)))
+  return keys
+
+
+def insert_batch(batch, report):
+  # drops the questions already in the DB, then inserts the rest with one executemany
+  existing = existing_keys([columns['question'] for columns in batch])
+  rows = []
+  for columns in batch:
+    key = text_key(columns['question'])
+    if key in existing:
+      report['duplicates'] += 1
+    else:
+      rows.append(columns)
+  if rows:
+    db.session.execute(Question.__table__.insert(), rows)
+  db.session.commit()
+  report['inserted'] += len(rows)
+
+
+def add_error(report, line, error):
+  report['failed'] += 1
+  if len(report['errors']) < MAX_REPORTED_ERRORS:
+    report['errors'].append({'line': line, 'error': error})
+  else:
+    report['errors_omitted'] += 1
+
+
+def import_questions(stream, data_format='ndjson', batch_size=BATCH_SIZE):
+  '''
+  imports a NDJSON or CSV question bank in batches
+  questions whose text is already in the DB or earlier in the stream are
+  skipped, invalid rows are skipped too: the first MAX_REPORTED_ERRORS are
+  listed with their line number, errors_omitted counts the others
+  '''
+  report = {'inserted': 0, 'duplicates': 0, 'failed': 0, 'errors': [], 'errors_omitted': 0}
+  start = time.perf_counter()
+  categories = CategoryMap()
+  seen = set()
+  batch = []
+  try:
+    for line, row, parse_error in read_rows(stream, data_format):
+      try:
+        if parse_error is not None:
+          raise ValueError(parse_error)
+        columns = validate_row(row, categories)
+      except ValueError as error:
+        add_error(report, line, str(error))
+        continue
+      key = text_key(columns['question'])
+      if key in seen:
+        report['duplicates'] += 1
+        continue
+      seen.add(key)
+      batch.append(columns)
+      if len(batch) >= batch_size:
+        insert_batch(batch, report)
+        batch = []
+    if batch:
+      insert_batch(batch, report)
+  except SQLAlchemyError:
+    db.session.rollback()
+    raise
+  finally:
+    # the rows were inserted without the ORM, so the cached count and ids of
+    # this process are stale, other processes reload theirs after QUESTION_CACHE_TTL
+    clear_question_caches()
+
+  report['seconds'] = round(time.perf_counter() - start, 3)
+  report['rows_per_second'] = round(report['inserted'] / report['seconds']) if report['seconds'] else 0
+  return report
+
+
+def export_questions(stream, data_format='ndjson', batch_size=BATCH_SIZE):
+  '''
+  writes every question to the stream as NDJSON or CSV, with category names
+  rows are read from the DB batch_size at a time instead of all at once
+  '''
+  start = time.perf_counter()
+  names = {category.id: category.type for category in Category.query.all()}
+  query = db.session.query(Question.question, Question.answer, Question.category, Question.difficulty) \
+                    .order_by(Question.id) \
+                    .yield_per(batch_size)
+  writer = None
+  if data_format == 'csv':
+    writer = csv.DictWriter(stream, fieldnames=FIELDS)
+    writer.writeheader()
+
+  exported = 0
+  for question, answer, category, difficulty in query:
+    if category is not None and category.isdigit():
+      category = names.get(int(category), category)
+    row = {'question': question, 'answer': answer, 'category': category, 'difficulty': difficulty}
+    if writer is not None:
+      writer.writerow(row)
+    else:
+      stream.write(json.dumps(row) + '\n')
+    exported += 1
+
+  seconds = round(time.perf_counter() - start, 3)
+  return {
+    'exported': exported,
+    'seconds': seconds,
+    'rows_per_second': round(exported / seconds) if seconds else 0
+  }
@@ -0,0 +1,43 @@
+import time
+
+
+class TTLCache:
+  '''
+  TTLCache
+      a small in-process cache where every value expires ttl seconds after
+      it was loaded, values can also be dropped early with invalidate()
+      hits and misses are counted so the hit rate can be checked
+  '''
+
+  def __init__(self, ttl):
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self._values = {}
+
+  def get(self, key, load):
+    # returns the cached value of key, or calls load() to get and cache it
+    entry = self._values.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[1] > now:
+      self.hits += 1
+      return entry[0]
+
+    self.misses += 1
+    value = load()
+    self._values[key] = (value, now + self.ttl)
+    return value
+
+  def invalidate(self, key=None):
+    # drops one key, or every key when no key is given
+    if key is None:
+      self._values.clear()
+    else:
+      self._values.pop(key, None)
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'size': len(self._values)
+    }
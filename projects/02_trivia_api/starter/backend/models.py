@@ -1,10 +1,18 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import time
+from sqlalchemy import Column, String, Integer, create_engine, event
+from sqlalchemy.orm import Session, object_session
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_name = "trivia"
-database_path = "postgres://{}/{}".format('localhost:5432', database_name)
+# DATABASE_URL points the app at another database, e.g. the benchmark one
+database_path = os.environ.get('DATABASE_URL', "postgres://{}/{}".format('localhost:5432', database_name))
+
+# seconds the cached question count and id lists are kept: writes made by
+# other processes (other workers, the import-questions command, raw SQL)
+# don't reset them, so this is how long they can go unseen
+QUESTION_CACHE_TTL = float(os.environ.get('QUESTION_CACHE_TTL', 30))
 
 db = SQLAlchemy()
 
@@ -75,4 +83,82 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+on_commit(target, callback)
+    calls callback() once the transaction of the session of target commits
+    the mapper events (after_insert, ...) fire when the session flushes, when
+    the changes are not committed, so a cache reset there could be reloaded
+    with uncommitted rows, or reset for changes that are rolled back
+'''
+def on_commit(target, callback):
+  session = object_session(target)
+  if session is None:
+    callback()
+  else:
+    session.info.setdefault('on_commit', set()).add(callback)
+
+@event.listens_for(Session, 'after_commit')
+def run_commit_callbacks(session):
+  for callback in session.info.pop('on_commit', ()):
+    callback()
+
+@event.listens_for(Session, 'after_rollback')
+def drop_commit_callbacks(session):
+  session.info.pop('on_commit', None)
+
+'''
+count_questions()
+    returns the total number of questions
+    the value is cached for QUESTION_CACHE_TTL seconds, and reset whenever
+    a question is inserted or deleted in this process
+'''
+# (count, time at which it expires)
+_question_count = (None, 0)
+
+def count_questions():
+  global _question_count
+  count, expires_at = _question_count
+  now = time.monotonic()
+  if count is None or expires_at <= now:
+    count = db.session.query(Question).count()
+    _question_count = (count, now + QUESTION_CACHE_TTL)
+  return count
+
+'''
+question_ids(category)
+    returns the ids of the questions in the given category,
+    or of all questions when category is None
+    the id lists are cached per category for QUESTION_CACHE_TTL seconds, and
+    reset whenever a question is inserted or deleted in this process
+'''
+# category -> (ids, time at which they expire)
+_question_ids = {}
+
+def question_ids(category=None):
+  ids, expires_at = _question_ids.get(category, (None, 0))
+  now = time.monotonic()
+  if ids is None or expires_at <= now:
+    query = db.session.query(Question.id)
+    if category is not None:
+      query = query.filter(Question.category == category)
+    ids = [question_id for (question_id,) in query]
+    _question_ids[category] = (ids, now + QUESTION_CACHE_TTL)
+  return ids
+
+'''
+clear_question_caches()
+    resets the cached question count and id lists
+    it runs when a Question object inserted or deleted is committed, and must
+    be called after questions are written without the ORM (bulk inserts)
+'''
+def clear_question_caches():
+  global _question_count
+  _question_count = (None, 0)
+  _question_ids.clear()
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_delete')
+def reset_question_caches(mapper, connection, target):
+  on_commit(target, clear_question_caches)
@@ -1,10 +1,16 @@
+import io
 import os
+import time
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, get_all_categories
+from flaskr import bank
+from flaskr.bank import import_questions, export_questions
+from flaskr.sqlstats import QueryBudgetExceeded
+import models
+from models import setup_db, Question, Category, db
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -40,6 +46,112 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(json.loads(response.data)['categories']))
 
     
+    def test_get_categories_not_modified(self):
+        """ Test get categories with a matching ETag """
+        ## get the ETag of the categories
+        etag = self.client().get('/categories').headers['ETag']
+        ## send it back in If-None-Match
+        response = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        ## check status_code and that no body was sent
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.data)
+
+
+    def test_get_questions_query_budget(self):
+        """ Test get questions stays within its query budget """
+        ## the budget is reported with the query count of the request
+        self.app.config['SQLSTATS_QUERY_BUDGET'] = 3
+        response = self.client().get('/questions?page=1')
+
+        ## check status_code and the reported query count
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-DB-Query-Budget'], '3')
+        self.assertLessEqual(int(response.headers['X-DB-Query-Count']), 3)
+
+
+    def test_query_budget_exceeded_is_logged(self):
+        """ Test a request over its query budget is logged and still answered """
+        self.app.config['SQLSTATS_QUERY_BUDGET'] = 0
+        with self.assertLogs('sqlstats', 'WARNING') as logs:
+            response = self.client().get('/questions?page=1')
+
+        ## check status_code and the logged queries
+        self.assertEqual(response.status_code, 200)
+        exceeded = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual(exceeded[-1]['event'], 'query_budget_exceeded')
+        self.assertEqual(exceeded[-1]['queries'], int(response.headers['X-DB-Query-Count']))
+
+
+    def test_query_budget_strict(self):
+        """ Test a request over its query budget fails in strict mode """
+        self.app.config.update(TESTING=True, SQLSTATS_STRICT=True, SQLSTATS_QUERY_BUDGET=0)
+        ## the first statement, reading the page, goes over the budget and raises
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            self.client().get('/questions?page=1')
+
+        ## check the route and its statements are reported
+        self.assertEqual(raised.exception.endpoint, 'get_questions')
+        self.assertEqual(len(raised.exception.statements), 1)
+
+        ## within the budget the request is answered
+        self.app.config['SQLSTATS_QUERY_BUDGET'] = 3
+        self.assertEqual(self.client().get('/questions?page=1').status_code, 200)
+
+
+    def test_streamed_response_queries_are_logged(self):
+        """ Test the queries of a NDJSON response are logged once its body was sent """
+        with self.assertLogs('sqlstats', 'INFO') as logs:
+            response = self.client().get('/categories/1/questions',
+                                         headers={'Accept': 'application/x-ndjson'})
+            ## the body is still being generated, no queries are logged yet
+            logged_before_close = len(logs.records)
+            response.get_data()
+            response.close()
+
+        logged = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(logged_before_close, 0)
+        self.assertEqual(logged['event'], 'request_queries')
+        self.assertEqual(logged['path'], '/categories/1/questions')
+        self.assertEqual(logged['queries'], int(response.headers['X-DB-Query-Count']))
+
+
+    def test_failed_statement_is_counted(self):
+        """ Test a statement failing in the DB is counted and its timing cleaned up """
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    db.session.execute('SELECT * FROM no_such_table')
+                db.session.rollback()
+            self.assertFalse(db.session.connection().info.get('query_start'))
+            self.assertEqual(self.app.process_response(self.app.response_class()).headers['X-DB-Query-Count'], '3')
+
+
+    def test_get_metrics(self):
+        """ Test the metrics of a route are exported """
+        self.client().get('/categories')
+        response = self.client().get('/metrics')
+        body = response.get_data(as_text=True)
+
+        ## check status_code and the series of /categories
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total{method="GET",route="/categories",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/categories"}', body)
+
+
+    def test_questions_are_encoded_like_format(self):
+        """ Test the rows encoded by RowEncoder are the JSON of Question.format() """
+        response = self.client().get('/questions?page=1')
+        questions = json.loads(response.data)['questions']
+
+        ## check the questions of the page and their keys, sorted like jsonify() sorts them
+        with self.app.app_context():
+            expected = [Question.query.get(question['id']).format() for question in questions]
+        self.assertEqual(questions, expected)
+        self.assertIn(b'{"answer":', response.data)
+
+
     def test_questions_paginated_with_existed_page(self):
         """ Test question pagination success """
         ## get response data
@@ -64,6 +176,48 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+    def test_questions_paginated_with_after_id(self):
+        """ Test question pagination with after_id success """
+        ## get the first page to find the id to continue from
+        first_page = json.loads(self.client().get('/questions').data)['questions']
+        response = self.client().get('/questions?after_id=' + format(first_page[0]['id']))
+
+        ## check success value, status_code 
+        self.assertTrue(json.loads(response.data)['success'])
+        self.assertEqual(response.status_code, 200)
+
+        ## the page should start right after the given id
+        questions = json.loads(response.data)['questions']
+        self.assertEqual(questions[0]['id'], first_page[1]['id'])
+        self.assertTrue(all(question['id'] > first_page[0]['id'] for question in questions))
+
+
+    def test_total_questions_follows_external_writes(self):
+        """ Test the cached total expires when another process adds questions """
+        self.addCleanup(setattr, models, 'QUESTION_CACHE_TTL', models.QUESTION_CACHE_TTL)
+        models.QUESTION_CACHE_TTL = 0.5
+        models.clear_question_caches()
+        total_before = json.loads(self.client().get('/questions').data)['total_questions']
+
+        ## insert a question without the ORM, as another process would
+        with self.app.app_context():
+            db.session.execute(Question.__table__.insert(), [
+                {'question': 'external question', 'answer': 'answer', 'category': '1', 'difficulty': 1}])
+            db.session.commit()
+        self.addCleanup(self.delete_external_questions)
+
+        ## the total is cached first, then counted again once it expired
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total_before)
+        time.sleep(0.6)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total_before + 1)
+
+
+    def delete_external_questions(self):
+        with self.app.app_context():
+            db.session.execute(Question.__table__.delete().where(Question.question == 'external question'))
+            db.session.commit()
+
+
     def test_delete_a_question_success(self):
         """ Test delete question success """
 
@@ -184,7 +338,21 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(len(json.loads(response.data)['questions']) > 0)
 
-       
+
+    def test_get_questions_for_a_category_ndjson(self):
+        """ Test get questions for a category as NDJSON """
+        ## load response data
+        response = self.client().get('/categories/1/questions',
+                                     headers={'Accept': 'application/x-ndjson'})
+        questions = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        ## check status_code, content type and one question per line
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertTrue(len(questions) > 0)
+        self.assertTrue(all(question['category'] == '1' for question in questions))
+
+
     def test_get_questions_for_a_category_failure(self):
         """ Test get questions for a category failure """ 
 
@@ -211,6 +379,224 @@ class TriviaTestCase(unittest.TestCase):
         self.assertNotEqual(json.loads(response.data)['question']['id'], 13)
         self.assertNotEqual(json.loads(response.data)['question']['id'], 14)
     
+    def external_question_ids(self, count, category='1'):
+        """ Insert questions without the ORM, as another process would, and return their ids """
+        with self.app.app_context():
+            db.session.execute(Question.__table__.insert(), [
+                {'question': 'external question', 'answer': 'answer', 'category': category, 'difficulty': 1}
+                for _ in range(count)])
+            db.session.commit()
+            self.addCleanup(self.delete_external_questions)
+            return [question.id for question in Question.query.filter_by(question='external question')]
+
+
+    def category_question_ids(self, category='1'):
+        with self.app.app_context():
+            return [question.id for question in Question.query.filter_by(category=category)]
+
+
+    def test_quizzes_question_deleted_by_another_process(self):
+        """ Test quizzes never pick a question deleted since the ids were cached """
+        deleted_id, kept_id = self.external_question_ids(2)
+        previous_questions = [id for id in self.category_question_ids() if id not in (deleted_id, kept_id)]
+        ## cache the ids of the category, then delete one of the questions without the ORM
+        models.clear_question_caches()
+        self.client().post('/quizzes', json={'quiz_category': {'type': 'Science', 'id': '1'},
+                                             'previous_questions': previous_questions})
+        with self.app.app_context():
+            db.session.execute(Question.__table__.delete().where(Question.id == deleted_id))
+            db.session.commit()
+
+        ## check the remaining question is always the one picked
+        for _ in range(10):
+            response = self.client().post('/quizzes', json={'quiz_category': {'type': 'Science', 'id': '1'},
+                                                            'previous_questions': previous_questions})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data)['question']['id'], kept_id)
+
+
+    def test_quizzes_question_added_by_another_process(self):
+        """ Test quizzes pick questions added by another process once the cached ids expired """
+        self.addCleanup(setattr, models, 'QUESTION_CACHE_TTL', models.QUESTION_CACHE_TTL)
+        models.QUESTION_CACHE_TTL = 0.5
+        previous_questions = self.category_question_ids()
+        ## cache the ids of the category, then add a question without the ORM
+        models.clear_question_caches()
+        response = self.client().post('/quizzes', json={'quiz_category': {'type': 'Science', 'id': '1'},
+                                                        'previous_questions': previous_questions})
+        self.assertEqual(response.status_code, 404)
+        [added_id] = self.external_question_ids(1)
+
+        ## check the new question is picked once the cached ids expired
+        time.sleep(0.6)
+        response = self.client().post('/quizzes', json={'quiz_category': {'type': 'Science', 'id': '1'},
+                                                        'previous_questions': previous_questions})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['question']['id'], added_id)
+
+
+    def delete_imported_questions(self):
+        with self.app.app_context():
+            db.session.execute(Question.__table__.delete().where(Question.question.like('imported question%')))
+            db.session.commit()
+
+
+    def import_ndjson(self, rows):
+        self.addCleanup(self.delete_imported_questions)
+        lines = [row if isinstance(row, str) else json.dumps(row) for row in rows]
+        with self.app.app_context():
+            return import_questions(io.StringIO('\n'.join(lines) + '\n'), 'ndjson')
+
+
+    def test_import_questions_skips_duplicates(self):
+        """ Test questions already in the DB or earlier in the file are not imported twice """
+        with self.app.app_context():
+            existing = Question.query.first().question
+        questions_total_before = self.count_all_questions()
+
+        report = self.import_ndjson([
+            {'question': 'imported question 1', 'answer': 'a', 'category': 'Science', 'difficulty': 1},
+            {'question': ' imported question 1 ', 'answer': 'b', 'category': 'Art', 'difficulty': 2},
+            {'question': existing, 'answer': 'c', 'category': 'Science', 'difficulty': 3}])
+
+        ## check only the first question was inserted
+        self.assertEqual((report['inserted'], report['duplicates'], report['failed']), (1, 2, 0))
+        self.assertEqual(self.count_all_questions(), questions_total_before + 1)
+
+
+    def test_import_questions_reports_error_rows(self):
+        """ Test invalid rows are reported by line number and the valid ones imported """
+        report = self.import_ndjson([
+            '{"question": "imported question 1",',
+            '["imported question 2", "answer", "Science", 1]',
+            {'question': 'imported question 3', 'category': 'Science', 'difficulty': 1},
+            {'question': 'imported question 4', 'answer': 'a', 'category': 'Science', 'difficulty': 9},
+            {'question': 'imported question 5', 'answer': 'a', 'category': 'Science', 'difficulty': 'hard'},
+            {'question': 'imported question 6', 'answer': 'a', 'category': 'Science', 'difficulty': 1}])
+
+        ## check the failed rows and their line numbers
+        self.assertEqual((report['inserted'], report['duplicates'], report['failed']), (1, 0, 5))
+        self.assertEqual([error['line'] for error in report['errors']], [1, 2, 3, 4, 5])
+        self.assertEqual(report['errors'][2]['error'], 'missing answer')
+
+
+    def test_import_questions_caps_reported_errors(self):
+        """ Test only the first MAX_REPORTED_ERRORS errors are listed, the others counted """
+        report = self.import_ndjson(['[]'] * (bank.MAX_REPORTED_ERRORS + 5))
+
+        self.assertEqual(report['failed'], bank.MAX_REPORTED_ERRORS + 5)
+        self.assertEqual(len(report['errors']), bank.MAX_REPORTED_ERRORS)
+        self.assertEqual(report['errors_omitted'], 5)
+
+
+    def test_import_questions_looks_up_duplicates_in_chunks(self):
+        """ Test a batch larger than LOOKUP_SIZE finds its duplicates with several IN queries """
+        with self.app.app_context():
+            existing = Question.query.order_by(Question.id.desc()).first().question
+        rows = [{'question': 'imported question {}'.format(i), 'answer': 'a', 'category': 'Science', 'difficulty': 1}
+                for i in range(bank.LOOKUP_SIZE * 2)]
+        rows.append({'question': existing, 'answer': 'a', 'category': 'Science', 'difficulty': 1})
+        report = self.import_ndjson(rows)
+
+        ## check the question of the last chunk was found in the DB
+        self.assertEqual((report['inserted'], report['duplicates']), (bank.LOOKUP_SIZE * 2, 1))
+
+
+    def test_export_import_csv_round_trip(self):
+        """ Test an exported CSV file imports back as the same questions """
+        self.import_ndjson([
+            {'question': 'imported question, with "quotes"\nand a new line', 'answer': 'a, b',
+             'category': 'Science', 'difficulty': 2}])
+        exported = io.StringIO()
+        with self.app.app_context():
+            export_report = export_questions(exported, 'csv')
+            exported.seek(0)
+            import_report = import_questions(exported, 'csv')
+
+        ## check every exported question is read back and found in the DB
+        self.assertEqual(export_report['exported'], self.count_all_questions())
+        self.assertEqual(import_report['duplicates'], export_report['exported'])
+        self.assertEqual((import_report['inserted'], import_report['failed']), (0, 0))
+
+
+    def test_import_questions_command(self):
+        """ Test the import-questions command imports a CSV file """
+        self.addCleanup(self.delete_imported_questions)
+        runner = self.app.test_cli_runner()
+        with runner.isolated_filesystem():
+            with open('questions.csv', 'w') as file:
+                file.write('question,answer,category,difficulty\n'
+                           'imported question 1,answer,Science,1\n'
+                           'imported question 2,answer,Science,0\n')
+            result = runner.invoke(args=['import-questions', 'questions.csv'])
+
+        ## check the summary and the failed line
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('line 3: difficulty must be between 1 and 5', result.output)
+        self.assertIn('1 questions inserted, 0 duplicates skipped, 1 failed', result.output)
+
+
+    def test_import_questions_command_counts_omitted_errors(self):
+        """ Test the import-questions command prints the number of errors it didn't list """
+        runner = self.app.test_cli_runner()
+        with runner.isolated_filesystem():
+            with open('questions.ndjson', 'w') as file:
+                file.write('[]\n' * (bank.MAX_REPORTED_ERRORS + 3))
+            result = runner.invoke(args=['import-questions', 'questions.ndjson'])
+
+        ## check the listed errors and the omitted count
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.count('each line must be a JSON object'), bank.MAX_REPORTED_ERRORS)
+        self.assertIn('... and 3 more failed rows', result.output)
+
+
+    def test_question_caches_reset_on_commit(self):
+        """ Test the question count is reset once an insert is committed, not when it is flushed or rolled back """
+        with self.app.app_context():
+            models.clear_question_caches()
+            count = models.count_questions()
+            db.session.add(Question('cached question', 'answer', '1', 1))
+            db.session.flush()
+            ## flushed: the count must not be reloaded with the uncommitted question
+            self.assertEqual(models.count_questions(), count)
+            db.session.rollback()
+            self.assertEqual(models.count_questions(), count)
+
+            question = Question('cached question', 'answer', '1', 1)
+            question.insert()
+            self.addCleanup(self.delete_question, question.id)
+            self.assertEqual(models.count_questions(), count + 1)
+
+
+    def test_categories_cache_reset_on_commit(self):
+        """ Test the cached categories are reset once a new category is committed """
+        with self.app.app_context():
+            categories = get_all_categories()
+            category = Category(type='Cached category')
+            db.session.add(category)
+            db.session.flush()
+            self.assertEqual(get_all_categories(), categories)
+            db.session.commit()
+            self.addCleanup(self.delete_category, category.id)
+            self.assertIn('Cached category', get_all_categories().values())
+
+
+    def delete_question(self, question_id):
+        with self.app.app_context():
+            Question.query.get(question_id).delete()
+
+
+    def delete_category(self, category_id):
+        with self.app.app_context():
+            db.session.delete(Category.query.get(category_id))
+            db.session.commit()
+
+
+    def count_all_questions(self):
+        with self.app.app_context():
+            return Question.query.count()
+
+
     def test_quizzes_failure(self):
        """ Test quizzes failure """
        # send post request without empty json 
@@ -0,0 +1,188 @@
+'''
+Concurrency benchmark of the WSGI and ASGI serving modes.
+
+The API is started in a separate process, once with the threaded werkzeug
+server (`flask run`) and once with uvicorn and src.asgi, on the same seeded
+SQLite database. Batches of concurrent clients then request GET /drinks and
+GET /drinks-detail (with a token signed by a stub JWKS), each request on its
+own connection, and the throughput and latency of every batch is printed.
+
+Run it from the backend directory (the ASGI mode needs uvicorn):
+
+  python -m benchmarks.concurrency --clients 10 100 1000 --requests-per-client 5
+'''
+import os
+import sys
+import json
+import math
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from .jwks_stub import StubJWKS
+
+PERMISSIONS = ['get:drinks-detail']
+
+
+def raise_open_files_limit():
+    # every client holds a socket, 1000 of them don't fit in the usual soft limit of 1024
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+
+def seed(drinks):
+    from src.database.models import db, Drink
+    from src.api import app
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        recipe = json.dumps([{'name': 'milk', 'color': 'white', 'parts': 1}])
+        db.session.execute(Drink.__table__.insert(),
+                           [{'title': 'Drink {}'.format(i), 'recipe': recipe} for i in range(drinks)])
+        db.session.commit()
+
+
+def serve(mode, port, jwks_url):
+    # runs in the server process
+    from src.auth import auth
+    auth.jwks_cache = auth.JWKSCache(jwks_url)
+    if mode == 'asgi':
+        import uvicorn
+        from src.asgi import application
+        uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+    else:
+        from werkzeug.serving import run_simple
+        from src.api import app
+        run_simple('127.0.0.1', port, app, threaded=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('the server did not start on port {}'.format(port))
+
+
+async def request(port, path, headers):
+    # one request on its own connection, returns the status code
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        lines = ['GET {} HTTP/1.1'.format(path), 'Host: 127.0.0.1', 'Connection: close']
+        lines += ['{}: {}'.format(name, value) for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_clients(port, clients, requests_per_client, token, timeout):
+    latencies = []
+    errors = []
+    routes = [('/drinks', {}), ('/drinks-detail', {'Authorization': 'Bearer ' + token})]
+
+    async def client(number):
+        for i in range(requests_per_client):
+            path, headers = routes[(number + i) % len(routes)]
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(request(port, path, headers), timeout)
+            except (OSError, asyncio.TimeoutError) as error:
+                errors.append(type(error).__name__)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(fraction):
+        if not latencies:
+            return float('nan')
+        return latencies[max(1, math.ceil(fraction * len(latencies))) - 1] * 1000
+
+    return {
+        'clients': clients,
+        'requests': clients * requests_per_client,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(0.50), 2),
+        'p95_ms': round(percentile(0.95), 2),
+        'p99_ms': round(percentile(0.99), 2),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--requests-per-client', type=int, default=5)
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--drinks', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds before a request counts as failed')
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--jwks-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    raise_open_files_limit()
+
+    if args.serve:
+        serve(args.serve, args.port, args.jwks_url)
+        return
+
+    workdir = tempfile.mkdtemp()
+    # read by src.database.models when it is imported, here and in the server processes
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'concurrency.db')
+    seed(args.drinks)
+    stub = StubJWKS()
+    token = stub.sign(PERMISSIONS)
+
+    print('{:5} {:>8} {:>9} {:>10} {:>9} {:>9} {:>9} {:>7}'.format(
+        'mode', 'clients', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    try:
+        for mode in args.modes:
+            port = free_port()
+            # the access and slow query logs of the server would drown the results
+            log = open(os.path.join(workdir, mode + '.log'), 'w')
+            server = subprocess.Popen([sys.executable, '-m', 'benchmarks.concurrency', '--serve', mode,
+                                       '--port', str(port), '--jwks-url', stub.url],
+                                      stdout=log, stderr=subprocess.STDOUT)
+            try:
+                wait_for(port)
+                # the first requests fetch the JWKS and build the menu
+                asyncio.run(run_clients(port, 2, 2, token, args.timeout))
+                for clients in args.clients:
+                    result = asyncio.run(run_clients(port, clients, args.requests_per_client,
+                                                     token, args.timeout))
+                    print('{:5} {clients:>8} {requests:>9} {throughput_rps:>10} {p50_ms:>9} {p95_ms:>9} '
+                          '{p99_ms:>9} {errors:>7}'.format(mode, **result))
+            finally:
+                server.terminate()
+                server.wait()
+                log.close()
+    finally:
+        stub.close()
+    print('server logs: ' + workdir)
+
+
+if __name__ == '__main__':
+    main()
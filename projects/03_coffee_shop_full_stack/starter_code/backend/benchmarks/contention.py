@@ -0,0 +1,148 @@
+'''
+Read/write contention benchmark of the storage modes of the coffee shop database.
+
+Reader threads list the drinks while writer threads add a drink and update
+another one in one transaction, like orders coming in while the menu is
+served. Each storage mode runs on a fresh database for the same time:
+
+  sqlite-default   SQLite as it was set up before: rollback journal, no pool
+  sqlite-wal       SQLite with the pool and pragmas of setup_db() (WAL,
+                   synchronous=NORMAL, busy_timeout, mmap)
+  postgres         the pooled Postgres engine of setup_db(), with --postgres-url
+
+Run it from the backend directory:
+
+  python -m benchmarks.contention --readers 8 --writers 4 --seconds 10
+  python -m benchmarks.contention --postgres-url postgresql://localhost:5432/coffee_bench
+'''
+import os
+import json
+import math
+import time
+import argparse
+import tempfile
+import threading
+
+from sqlalchemy import create_engine, event, select, func
+
+from src.database.models import Drink, engine_options, set_sqlite_pragmas
+
+RECIPE = json.dumps([{'name': 'milk', 'color': 'white', 'parts': 1}])
+
+
+def make_engine(mode, url):
+    if mode == 'sqlite-default':
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    if mode == 'sqlite-wal':
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+
+def seed(engine, drinks):
+    table = Drink.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [{'title': 'Drink {}'.format(i), 'recipe': RECIPE}
+                                            for i in range(drinks)])
+
+
+def run(engine, readers, writers, seconds, drinks):
+    table = Drink.__table__
+    deadline = time.monotonic() + seconds
+    counter = iter(range(10 ** 9))
+    stats = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+
+    def read():
+        with engine.connect() as connection:
+            connection.execute(select([table.c.id, table.c.title, table.c.recipe])).fetchall()
+
+    def write():
+        number = next(counter)
+        with engine.begin() as connection:
+            connection.execute(table.insert().values(title='Order {}-{}'.format(os.getpid(), number),
+                                                     recipe=RECIPE))
+            connection.execute(table.update()
+                                    .where(table.c.id == number % drinks + 1)
+                                    .values(recipe=RECIPE))
+
+    def worker(kind, operation):
+        latencies = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                operation()
+            except Exception:
+                errors[kind] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        stats[kind].extend(latencies)
+
+    threads = [threading.Thread(target=worker, args=('read', read)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', write)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for kind in ('read', 'write'):
+        latencies = sorted(stats[kind])
+        results[kind] = {
+            'ops_per_second': round(len(latencies) / seconds, 1),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'errors': errors[kind],
+        }
+    with engine.connect() as connection:
+        results['rows'] = connection.execute(select([func.count()]).select_from(table)).scalar()
+    return results
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return round(ordered[max(1, math.ceil(fraction * len(ordered))) - 1] * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--drinks', type=int, default=200)
+    parser.add_argument('--postgres-url', help='also run the pooled Postgres mode on this database')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    modes = [('sqlite-default', 'sqlite:///' + os.path.join(workdir, 'default.db')),
+             ('sqlite-wal', 'sqlite:///' + os.path.join(workdir, 'wal.db'))]
+    if args.postgres_url:
+        modes.append(('postgres', args.postgres_url))
+
+    report = {}
+    for mode, url in modes:
+        engine = make_engine(mode, url)
+        seed(engine, args.drinks)
+        report[mode] = run(engine, args.readers, args.writers, args.seconds, args.drinks)
+        engine.dispose()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print('{} readers, {} writers, {}s per mode'.format(args.readers, args.writers, args.seconds))
+    print('{:15} {:6} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+        'mode', 'op', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for mode, results in report.items():
+        for kind in ('read', 'write'):
+            result = results[kind]
+            print('{:15} {:6} {ops_per_second:>9} {p50_ms!s:>9} {p95_ms!s:>9} {p99_ms!s:>9} {errors:>7}'.format(
+                mode, kind, **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import json
+import time
+import base64
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from jose import jwt
+
+from src.auth import auth
+
+
+def generate_rsa_key():
+    """
+    This function returns a new 2048 bit RSA key
+    as (private key PEM, modulus, public exponent)
+    """
+    try:
+        from Crypto.PublicKey import RSA
+        key = RSA.generate(2048)
+        return key.exportKey().decode(), key.n, key.e
+    except ImportError:
+        import rsa
+        public_key, private_key = rsa.newkeys(2048)
+        return private_key.save_pkcs1().decode(), public_key.n, public_key.e
+
+
+def b64_int(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class StubJWKS:
+    """
+    A local JWKS endpoint with its own signing key, it signs tokens with the
+    issuer and audience the auth module expects so requires_auth() accepts them
+    """
+
+    def __init__(self, kid='bench-key'):
+        self.kid = kid
+        self.private_key, n, e = generate_rsa_key()
+        jwks = json.dumps({'keys': [{
+            'kty': 'RSA', 'kid': kid, 'use': 'sig', 'alg': 'RS256',
+            'n': b64_int(n), 'e': b64_int(e)}]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(jwks)))
+                self.end_headers()
+                self.wfile.write(jwks)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def install(self):
+        # points the auth module at this endpoint instead of Auth0
+        auth.jwks_cache = auth.JWKSCache(self.url)
+
+    def sign(self, permissions, expires_in=3600, subject='bench|barista'):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+            'aud': auth.API_AUDIENCE,
+            'sub': subject,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions),
+        }
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
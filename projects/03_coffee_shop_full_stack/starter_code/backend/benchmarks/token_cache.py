@@ -0,0 +1,65 @@
+'''
+Micro-benchmark of the verified-token cache used by requires_auth().
+
+A route protected with requires_auth('get:drinks-detail') is called through
+the Flask test client with the same bearer token, once with the cache
+disabled (every request runs the RS256 verification) and once enabled.
+
+Run it from the backend directory:
+
+  python -m benchmarks.token_cache --requests 2000
+'''
+import argparse
+import time
+
+from flask import Flask
+
+from src.auth import auth
+from .jwks_stub import StubJWKS
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/protected')
+    @auth.requires_auth('get:drinks-detail')
+    def protected(payload):
+        return 'ok'
+
+    return app
+
+
+def requests_per_second(client, headers, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/protected', headers=headers)
+        assert response.status_code == 200, response.data
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    stub = StubJWKS()
+    stub.install()
+    headers = {'Authorization': 'Bearer ' + stub.sign(['get:drinks-detail'])}
+    client = make_app().test_client()
+
+    try:
+        auth.token_cache = auth.VerifiedTokenCache(maxsize=0)
+        without_cache = requests_per_second(client, headers, args.requests)
+
+        auth.token_cache = auth.VerifiedTokenCache()
+        with_cache = requests_per_second(client, headers, args.requests)
+    finally:
+        stub.close()
+
+    print(f'without cache: {without_cache:10.0f} req/s')
+    print(f'with cache:    {with_cache:10.0f} req/s  {auth.token_cache.stats()}')
+    print(f'speedup:       {with_cache / without_cache:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,25 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS, cross_origin
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
 from .auth.auth import AuthError, requires_auth
+from .response_cache import ResponseCache
+from .sqlstats import init_query_stats
+from .metrics import init_metrics
+from .streaming import wants_ndjson, ndjson_response
+from .jsonprovider import init_json
 
 app = Flask(__name__)
 setup_db(app)
+init_query_stats(app)
+init_metrics(app)
+init_json(app)
 CORS(app, resources={'/': {'origins': '*'}})
 
+# the public menu is built once and served from memory until a drink is
+# added, updated or deleted
+menu_cache = ResponseCache(ttl=60)
+
 
 ## adding cors headers after each response
 @app.after_request
@@ -24,37 +36,51 @@ def after_request(response):
 
 # db_drop_and_create_all()
 
+def drinks_response(drinks_json):
+    '''
+    builds a {"success": true, "drinks": [...]} response
+    from already serialized drinks without decoding them again
+    '''
+    body = '{"success": true, "drinks": [' + ', '.join(drinks_json) + ']}'
+    return app.response_class(body, mimetype='application/json')
+
 ## ROUTES
 
 ## get drinks ( public endpoint)
 @app.route('/drinks')
 # this endpoint to get all drinks in the DB
 def get_drinks():
-    drinks = Drink.query.all()
-    drinks = [drink.short() for drink in drinks]
+    menu = menu_cache.get(build_menu)
 
-    if len(drinks) == 0:
+    if menu is None:
         abort(404)
     else:
-        return jsonify({
-            'success': True,
-            'drinks': drinks
-            }), 200
+        return menu_cache.respond(menu, request, app.response_class)
+
+
+def build_menu():
+    drinks = Drink.query.all()
+    if len(drinks) == 0:
+        return None
+    # the body is joined from the pre-rendered JSON of each drink
+    return drinks_response([drink.short_json() for drink in drinks]).get_data()
 
 
 @app.route('/drinks-detail')
 @requires_auth('get:drinks-detail')
 def get_drinks_details(payload):
+    if wants_ndjson():
+        # one drink per line, streamed from the DB
+        response = ndjson_response(Drink.query.order_by(Drink.id), Drink.long_json)
+        if response is None:
+            abort(404)
+        return response
     drinks = Drink.query.all()
-    drinks = [drink.long() for drink in drinks]
     # if no drinks 404 will be returned
     if len(drinks) == 0:
         abort(404)
     else:
-        return jsonify({
-            'success': True,
-            'drinks': drinks
-            }), 200
+        return drinks_response([drink.long_json() for drink in drinks]), 200
 
 
 @app.route('/drinks', methods=['POST'])
@@ -70,6 +96,7 @@ def add_drink(payload):
         if 'title' in request.get_json() and 'recipe' in request.get_json():
             drink = Drink(title=title, recipe=recipe)
             drink.insert()
+            menu_cache.invalidate()
             return jsonify({'success': True, 'drinks': [drink.long()]}, 200)
 
     except BaseException:
@@ -91,6 +118,7 @@ def update_drink(payload, id):
             drink.recipe = recipe
 
         drink.update()
+        menu_cache.invalidate()
         return jsonify({'success': True, 'drinks': [drink.long()]}, 200)
     
     except BaseException:
@@ -104,12 +132,139 @@ def delete_drink(payload, id):
     try:
         drink = Drink.query.get(id)
         drink.delete()
+        menu_cache.invalidate()
         return jsonify({'success': True, 'delete': id}, 200)
     except BaseException:
         # if the object is not exist a 404 error will be returned
         abort(404)
 
 
+# most drinks a batch PATCH or DELETE can change
+MAX_BATCH_SIZE = 100
+
+
+def batch_ids(ids):
+    # the ids of a batch, or a 422 if the batch is empty, too large or has
+    # ids that aren't integers or appear twice
+    if not isinstance(ids, list) or not 0 < len(ids) <= MAX_BATCH_SIZE:
+        abort(422)
+    if not all(isinstance(id, int) and not isinstance(id, bool) for id in ids) or len(set(ids)) != len(ids):
+        abort(422)
+    return ids
+
+
+def drink_change_error(change):
+    # the reason a change of a batch PATCH is malformed, or None when it is valid
+    if 'title' in change and not (isinstance(change['title'], str) and change['title'].strip()):
+        return 'title must be a non-empty string'
+    if 'recipe' in change:
+        recipe = change['recipe']
+        if not isinstance(recipe, list) or \
+                not all(isinstance(part, dict) and 'color' in part and 'parts' in part for part in recipe):
+            return 'recipe must be a list of ingredients with a color and parts'
+    return None
+
+
+def batch_response(results):
+    failed = sum(1 for result in results if not result['success'])
+    return jsonify({
+        'success': True,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }), 200
+
+
+@app.route('/drinks', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def update_drinks(payload):
+    '''
+    updates several drinks in one transaction, the body is
+        {"drinks": [{"id": 1, "title": "...", "recipe": [...]}, ...]}
+    every drink gets a result, drinks that don't exist or whose new title
+    is taken are reported and the others are still updated
+    '''
+    body = request.get_json(silent=True)
+    changes = body.get('drinks') if isinstance(body, dict) else None
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        abort(422)
+    ids = batch_ids([change.get('id') for change in changes])
+    errors = [drink_change_error(change) for change in changes]
+
+    # one IN query for the drinks and one for the titles they would take
+    drinks = {drink.id: drink for drink in Drink.query.filter(Drink.id.in_(ids))}
+    titles = [change['title'] for change, error in zip(changes, errors) if error is None and 'title' in change]
+    owners = {title: id for id, title in
+              db.session.query(Drink.id, Drink.title).filter(Drink.title.in_(titles))} if titles else {}
+
+    results = []
+    updated = []
+    for change, error in zip(changes, errors):
+        drink = drinks.get(change['id'])
+        if drink is None:
+            results.append({'id': change['id'], 'success': False, 'error': 404, 'message': 'resource not found'})
+            continue
+        if error is not None:
+            results.append({'id': drink.id, 'success': False, 'error': 422, 'message': error})
+            continue
+        title = change.get('title', drink.title)
+        if not title or owners.get(title, drink.id) != drink.id or titles.count(title) > 1:
+            results.append({'id': drink.id, 'success': False, 'error': 422, 'message': 'title is missing or taken'})
+            continue
+        drink.title = title
+        if 'recipe' in change:
+            drink.recipe = json.dumps(change['recipe'])
+        updated.append(drink)
+        # rendered before the commit, which would expire the drink and reload it
+        results.append({'id': drink.id, 'success': True, 'drink': drink.long()})
+
+    if updated:
+        try:
+            db.session.commit()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            abort(422)
+        menu_cache.invalidate()
+    return batch_response(results)
+
+
+@app.route('/drinks', methods=['DELETE'])
+@requires_auth('delete:drinks')
+def delete_drinks(payload):
+    '''
+    deletes several drinks in one transaction, the body is {"ids": [1, 2, ...]}
+    (or ?ids=1,2,... for clients that can't send a DELETE body), ids that
+    don't exist are reported and the others are still deleted
+    '''
+    if request.args.get('ids'):
+        try:
+            ids = [int(id) for id in request.args['ids'].split(',')]
+        except ValueError:
+            abort(422)
+    else:
+        body = request.get_json(silent=True)
+        ids = body.get('ids') if isinstance(body, dict) else None
+    ids = batch_ids(ids)
+
+    drinks = {drink.id: drink for drink in Drink.query.filter(Drink.id.in_(ids))}
+    results = []
+    for id in ids:
+        if id in drinks:
+            db.session.delete(drinks[id])
+            results.append({'id': id, 'success': True})
+        else:
+            results.append({'id': id, 'success': False, 'error': 404, 'message': 'resource not found'})
+
+    if drinks:
+        try:
+            db.session.commit()
+        except exc.SQLAlchemyError:
+            db.session.rollback()
+            abort(422)
+        menu_cache.invalidate()
+    return batch_response(results)
+
+
 ## Error Handling
 
 @app.errorhandler(422)
@@ -0,0 +1,231 @@
+import io
+import os
+import sys
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import app
+from .auth import auth
+
+# threads running the Flask views, the DB and JWKS calls of a request block
+# one of these threads, never the event loop
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+# chunks of a streamed response read ahead of what the client received
+MAX_BUFFERED_CHUNKS = 8
+
+logger = logging.getLogger(__name__)
+
+
+'''
+ASGIAdapter
+serves a WSGI app from an ASGI server, e.g.
+
+    uvicorn src.asgi:application --workers 2
+
+- the event loop accepts and reads every connection, so thousands of
+  clients can wait on one worker, while at most `threads` requests run
+  the Flask views (and their blocking DB calls) at the same time
+- responses are sent chunk by chunk, so streamed responses stay streamed;
+  a request is handled from the call of the app to the close of its
+  response by one thread, as Flask's request context and the DB session
+  of a streamed response belong to the thread that started it
+- websocket connections are refused with a 403
+- on startup a background task fetches the JWKS keys, and fetches them
+  again before they expire, so verifying a token doesn't wait on Auth0
+- the routes, the AuthError handling and every other behaviour are the
+  ones of the Flask app, since it's the Flask app that handles the request
+'''
+class ASGIAdapter:
+    def __init__(self, wsgi_app, threads=ASGI_THREADS, refresh_jwks=True):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='asgi')
+        self.refresh_jwks = refresh_jwks
+        self._jwks_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            # the API has no websocket routes, closing before accepting answers 403
+            await receive()
+            await send({'type': 'websocket.close'})
+        else:
+            raise NotImplementedError('only http and lifespan scopes are served')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.refresh_jwks:
+                    self._jwks_task = asyncio.ensure_future(self.keep_jwks_fresh())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._jwks_task is not None:
+                    self._jwks_task.cancel()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def keep_jwks_fresh(self):
+        # refreshes the keys at half their ttl, a failed fetch keeps the old
+        # keys and is tried again after min_refresh_interval
+        loop = asyncio.get_running_loop()
+        while True:
+            # looked up every time, auth.jwks_cache can be replaced (e.g. by tests)
+            jwks_cache = auth.jwks_cache
+            delay = jwks_cache.ttl / 2
+            try:
+                await loop.run_in_executor(self.executor, jwks_cache.refresh_now)
+            except Exception:
+                logger.exception('JWKS refresh failed')
+                delay = jwks_cache.min_refresh_interval
+            await asyncio.sleep(delay)
+
+    async def http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        response = WSGIResponse(loop)
+        # the app is called, iterated and closed by the same thread: a streamed
+        # response keeps its request context and DB session on that thread
+        self.executor.submit(response.run, self.wsgi_app, wsgi_environ(scope, bytes(body)))
+        try:
+            kind, value = await response.messages.get()
+            if kind == 'error':
+                raise value
+            status, headers = value
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while True:
+                kind, value = await response.messages.get()
+                if kind == 'chunk':
+                    await send({'type': 'http.response.body', 'body': value, 'more_body': True})
+                    response.chunk_sent()
+                elif kind == 'error':
+                    raise value
+                else:
+                    break
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # stops the thread at its next chunk when the client went away
+            response.cancel()
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class WSGIResponse:
+    '''
+    WSGIResponse
+        a WSGI response produced by one executor thread and consumed by the
+        event loop through the messages queue:
+            ('start', (status, headers)), ('chunk', bytes)..., ('end', None)
+        or ('error', exception) when the app raises
+        at most `buffered` chunks wait in the queue, the thread blocks until
+        the loop has sent them, so a slow client doesn't buffer a whole stream
+    '''
+    def __init__(self, loop, buffered=MAX_BUFFERED_CHUNKS):
+        self.loop = loop
+        self.messages = asyncio.Queue()
+        self.slots = threading.Semaphore(buffered)
+        self.cancelled = False
+        self.status = None
+        self.headers = None
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers]
+
+    def run(self, wsgi_app, environ):
+        # runs in an executor thread
+        result = None
+        try:
+            result = wsgi_app(environ, self.start_response)
+            started = False
+            for chunk in result:
+                # the status is only known once a generator yielded its first chunk
+                if not started:
+                    self.put('start', (self.status, self.headers))
+                    started = True
+                if chunk:
+                    self.slots.acquire()
+                    if self.cancelled:
+                        raise ClientDisconnected()
+                    self.put('chunk', chunk)
+            if not started:
+                self.put('start', (self.status, self.headers))
+            self.put('end', None)
+        except ClientDisconnected:
+            pass
+        except Exception as error:
+            self.put('error', error)
+        finally:
+            if hasattr(result, 'close'):
+                # closing the response ends the request, e.g. removes the DB session
+                result.close()
+
+    def put(self, kind, value):
+        try:
+            self.loop.call_soon_threadsafe(self.messages.put_nowait, (kind, value))
+        except RuntimeError:
+            # the event loop is closed
+            raise ClientDisconnected()
+
+    def chunk_sent(self):
+        self.slots.release()
+
+    def cancel(self):
+        self.cancelled = True
+        # wakes the thread if it waits for a free slot
+        self.slots.release()
+
+
+def wsgi_environ(scope, body):
+    # the WSGI environ of an ASGI http scope
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+application = ASGIAdapter(app)
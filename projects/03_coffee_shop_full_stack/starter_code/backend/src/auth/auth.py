@@ -1,4 +1,8 @@
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
@@ -8,6 +12,14 @@ from urllib.request import urlopen
 AUTH0_DOMAIN = 'dev-gidx7ugc.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'auth'
+JWKS_URL = f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
+# seconds the fetched keys are considered fresh
+JWKS_TTL = 600
+# minimum seconds between two refetches caused by an unknown kid
+JWKS_MIN_REFRESH_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 5
+# number of verified tokens kept in memory, 0 disables the cache
+TOKEN_CACHE_SIZE = 1024
 
 ## AuthError Exception
 '''
@@ -21,6 +33,188 @@ class AuthError(Exception):
 
 
 
+'''
+JWKSUnavailable Exception
+raised when the keys can't be fetched from the JWKS endpoint
+'''
+class JWKSUnavailable(Exception):
+    pass
+
+
+'''
+JWKSCache
+keeps the RSA keys published at the JWKS endpoint in memory, keyed by kid
+- the first lookup fetches the keys, only one thread fetches at a time
+  and the others use the result of its fetch, the keys or the error
+- once the keys are older than ttl they are still served while a
+  background thread fetches the new ones (stale-while-revalidate)
+- an unknown kid refetches the keys right away, at most once every
+  min_refresh_interval seconds, so rotated keys are picked up
+- a failed fetch is not tried again before min_refresh_interval either,
+  lookups in the meantime raise JWKSUnavailable without waiting on the endpoint
+'''
+class JWKSCache:
+    def __init__(self, url, ttl=JWKS_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        # time and error of the last fetch, the error is None when it succeeded
+        self._attempted_at = None
+        self._error = None
+        self._generation = 0
+        self._refresh_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+
+    def fetch(self):
+        """
+        This function downloads the JWKS and returns the RSA keys by kid
+        """
+        with urlopen(self.url, timeout=JWKS_FETCH_TIMEOUT) as response:
+            jwks = json.loads(response.read())
+        return {
+            key['kid']: {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']}
+            for key in jwks['keys']}
+
+    def unavailable(self):
+        return JWKSUnavailable('fetching {} failed: {}'.format(self.url, self._error))
+
+    def refresh(self, generation):
+        # the generation is the one the caller saw, if it changed while the
+        # caller waited for the lock another thread already tried to fetch the
+        # keys, and the caller gets its result instead of fetching again
+        with self._refresh_lock:
+            if self._generation == generation:
+                self._attempted_at = time.monotonic()
+                try:
+                    self._keys = self.fetch()
+                    self._fetched_at = time.monotonic()
+                    self._error = None
+                except Exception as error:
+                    self._error = error
+                self._generation += 1
+            error = self._error
+        if error is not None:
+            raise self.unavailable() from error
+
+    def can_retry(self, now):
+        # a failed fetch is tried again after min_refresh_interval only
+        return self._error is None or now - self._attempted_at > self.min_refresh_interval
+
+    def refresh_now(self):
+        # fetches the keys whatever their age, used to refresh them ahead of time
+        self.refresh(self._generation)
+
+    def refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        generation = self._generation
+
+        def run():
+            try:
+                self.refresh(generation)
+            except Exception:
+                # the stale keys are kept and the next lookup tries again
+                pass
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_key(self, kid):
+        """
+        This function returns the RSA key with the given kid,
+        or None if the JWKS has no such key
+        """
+        generation = self._generation
+        now = time.monotonic()
+        if self._fetched_at is None:
+            if not self.can_retry(now):
+                raise self.unavailable() from self._error
+            self.refresh(generation)
+        elif now - self._fetched_at > self.ttl and self.can_retry(now):
+            self.refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._attempted_at > self.min_refresh_interval:
+            self.refresh(generation)
+            key = self._keys.get(kid)
+        return key
+
+
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+'''
+VerifiedTokenCache
+a bounded LRU of the payloads of tokens that passed verify_decode_jwt()
+- entries are keyed by the sha256 of the token, the token itself is not kept
+- an entry is dropped once the exp claim of its payload has passed
+- hits, misses and evictions are counted to check the hit rate
+'''
+class VerifiedTokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """
+        This function returns the cached payload of the token,
+        or None if the token wasn't verified before or has expired
+        """
+        key = self.key(token)
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is not None and payload.get('exp', 0) > time.time():
+                self._payloads.move_to_end(key)
+                self.hits += 1
+                return payload
+            if payload is not None:
+                del self._payloads[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        # tokens without exp are never cached, they couldn't be expired
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return
+        key = self.key(token)
+        with self._lock:
+            self._payloads[key] = payload
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self.maxsize:
+                self._payloads.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._payloads)
+        }
+
+
+token_cache = VerifiedTokenCache()
+
+
 def get_token_auth_header():
     """
     This function validate the Authorization header
@@ -64,30 +258,28 @@ def verify_decode_jwt(token):
     This function verfies the decoded JWT
     and return the decoded  payload
     """
-    jsonurl = urlopen(f'http://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-
-
     # Get the header from the token
     header = jwt.get_unverified_header(token)
 
     # check if kid in header
     if 'kid' in header:
         if header['kid']:
-   
-            rsa_key = {}
-            for key in jwks['keys']:
-                # if the kid in jwks matches the kid in the header
-                # the rsa key will be created
-                if key['kid'] == header['kid']:
-                    rsa_key = {
-                        'kty': key['kty'],
-                        'kid': key['kid'],
-                        'use': key['use'],
-                        'n': key['n'],
-                        'e': key['e']}
-                    
-            if rsa_key:
+
+            # the rsa key with the kid of the header comes from the JWKS cache
+            try:
+                rsa_key = jwks_cache.get_key(header['kid'])
+            except Exception:
+                raise AuthError({
+                    'code': 'jwks_unavailable',
+                    'description': 'Unable to fetch the signing keys.'
+                }, 401)
+
+            if not rsa_key:
+                raise AuthError({
+                    'code': 'invalid_header',
+                    'description': 'Unable to find the appropriate key.'
+                }, 400)
+            else:
                 try:
                     # create the payload
                     payload = jwt.decode(
@@ -138,7 +330,11 @@ def requires_auth(permission=''):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            # the RS256 verification is skipped for tokens verified before
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = verify_decode_jwt(token)
+                token_cache.put(token, payload)
             check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
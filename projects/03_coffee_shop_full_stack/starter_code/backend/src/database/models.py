@@ -1,24 +1,92 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+from collections import OrderedDict
+from sqlalchemy import Column, String, Integer, event
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 from flask_migrate import Migrate
 
+from ..jsonprovider import dumps, loads
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+# DATABASE_URL points the app at another database, e.g. Postgres
+# (postgresql://user@localhost:5432/coffee) or the benchmark one
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
+
+# connections kept open by each worker, and the extra ones opened under load
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# seconds a request waits for a free connection, and age at which a connection is replaced
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# milliseconds a SQLite writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+# bytes of the SQLite file read through mmap instead of read() calls
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+# drinks whose pre-rendered forms are kept by each worker
+SERIALIZED_DRINKS_MAX = int(os.environ.get('SERIALIZED_DRINKS_MAX', 10000))
 
 db = SQLAlchemy()
 
+
+def is_sqlite(database_path):
+    return database_path.startswith('sqlite')
+
+
+def engine_options(database_path):
+    """
+    This function returns the engine options of a database URL,
+    a pool sized by DB_POOL_SIZE / DB_MAX_OVERFLOW for both SQLite and Postgres
+    """
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+    }
+    if is_sqlite(database_path):
+        if database_path in ('sqlite://', 'sqlite:///:memory:'):
+            # every connection to :memory: is a different database
+            return {}
+        # SQLite file connections aren't pooled by default, pooling them keeps
+        # the pragmas set once per connection instead of once per request
+        options['poolclass'] = QueuePool
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        options['pool_recycle'] = DB_POOL_RECYCLE
+        options['pool_pre_ping'] = True
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    This function tunes every new SQLite connection:
+    - WAL lets readers go on while a writer commits, instead of all waiting on one lock
+    - synchronous=NORMAL syncs the WAL at checkpoints rather than at every commit,
+      a power loss can lose the last commits but never corrupts the file
+    - busy_timeout makes writers wait for the lock instead of failing right away
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout={}'.format(SQLITE_BUSY_TIMEOUT))
+    cursor.execute('PRAGMA mmap_size={}'.format(SQLITE_MMAP_SIZE))
+    cursor.close()
+
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
-def setup_db(app):
+def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
+    if is_sqlite(database_path):
+        event.listen(db.get_engine(app), 'connect', set_sqlite_pragmas)
     migrate = Migrate(app, db)
 
 '''
@@ -31,6 +99,52 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+SerializedDrinks
+    a LRU of pre-rendered drinks keyed by id, bounded to max_size entries
+    drinks deleted by other workers are never read again, and are pushed
+    out like the drinks that are no longer listed
+'''
+class SerializedDrinks:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, id):
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is not None:
+                self._entries.move_to_end(id)
+            return entry
+
+    def put(self, id, entry):
+        with self._lock:
+            self._entries[id] = entry
+            self._entries.move_to_end(id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, id):
+        with self._lock:
+            self._entries.pop(id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+'''
+serialized_drinks
+    pre-rendered short and long forms of the drinks keyed by id, so the
+    recipe blob isn't parsed and encoded again each time a drink is listed
+    entries are refreshed when a drink is inserted or updated
+'''
+serialized_drinks = SerializedDrinks(SERIALIZED_DRINKS_MAX)
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -45,28 +159,69 @@ class Drink(db.Model):
     recipe =  Column(String(180), nullable=False)
 
     '''
-    short()
-        short form representation of the Drink model
+    serialize()
+        builds the short and long forms of the drink, as dicts and as JSON
     '''
-    def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
-        return {
+    def serialize(self):
+        recipe = loads(self.recipe)
+        short = {
+            'id': self.id,
+            'title': self.title,
+            'recipe': [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+        }
+        long = {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': recipe
+        }
+        return {
+            'title': self.title,
+            'recipe': self.recipe,
+            'short': short,
+            'long': long,
+            'short_json': dumps(short),
+            'long_json': dumps(long)
         }
 
+    '''
+    serialized()
+        returns the pre-rendered forms of the drink from serialized_drinks
+        the entry is rebuilt if the title or recipe changed since it was made
+    '''
+    def serialized(self):
+        entry = serialized_drinks.get(self.id)
+        if entry is None or entry['title'] != self.title or entry['recipe'] != self.recipe:
+            entry = self.serialize()
+            serialized_drinks.put(self.id, entry)
+        return entry
+
+    '''
+    short()
+        short form representation of the Drink model
+    '''
+    def short(self):
+        return self.serialized()['short']
+
     '''
     long()
         long form representation of the Drink model
     '''
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        return self.serialized()['long']
+
+    '''
+    short_json()
+        short form representation of the Drink model as a JSON string
+    '''
+    def short_json(self):
+        return self.serialized()['short_json']
+
+    '''
+    long_json()
+        long form representation of the Drink model as a JSON string
+    '''
+    def long_json(self):
+        return self.serialized()['long_json']
 
     '''
     insert()
@@ -106,4 +261,20 @@ class Drink(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+@event.listens_for(Drink, 'after_insert')
+@event.listens_for(Drink, 'after_update')
+def refresh_serialized_drink(mapper, connection, target):
+    # runs inside the flush, a recipe that can't be serialized must not fail
+    # the commit: the entry is dropped and serialized() raises when it is read
+    try:
+        serialized_drinks.put(target.id, target.serialize())
+    except (ValueError, TypeError, KeyError):
+        serialized_drinks.pop(target.id)
+
+
+@event.listens_for(Drink, 'after_delete')
+def remove_serialized_drink(mapper, connection, target):
+    serialized_drinks.pop(target.id)
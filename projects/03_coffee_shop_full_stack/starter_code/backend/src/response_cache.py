@@ -0,0 +1,95 @@
+import gzip
+import time
+import hashlib
+import threading
+
+# brotli is optional, without it responses are only precompressed with gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+'''
+CachedBody
+a response body with its precompressed variants and a strong ETag per variant
+'''
+class CachedBody:
+    def __init__(self, body, version):
+        self.version = version
+        self.created_at = time.monotonic()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body)}
+        self.etags = {'identity': digest, 'gzip': digest + '-gzip'}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+            self.etags['br'] = digest + '-br'
+
+
+'''
+ResponseCache
+keeps the body of one response until invalidate() is called,
+every invalidate() bumps the version so a body built while a write
+was happening is never stored for the new version
+- ttl bounds how long a body is served, which matters when several
+  workers run and only the one handling a write invalidates its cache
+'''
+class ResponseCache:
+    def __init__(self, ttl=60, mimetype='application/json'):
+        self.ttl = ttl
+        self.mimetype = mimetype
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entry = None
+
+    def get(self, build):
+        '''
+        returns the cached body, or calls build() to make it
+        build() returns the body as bytes, or None if there is nothing
+        to cache (nothing is stored in that case)
+        '''
+        entry = self._entry
+        if entry is not None and entry.version == self.version \
+                and time.monotonic() - entry.created_at < self.ttl:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        version = self.version
+        body = build()
+        if body is None:
+            return None
+        entry = CachedBody(body, version)
+        with self._lock:
+            if version == self.version:
+                self._entry = entry
+        return entry
+
+    def respond(self, entry, request, response_class):
+        '''
+        returns the best encoded variant of the body the client accepts,
+        or an empty 304 if the client already has it
+        '''
+        encoding = request.accept_encodings.best_match(
+            [encoding for encoding in ('br', 'gzip') if encoding in entry.bodies],
+            default='identity')
+        etag = entry.etags[encoding]
+
+        response = response_class(mimetype=self.mimetype)
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            return response
+
+        response.set_data(entry.bodies[encoding])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
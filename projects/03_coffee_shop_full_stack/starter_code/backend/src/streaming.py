@@ -0,0 +1,71 @@
+# generated from projects/shared/streaming.py by projects/shared/sync.py, edit that file instead
+'''
+streaming
+    opt-in NDJSON responses for the list endpoints of the Flask apps
+
+    a list endpoint asked with ?format=ndjson or Accept: application/x-ndjson
+    answers with one JSON object per line instead of one JSON document:
+
+        {"id": 1, "name": "Guns N Petals"}
+        {"id": 2, "name": "Matt Quevedo"}
+
+    the rows are read from a server-side cursor (Query.yield_per) and sent a
+    chunk at a time as soon as they are serialized, so the memory of the
+    request doesn't grow with the size of the result and the first rows reach
+    the client before the last ones are read
+
+    settings (app.config):
+        STREAM_CHUNK_ROWS  rows fetched, serialized and sent per chunk (default 500)
+'''
+from itertools import islice
+
+from flask import request, current_app, stream_with_context, json
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+DEFAULT_CHUNK_ROWS = 500
+
+
+def wants_ndjson():
+    # true when the request asked for NDJSON, JSON stays the default for */*
+    if request.args.get('format') == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, serialize, chunk_rows=None):
+    '''
+    streams the rows of a query as NDJSON
+    serialize(row) returns the dict of a row, or its already encoded JSON,
+    dicts are encoded by the JSON provider of the app, like jsonify() does;
+    an object with an encode_rows(rows) method instead (e.g. a RowEncoder of
+    jsonprovider.py) encodes every chunk at once
+
+    the first chunk is read before the response starts, an empty result
+    returns None so the view can answer it like in the JSON mode (e.g. 404)
+    '''
+    if chunk_rows is None:
+        chunk_rows = current_app.config.get('STREAM_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)
+    rows = iter(query.yield_per(chunk_rows))
+    chunk = list(islice(rows, chunk_rows))
+    if not chunk:
+        return None
+
+    def encode(chunk):
+        if hasattr(serialize, 'encode_rows'):
+            return serialize.encode_rows(chunk)
+        lines = []
+        for row in chunk:
+            value = serialize(row)
+            if not isinstance(value, (str, bytes)):
+                value = json.dumps(value)
+            lines.append(value.encode() if isinstance(value, str) else value)
+        return lines
+
+    def generate(chunk):
+        while chunk:
+            yield b'\n'.join(encode(chunk)) + b'\n'
+            chunk = list(islice(rows, chunk_rows))
+
+    # the request (and its DB session) stays open until the last chunk is sent
+    return current_app.response_class(stream_with_context(generate(chunk)), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,225 @@
+import os
+import gzip
+import json
+import tempfile
+import unittest
+
+# read by src.database.models when it is imported, the tests never touch database.db
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+
+from src.api import app, MAX_BATCH_SIZE, menu_cache
+from src.database.models import db, Drink
+from src.response_cache import brotli
+from benchmarks.jwks_stub import StubJWKS
+
+RECIPE = [{'name': 'milk', 'color': 'white', 'parts': 1}]
+
+
+class BatchDrinksTestCase(unittest.TestCase):
+    """This class represents the batch PATCH and DELETE /drinks test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.jwks = StubJWKS()
+        cls.jwks.install()
+        token = cls.jwks.sign(['patch:drinks', 'delete:drinks'])
+        cls.headers = {'Authorization': 'Bearer ' + token}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.jwks.close()
+
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            for title in ('Latte', 'Mocha', 'Flat White'):
+                Drink(title=title, recipe=json.dumps(RECIPE)).insert()
+
+    def titles(self):
+        with app.app_context():
+            return sorted(drink.title for drink in Drink.query.all())
+
+    def test_patch_drinks(self):
+        """ Test a batch PATCH updates every drink """
+        response = self.client.patch('/drinks', headers=self.headers, json={'drinks': [
+            {'id': 1, 'title': 'Cortado'},
+            {'id': 2, 'recipe': [{'name': 'cocoa', 'color': 'brown', 'parts': 2}]}]})
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['succeeded'], data['failed']), (2, 0))
+        self.assertEqual(data['results'][0]['drink']['title'], 'Cortado')
+        self.assertEqual(data['results'][1]['drink']['recipe'][0]['name'], 'cocoa')
+        self.assertEqual(self.titles(), ['Cortado', 'Flat White', 'Mocha'])
+
+    def test_patch_drinks_partial_failure(self):
+        """ Test missing drinks and taken titles don't stop the other changes """
+        response = self.client.patch('/drinks', headers=self.headers, json={'drinks': [
+            {'id': 1, 'title': 'Cortado'},
+            {'id': 2, 'title': 'Flat White'},
+            {'id': 99, 'title': 'Espresso'}]})
+        results = response.get_json()['results']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['success'] for result in results], [True, False, False])
+        self.assertEqual([result.get('error') for result in results], [None, 422, 404])
+        self.assertEqual(self.titles(), ['Cortado', 'Flat White', 'Mocha'])
+
+    def test_patch_drinks_malformed_items(self):
+        """ Test malformed changes get a 422 result instead of failing the batch """
+        response = self.client.patch('/drinks', headers=self.headers, json={'drinks': [
+            {'id': 1, 'title': ['Cortado']},
+            {'id': 2, 'recipe': {'name': 'cocoa'}},
+            {'id': 3, 'recipe': [{'name': 'cocoa'}]}]})
+        results = response.get_json()['results']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['error'] for result in results], [422, 422, 422])
+        self.assertEqual(self.titles(), ['Flat White', 'Latte', 'Mocha'])
+
+    def test_patch_drinks_malformed_batch(self):
+        """ Test batches that aren't a list of changes with ids are rejected """
+        for body in ({'drinks': [1, 2]}, {'drinks': []}, {'drinks': [{'title': 'Cortado'}]}, [1]):
+            response = self.client.patch('/drinks', headers=self.headers, json=body)
+            self.assertEqual(response.status_code, 422)
+
+    def test_patch_drinks_batch_too_large(self):
+        """ Test a batch over MAX_BATCH_SIZE is rejected """
+        changes = [{'id': id, 'title': 'Drink {}'.format(id)} for id in range(1, MAX_BATCH_SIZE + 2)]
+        response = self.client.patch('/drinks', headers=self.headers, json={'drinks': changes})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.titles(), ['Flat White', 'Latte', 'Mocha'])
+
+    def test_delete_drinks_partial_failure(self):
+        """ Test a batch DELETE removes the drinks that exist and reports the others """
+        response = self.client.delete('/drinks', headers=self.headers, json={'ids': [1, 2, 42]})
+        data = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['succeeded'], data['failed']), (2, 1))
+        self.assertEqual(data['results'][2]['error'], 404)
+        self.assertEqual(self.titles(), ['Flat White'])
+
+    def test_delete_drinks_query_string(self):
+        """ Test the ids of a batch DELETE can be given in the query string """
+        response = self.client.delete('/drinks?ids=1,3', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.titles(), ['Mocha'])
+        self.assertEqual(self.client.delete('/drinks?ids=1,x', headers=self.headers).status_code, 422)
+
+    def test_delete_drinks_batch_too_large(self):
+        """ Test a batch over MAX_BATCH_SIZE is rejected """
+        ids = list(range(1, MAX_BATCH_SIZE + 2))
+        response = self.client.delete('/drinks', headers=self.headers, json={'ids': ids})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.titles()), 3)
+
+    def test_batch_requires_auth(self):
+        """ Test the batch endpoints need a token """
+        self.assertEqual(self.client.delete('/drinks', json={'ids': [1]}).status_code, 401)
+        self.assertEqual(self.client.patch('/drinks', json={'drinks': [{'id': 1}]}).status_code, 401)
+
+
+class MenuCacheTestCase(unittest.TestCase):
+    """This class represents the cached GET /drinks test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.jwks = StubJWKS()
+        cls.jwks.install()
+        token = cls.jwks.sign(['post:drinks', 'patch:drinks', 'delete:drinks'])
+        cls.headers = {'Authorization': 'Bearer ' + token}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.jwks.close()
+
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            for title in ('Latte', 'Mocha'):
+                Drink(title=title, recipe=json.dumps(RECIPE)).insert()
+        menu_cache.invalidate()
+
+    def tearDown(self):
+        # the other test cases insert drinks without going through the API
+        menu_cache.invalidate()
+
+    def get_menu(self, encoding='identity', etag=None):
+        headers = {'Accept-Encoding': encoding}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        return self.client.get('/drinks', headers=headers)
+
+    def menu_titles(self):
+        return [drink['title'] for drink in self.get_menu().get_json()['drinks']]
+
+    def test_etag_per_encoding(self):
+        """ Test every encoding of the menu has its own strong ETag """
+        plain, gzipped = self.get_menu(), self.get_menu('gzip')
+
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+        self.assertNotEqual(plain.headers['ETag'], gzipped.headers['ETag'])
+        self.assertFalse(plain.headers['ETag'].startswith('W/'))
+        self.assertFalse(gzipped.headers['ETag'].startswith('W/'))
+        self.assertEqual(self.get_menu().headers['ETag'], plain.headers['ETag'])
+
+    def test_not_modified(self):
+        """ Test a matching If-None-Match gets an empty 304, the ETag of another encoding doesn't """
+        etag = self.get_menu('gzip').headers['ETag']
+
+        response = self.get_menu('gzip', etag=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.data)
+        self.assertEqual(self.get_menu(etag=etag).status_code, 200)
+
+    def test_gzip(self):
+        """ Test a client accepting gzip gets the gzipped menu """
+        response = self.get_menu('gzip, deflate')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data))['drinks'], self.get_menu().get_json()['drinks'])
+        self.assertNotIn('Content-Encoding', self.get_menu().headers)
+
+    @unittest.skipUnless(brotli is not None, 'brotli is not installed')
+    def test_brotli(self):
+        """ Test brotli is preferred over gzip when the client accepts both """
+        response = self.get_menu('gzip, br')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.data)), self.get_menu().get_json())
+
+    def test_invalidated_by_writes(self):
+        """ Test adding, updating and deleting a drink serve a new menu at once """
+        etag = self.get_menu().headers['ETag']
+
+        self.client.post('/drinks', headers=self.headers, json={'title': 'Cortado', 'recipe': RECIPE})
+        self.assertEqual(self.menu_titles(), ['Latte', 'Mocha', 'Cortado'])
+        self.assertEqual(self.get_menu(etag=etag).status_code, 200)
+
+        self.client.patch('/drinks/1', headers=self.headers, json={'title': 'Flat White'})
+        self.assertEqual(self.menu_titles(), ['Flat White', 'Mocha', 'Cortado'])
+
+        self.client.delete('/drinks/2', headers=self.headers)
+        self.assertEqual(self.menu_titles(), ['Flat White', 'Cortado'])
+
+    def test_invalidated_by_batch_writes(self):
+        """ Test the batch PATCH and DELETE serve a new menu at once """
+        self.menu_titles()
+
+        self.client.patch('/drinks', headers=self.headers, json={'drinks': [{'id': 1, 'title': 'Cortado'}]})
+        self.assertEqual(self.menu_titles(), ['Cortado', 'Mocha'])
+
+        self.client.delete('/drinks', headers=self.headers, json={'ids': [2]})
+        self.assertEqual(self.menu_titles(), ['Cortado'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+# read by src.database.models when it is imported, the tests never touch database.db
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+
+from src.api import app
+from src.asgi import ASGIAdapter
+from src.database.models import db, Drink
+from benchmarks.jwks_stub import StubJWKS
+
+RECIPE = json.dumps([{'name': 'milk', 'color': 'white', 'parts': 1}])
+
+
+async def call(application, scope, body=b''):
+    # runs one request through the ASGI application and returns the messages it sent
+    messages = []
+    received = []
+
+    async def receive():
+        if scope['type'] == 'websocket':
+            return {'type': 'websocket.connect'}
+        if received:
+            return {'type': 'http.disconnect'}
+        received.append(True)
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages
+
+
+def http_scope(path, query_string=b'', headers=()):
+    return {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string,
+        'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+    }
+
+
+class ASGIAdapterTestCase(unittest.TestCase):
+    """This class represents the ASGI serving mode test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.jwks = StubJWKS()
+        cls.jwks.install()
+        cls.token = cls.jwks.sign(['get:drinks-detail'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.jwks.close()
+
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.execute(Drink.__table__.insert(),
+                               [{'title': 'Drink {}'.format(i), 'recipe': RECIPE} for i in range(25)])
+            db.session.commit()
+        app.config['STREAM_CHUNK_ROWS'] = 2
+        self.application = ASGIAdapter(app, threads=4, refresh_jwks=False)
+
+    def tearDown(self):
+        app.config.pop('STREAM_CHUNK_ROWS')
+        self.application.executor.shutdown()
+
+    def test_get_drinks(self):
+        """ Test a plain JSON response """
+        messages = asyncio.run(call(self.application, http_scope('/drinks')))
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertEqual(len(json.loads(body)['drinks']), 25)
+        self.assertFalse(messages[-1].get('more_body'))
+
+    def test_streamed_response(self):
+        """ Test concurrent NDJSON responses are streamed whole, chunk by chunk """
+        scope = http_scope('/drinks-detail', b'format=ndjson', [('authorization', 'Bearer ' + self.token)])
+
+        async def requests():
+            return await asyncio.gather(*(call(self.application, scope) for _ in range(8)))
+
+        for messages in asyncio.run(requests()):
+            chunks = [message['body'] for message in messages[1:] if message.get('body')]
+            lines = b''.join(chunks).decode().splitlines()
+            self.assertEqual(messages[0]['status'], 200)
+            self.assertEqual(len(chunks), 13)
+            self.assertEqual([json.loads(line)['title'] for line in lines],
+                             ['Drink {}'.format(i) for i in range(25)])
+
+    def test_websocket_is_refused(self):
+        """ Test websocket connections are closed before being accepted """
+        messages = asyncio.run(call(self.application, {'type': 'websocket', 'path': '/drinks'}))
+
+        self.assertEqual(messages, [{'type': 'websocket.close'}])
+
+
+if __name__ == "__main__":
+    unittest.main()
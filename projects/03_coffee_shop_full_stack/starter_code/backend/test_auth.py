@@ -0,0 +1,210 @@
+import json
+import time
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from src.auth.auth import JWKSCache, JWKSUnavailable, VerifiedTokenCache
+
+
+def make_key(kid):
+    return {'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': 'n-' + kid, 'e': 'AQAB'}
+
+
+class StubJWKSServer:
+    """A local JWKS endpoint that counts how many times it was fetched"""
+
+    def __init__(self, kids, delay=0):
+        self.kids = list(kids)
+        self.delay = delay
+        # any other status makes the endpoint fail, like Auth0 during an outage
+        self.status = 200
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    self.send_error(stub.status)
+                    return
+                body = json.dumps({'keys': [make_key(kid) for kid in stub.kids]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    def setUp(self):
+        self.stub = StubJWKSServer(['key-1'])
+
+    def tearDown(self):
+        self.stub.close()
+
+    def test_keys_are_fetched_once(self):
+        """ Test the keys are served from memory after the first fetch """
+        cache = JWKSCache(self.stub.url)
+        for _ in range(5):
+            self.assertEqual(cache.get_key('key-1'), make_key('key-1'))
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_unknown_kid_refetches_keys(self):
+        """ Test an unknown kid refetches the keys to pick up rotated keys """
+        cache = JWKSCache(self.stub.url, min_refresh_interval=0)
+        cache.get_key('key-1')
+        self.stub.kids.append('key-2')
+
+        self.assertEqual(cache.get_key('key-2'), make_key('key-2'))
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_unknown_kid_refetch_is_throttled(self):
+        """ Test unknown kids don't refetch more than once per interval """
+        cache = JWKSCache(self.stub.url, min_refresh_interval=60)
+        cache.get_key('key-1')
+
+        self.assertIsNone(cache.get_key('missing'))
+        self.assertIsNone(cache.get_key('missing'))
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_stale_keys_are_served_while_refreshing(self):
+        """ Test expired keys are still served and refreshed in the background """
+        cache = JWKSCache(self.stub.url, ttl=0)
+        cache.get_key('key-1')
+        self.stub.delay = 0.2
+
+        ## the lookup doesn't wait for the slow endpoint
+        start = time.monotonic()
+        self.assertEqual(cache.get_key('key-1'), make_key('key-1'))
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        ## the background refresh reaches the endpoint
+        deadline = time.monotonic() + 2
+        while self.stub.requests < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_concurrent_lookups_fetch_once(self):
+        """ Test only one fetch is in flight when many threads miss together """
+        self.stub.delay = 0.1
+        cache = JWKSCache(self.stub.url)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_key('key-1')))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [make_key('key-1')] * 10)
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_concurrent_lookups_share_a_failed_fetch(self):
+        """ Test threads waiting on a failing fetch get its error instead of fetching again """
+        self.stub.delay = 0.2
+        self.stub.status = 503
+        cache = JWKSCache(self.stub.url)
+        errors = []
+
+        def lookup():
+            try:
+                cache.get_key('key-1')
+            except JWKSUnavailable as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=lookup) for _ in range(5)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(self.stub.requests, 1)
+        self.assertLess(time.monotonic() - start, 0.35)
+
+    def test_failed_fetch_is_throttled(self):
+        """ Test a failed fetch is not retried before min_refresh_interval """
+        self.stub.status = 503
+        cache = JWKSCache(self.stub.url, min_refresh_interval=0.2)
+        for _ in range(5):
+            with self.assertRaises(JWKSUnavailable):
+                cache.get_key('key-1')
+        self.assertEqual(self.stub.requests, 1)
+
+        ## once the interval has passed the endpoint is tried again
+        self.stub.status = 200
+        time.sleep(0.25)
+        self.assertEqual(cache.get_key('key-1'), make_key('key-1'))
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_unknown_kid_refetch_is_throttled_while_failing(self):
+        """ Test unknown kids don't refetch from a failing endpoint more than once per interval """
+        cache = JWKSCache(self.stub.url, min_refresh_interval=0.1)
+        cache.get_key('key-1')
+        time.sleep(0.15)
+        self.stub.status = 503
+
+        with self.assertRaises(JWKSUnavailable):
+            cache.get_key('missing')
+        for _ in range(4):
+            self.assertIsNone(cache.get_key('missing'))
+        ## the known key is still served
+        self.assertEqual(cache.get_key('key-1'), make_key('key-1'))
+        self.assertEqual(self.stub.requests, 2)
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def test_cached_payload_is_returned(self):
+        """ Test a verified token is served from the cache """
+        cache = VerifiedTokenCache(maxsize=2)
+        payload = {'sub': 'barista', 'exp': time.time() + 60}
+        cache.put('token', payload)
+
+        self.assertIs(cache.get('token'), payload)
+        self.assertIsNone(cache.get('other token'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_expired_payload_is_dropped(self):
+        """ Test a token is verified again once exp has passed """
+        cache = VerifiedTokenCache(maxsize=2)
+        cache.put('token', {'sub': 'barista', 'exp': time.time() - 1})
+
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        """ Test the cache keeps at most maxsize tokens """
+        cache = VerifiedTokenCache(maxsize=2)
+        exp = time.time() + 60
+        cache.put('first', {'exp': exp})
+        cache.put('second', {'exp': exp})
+        cache.get('first')
+        cache.put('third', {'exp': exp})
+
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import json
+import tempfile
+import unittest
+
+# read by src.database.models when it is imported, the tests never touch database.db
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+
+from src.api import app
+from src.database.models import db, Drink, SerializedDrinks, serialized_drinks
+
+RECIPE = json.dumps([{'name': 'milk', 'color': 'white', 'parts': 1}])
+
+
+class SerializedDrinksTestCase(unittest.TestCase):
+    """This class represents the pre-rendered drinks test case"""
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        serialized_drinks.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_lru_is_bounded(self):
+        """ Test the least recently read drinks are evicted past max_size """
+        drinks = SerializedDrinks(max_size=2)
+        drinks.put(1, 'one')
+        drinks.put(2, 'two')
+        drinks.get(1)
+        drinks.put(3, 'three')
+
+        self.assertEqual(len(drinks), 2)
+        self.assertEqual((drinks.get(1), drinks.get(2), drinks.get(3)), ('one', None, 'three'))
+
+    def test_drinks_are_serialized_on_write(self):
+        """ Test inserted and updated drinks are pre-rendered, deleted ones dropped """
+        drink = Drink(title='Latte', recipe=RECIPE)
+        drink.insert()
+        self.assertEqual(serialized_drinks.get(drink.id)['short']['title'], 'Latte')
+
+        drink.title = 'Cortado'
+        drink.update()
+        self.assertEqual(json.loads(serialized_drinks.get(drink.id)['long_json'])['title'], 'Cortado')
+
+        drink_id = drink.id
+        drink.delete()
+        self.assertIsNone(serialized_drinks.get(drink_id))
+
+    def test_malformed_recipe_is_committed(self):
+        """ Test a recipe that can't be serialized doesn't fail the commit """
+        for recipe in ('not json', json.dumps([{'name': 'milk'}])):
+            drink = Drink(title='Drink ' + recipe, recipe=recipe)
+            drink.insert()
+
+            ## the drink is saved, it fails when it is read
+            self.assertIsNotNone(Drink.query.get(drink.id))
+            self.assertIsNone(serialized_drinks.get(drink.id))
+            with self.assertRaises((ValueError, KeyError)):
+                drink.short()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+'''
+coffee
+    routes and dataset of the coffee shop API, the protected routes are sent
+    with a token signed by a local stub JWKS (backend/benchmarks/jwks_stub.py)
+'''
+import os
+import sys
+import json
+
+from harness import Route
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', '03_coffee_shop_full_stack', 'starter_code', 'backend')
+# {workdir} is the temporary directory of the run
+DEFAULT_DATABASE_URL = 'sqlite:///{workdir}/coffee_bench.db'
+PERMISSIONS = ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+
+headers = {}
+
+
+def recipe(i):
+    return [{'name': 'milk', 'color': 'white', 'parts': 1 + i % 3},
+            {'name': 'coffee', 'color': 'brown', 'parts': 1}]
+
+
+def setup(database_url):
+    sys.path.insert(0, PROJECT_DIR)
+    # models reads DATABASE_URL when it is imported
+    os.environ['DATABASE_URL'] = database_url
+    from src.api import app
+    from benchmarks.jwks_stub import StubJWKS
+    stub = StubJWKS()
+    stub.install()
+    headers['Authorization'] = 'Bearer ' + stub.sign(PERMISSIONS)
+    return app
+
+
+def seed(app, size, spare):
+    '''
+    size drinks followed by the `spare` drinks the DELETE route removes
+    '''
+    from src.database.models import db, Drink, serialized_drinks
+    from src.api import menu_cache
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Drink.__table__.insert(), [
+            {'title': 'Drink {}'.format(i), 'recipe': json.dumps(recipe(i))} for i in range(size + spare)])
+        db.session.commit()
+    # the rows were inserted without the ORM, so the caches don't know about them
+    serialized_drinks.clear()
+    menu_cache.invalidate()
+
+
+def routes(size, spare):
+    return [
+        Route('GET', '/drinks'),
+        Route('GET', '/drinks-detail', headers=headers),
+        Route('POST', '/drinks', headers=headers,
+              json=lambda i: {'title': 'New drink {}'.format(i), 'recipe': recipe(i)}),
+        Route('PATCH', lambda i: '/drinks/{}'.format(i % size + 1), name='PATCH /drinks/<id>', headers=headers,
+              json=lambda i: {'recipe': recipe(i)}),
+        Route('DELETE', lambda i: '/drinks/{}'.format(size + 1 + i), name='DELETE /drinks/<id>', headers=headers),
+        Route('GET', '/metrics'),
+    ]
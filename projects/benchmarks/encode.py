@@ -0,0 +1,108 @@
+'''
+JSON encode benchmark of the list payloads of the trivia API.
+
+10k questions (--rows) are seeded in a SQLite file, then every case builds
+and encodes the {"success": true, "questions": [...]} payload of the list
+endpoints --repeat times and reports the best time, the rows encoded per
+second and the MB of JSON per second:
+
+  encode only      the payload is built once, only the encoding is timed:
+                   the json module (as Flask's default provider, or its
+                   default encoder before Flask 2.2) against
+                   flaskr/jsonprovider.py (orjson when it is installed)
+  query + encode   the rows are read from the DB too: Question objects and
+                   format() against column rows turned into dicts or
+                   encoded by RowEncoder
+
+  python encode.py --rows 10000 --repeat 20
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '02_trivia_api', 'starter', 'backend')
+
+
+def best_of(repeat, function):
+    # returns the fastest of repeat runs in seconds and the size of the output
+    output = function()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best, len(output.encode() if isinstance(output, str) else output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_DIR)
+    # models reads DATABASE_URL when it is imported
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'encode.db')
+    from flaskr import create_app, question_rows, question_encoder, QUESTION_FIELDS
+    from flaskr.jsonprovider import JSON_BACKEND, dumps, jsonify_encoded
+    from models import db, Question
+
+    app = create_app()
+    try:
+        from flask.json.provider import DefaultJSONProvider
+        default_jsonify = DefaultJSONProvider(app).response
+        fast_jsonify = app.json.response
+    except ImportError:
+        # before Flask 2.2, jsonify() encodes with the encoder class of the app
+        from flask import jsonify
+        from flask.json import JSONEncoder
+
+        def jsonify_with(encoder):
+            def response(obj):
+                app.json_encoder = encoder
+                return jsonify(obj)
+            return response
+        default_jsonify = jsonify_with(JSONEncoder)
+        fast_jsonify = jsonify_with(app.json_encoder)
+    with app.app_context():
+        db.session.execute(Question.__table__.insert(), [
+            {'question': 'What is the answer to question {}?'.format(i), 'answer': 'Answer {}'.format(i),
+             'category': str(i % 6 + 1), 'difficulty': i % 5 + 1}
+            for i in range(args.rows)])
+        db.session.commit()
+
+        def payload(questions):
+            return {'success': True, 'questions': questions, 'total_questions': len(questions)}
+
+        built = payload([question.format() for question in Question.query.all()])
+        cases = [
+            ('encode only', 'json.dumps', lambda: json.dumps(built)),
+            ('encode only', 'jsonify, default', lambda: default_jsonify(built).get_data()),
+            ('encode only', 'jsonify, jsonprovider', lambda: fast_jsonify(built).get_data()),
+            ('encode only', 'jsonprovider.dumps', lambda: dumps(built)),
+            ('query + encode', 'Question.format(), json.dumps',
+             lambda: json.dumps(payload([question.format() for question in Question.query.all()]))),
+            ('query + encode', 'Question.format(), jsonprovider',
+             lambda: dumps(payload([question.format() for question in Question.query.all()]))),
+            ('query + encode', 'rows as dicts, jsonprovider',
+             lambda: dumps(payload([dict(zip(QUESTION_FIELDS, row)) for row in question_rows()]))),
+            ('query + encode', 'rows, RowEncoder',
+             lambda: question_encoder.encode_list(question_rows().all())),
+            ('query + encode', 'rows, RowEncoder, jsonify_encoded',
+             lambda: jsonify_encoded({'success': True, 'total_questions': args.rows},
+                                     questions=question_encoder.encode_list(question_rows().all())).get_data()),
+        ]
+
+        print('{} rows, best of {}, JSON backend: {}'.format(args.rows, args.repeat, JSON_BACKEND))
+        print('{:15} {:33} {:>9} {:>12} {:>8}'.format('', 'case', 'ms', 'rows/s', 'MB/s'))
+        for group, name, function in cases:
+            seconds, size = best_of(args.repeat, function)
+            print('{:15} {:33} {:>9.2f} {:>12,.0f} {:>8.1f}'.format(
+                group, name, seconds * 1000, args.rows / seconds, size / seconds / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+'''
+fyyur
+    routes and dataset of the Fyyur app, it needs Postgres (ARRAY columns and
+    pg_trgm), e.g. createdb fyyur_bench
+'''
+import os
+import sys
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from harness import Route
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '01_fyyur', 'starter_code')
+DEFAULT_DATABASE_URL = 'postgresql://localhost:5432/fyyur_bench'
+SHOWS_PER_ARTIST = 5
+GENRES = ['Jazz', 'Rock n Roll', 'Folk', 'Classical', 'Hip-Hop', 'Blues']
+
+
+def setup(database_url):
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app
+    return create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+
+
+def venue_row(i):
+    return {
+        'name': 'Venue {}'.format(i), 'city': 'City {}'.format(i % 50), 'state': 'CA',
+        'address': '{} Main St'.format(i), 'phone': '123-123-1234', 'genres': GENRES[:1 + i % 4],
+        'image_link': 'https://example.com/venue.png', 'facebook_link': 'https://facebook.com/venue',
+        'website_link': 'https://example.com', 'seeking_a_talent': i % 2 == 0, 'seeking_talent_text': '',
+    }
+
+
+def artist_row(i):
+    return {
+        'name': 'Artist {}'.format(i), 'city': 'City {}'.format(i % 50), 'state': 'CA',
+        'phone': '123-123-1234', 'genres': GENRES[i % 3:i % 3 + 2],
+        'image_link': 'https://example.com/artist.png', 'facebook_link': 'https://facebook.com/artist',
+        'website_link': 'https://example.com', 'seeking_a_venue': i % 2 == 1, 'seeking_venue_text': '',
+    }
+
+
+def form(row):
+    # checkboxes are posted as 'y' when checked and left out otherwise
+    return {key: 'y' if value is True else value for key, value in row.items() if value is not False}
+
+
+def seed(app, size, spare):
+    '''
+    size venues, size artists and SHOWS_PER_ARTIST shows per artist, half of
+    them upcoming; the `spare` venues after them have no shows and are the
+    ones the DELETE route removes
+    '''
+    from models import db, Venue, Artist, Show, refresh_show_counts
+    now = datetime.now()
+    with app.app_context():
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Venue.__table__.insert(), [venue_row(i) for i in range(size + spare)])
+        db.session.execute(Artist.__table__.insert(), [artist_row(i) for i in range(size)])
+        shows = [{'artist_id': i % size + 1, 'venue_id': i * 7 % size + 1,
+                  'start_at': now + timedelta(days=i % 60 - 30, hours=i % 24)}
+                 for i in range(size * SHOWS_PER_ARTIST)]
+        for start in range(0, len(shows), 10000):
+            db.session.execute(Show.__table__.insert(), shows[start:start + 10000])
+        refresh_show_counts()
+        db.session.commit()
+
+
+def routes(size, spare):
+    def venue_path(suffix=''):
+        return lambda i: '/venues/{}{}'.format(i % size + 1, suffix)
+
+    def artist_path(suffix=''):
+        return lambda i: '/artists/{}{}'.format(i % size + 1, suffix)
+
+    def show_form(i):
+        start = datetime.now() + timedelta(days=i % 30 + 1)
+        return {'artist_id': i % size + 1, 'venue_id': i % size + 1,
+                'start_time': start.strftime('%Y-%m-%d %H:%M:%S')}
+
+    shows_ndjson = '\n'.join(json.dumps(show_form(i)) for i in range(100))
+
+    return [
+        Route('GET', '/'),
+        Route('GET', '/venues'),
+        Route('POST', '/venues/search', data={'search_term': 'Venue 1'}),
+        Route('GET', venue_path(), name='GET /venues/<id>'),
+        Route('GET', '/venues/create'),
+        Route('POST', '/venues/create', data=lambda i: form(venue_row(size + spare + i))),
+        Route('GET', venue_path('/edit'), name='GET /venues/<id>/edit'),
+        Route('POST', venue_path('/edit'), name='POST /venues/<id>/edit',
+              data=lambda i: form(venue_row(i % size)), expect=(302,)),
+        Route('DELETE', lambda i: '/venues/{}'.format(size + 1 + i), name='DELETE /venues/<id>', expect=(302,)),
+        Route('GET', '/artists'),
+        Route('POST', '/artists/search', data={'search_term': 'Artist 1'}),
+        Route('GET', artist_path(), name='GET /artists/<id>'),
+        Route('GET', '/artists/create'),
+        Route('POST', '/artists/create', data=lambda i: form(artist_row(size + i))),
+        Route('GET', artist_path('/edit'), name='GET /artists/<id>/edit'),
+        Route('POST', artist_path('/edit'), name='POST /artists/<id>/edit',
+              data=lambda i: form(artist_row(i % size)), expect=(302,)),
+        Route('GET', '/shows'),
+        Route('GET', '/shows/create'),
+        Route('POST', '/shows/create', data=show_form),
+        Route('POST', '/shows/import', name='POST /shows/import (100 rows)',
+              body=shows_ndjson, content_type='application/x-ndjson'),
+        Route('GET', '/metrics/pool'),
+        Route('GET', '/metrics'),
+    ]
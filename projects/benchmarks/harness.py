@@ -0,0 +1,181 @@
+'''
+harness
+    drives the routes of a Flask app and measures them, either in process
+    through the WSGI test client or over HTTP against a real (werkzeug) server
+
+    every route is requested `requests` times from `concurrency` threads after
+    `warmup` unmeasured requests; the number of SQL queries of a request is
+    read from the X-DB-Query-Count header the apps add (see sqlstats.py)
+'''
+import json
+import math
+import time
+import threading
+import itertools
+import http.client
+from urllib.parse import urlencode
+
+from werkzeug.serving import make_server
+
+
+class Route:
+    '''
+    Route
+        one request to measure, path, json, data and body can be callables
+        taking the index of the request, e.g. to delete a different row each time
+        - json: sent as application/json
+        - data: a dict sent as a form
+        - body: raw bytes or str sent with content_type
+        - expect: the status codes counted as successes
+    '''
+    def __init__(self, method, path, name=None, json=None, data=None, body=None,
+                 content_type=None, headers=None, expect=(200,)):
+        if name is None and callable(path):
+            raise ValueError('a route with a callable path needs a name')
+        self.method = method
+        self.path = path
+        self.name = name or '{} {}'.format(method, path)
+        self.json = json
+        self.data = data
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.expect = expect
+
+    def build(self, index):
+        # returns (path, body bytes or None, headers) of the request number index
+        def value(item):
+            return item(index) if callable(item) else item
+
+        headers = dict(self.headers)
+        body = None
+        if self.json is not None:
+            body = json.dumps(value(self.json)).encode()
+            headers['Content-Type'] = 'application/json'
+        elif self.data is not None:
+            body = urlencode(value(self.data), doseq=True).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif self.body is not None:
+            body = value(self.body)
+            if isinstance(body, str):
+                body = body.encode()
+            headers['Content-Type'] = self.content_type or 'application/octet-stream'
+        return value(self.path), body, headers
+
+
+class TestClientDriver:
+    # sends the requests through app.test_client(), without sockets
+    mode = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, method, path, body, headers):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=body, headers=headers)
+        response.close()
+        return response.status_code, response.headers.get('X-DB-Query-Count')
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    # sends the requests over HTTP to the app served by a threaded werkzeug server
+    mode = 'server'
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def send(self, method, path, body, headers):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.getheader('X-DB-Query-Count')
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+DRIVERS = {driver.mode: driver for driver in (TestClientDriver, ServerDriver)}
+
+
+def percentile(ordered, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(driver, route, requests, concurrency=1, warmup=10):
+    '''
+    measure(driver, route, requests)
+        sends the route `warmup` times, then `requests` times from
+        `concurrency` threads and returns its latency, throughput and queries
+    '''
+    for index in range(warmup):
+        driver.send(route.method, *route.build(index))
+
+    indexes = itertools.count(warmup)
+    end = warmup + requests
+    latencies = []
+    queries = []
+    failures = []
+
+    def worker():
+        # itertools.count is advanced atomically, so every index is sent once
+        for index in indexes:
+            if index >= end:
+                return
+            path, body, headers = route.build(index)
+            start = time.perf_counter()
+            try:
+                status, query_count = driver.send(route.method, path, body, headers)
+            except Exception as error:
+                failures.append(repr(error))
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status not in route.expect:
+                failures.append(status)
+            if query_count is not None:
+                queries.append(int(query_count))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'route': route.name,
+        'mode': driver.mode,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': len(failures),
+        'error_samples': sorted({str(failure) for failure in failures})[:5],
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
@@ -0,0 +1,161 @@
+'''
+load
+    load test of every route of Fyyur, the trivia API and the coffee shop API
+
+    python load.py                                   # all projects, 1000 rows
+    python load.py trivia coffee --sizes 100 10000 --requests 500 --concurrency 8
+    python load.py --database-url fyyur=postgresql://localhost:5432/fyyur_bench
+    python load.py --out results.json --baseline results-main.json
+
+    for every project and dataset size, a fresh dataset is seeded and every
+    route is measured through the WSGI test client and through a real server;
+    the p50/p95/p99 latency, throughput and queries per request of each route
+    are written as JSON, and compared with a baseline file when one is given
+
+    the projects share module names (models, app), so each one runs in its own
+    process, started from a temporary directory so the SQLite files and logs
+    of the run don't end up in the repo
+'''
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import importlib
+import subprocess
+from datetime import datetime, timezone
+
+from harness import DRIVERS, measure
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECTS = ('fyyur', 'trivia', 'coffee')
+
+
+def run_project(project, size, database_url, modes, requests, concurrency, warmup):
+    # runs in the child process, returns the results of every route and mode
+    scenario = importlib.import_module(project)
+    app = scenario.setup(database_url)
+    spare = warmup + requests
+    results = []
+    for mode in modes:
+        # every mode starts from the same data, which also refills the rows the DELETE routes used
+        scenario.seed(app, size, spare)
+        driver = DRIVERS[mode](app)
+        try:
+            for route in scenario.routes(size, spare):
+                results.append(measure(driver, route, requests, concurrency, warmup))
+        finally:
+            driver.close()
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    # prints the p95 of every route next to its p95 in the baseline
+    before = {(run['project'], run['size'], result['mode'], result['route']): result
+              for run in baseline['runs'] for result in run.get('results', [])}
+    print('\np95 compared with {} ({})'.format(baseline.get('commit'), baseline.get('started_at')))
+    for run in report['runs']:
+        for result in run.get('results', []):
+            old = before.get((run['project'], run['size'], result['mode'], result['route']))
+            if old is None or not old['p95_ms'] or result['p95_ms'] is None:
+                continue
+            change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+            print('{:7} {:>6} {:11} {:40} {:9.2f} -> {:9.2f} ms {:+7.1f}%'.format(
+                run['project'], run['size'], result['mode'], result['route'][:40],
+                old['p95_ms'], result['p95_ms'], change))
+
+
+def print_results(run):
+    print('\n{} ({} rows, {})'.format(run['project'], run['size'], run['database']))
+    if 'error' in run:
+        print('  failed: ' + run['error'])
+        return
+    print('  {:11} {:40} {:>8} {:>8} {:>8} {:>9} {:>7} {:>6}'.format(
+        'mode', 'route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'errors'))
+    for result in run['results']:
+        print('  {:11} {:40} {:>8} {:>8} {:>8} {:>9} {:>7} {:>6}'.format(
+            result['mode'], result['route'][:40], str(result['p50_ms']), str(result['p95_ms']),
+            str(result['p99_ms']), str(result['throughput_rps']), str(result['queries_per_request']),
+            result['errors']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the routes of the three projects.')
+    parser.add_argument('projects', nargs='*', default=list(PROJECTS), help=', '.join(PROJECTS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000],
+                        help='number of rows seeded (venues and artists, questions, drinks)')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--concurrency', type=int, default=4, help='threads sending requests')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per route')
+    parser.add_argument('--modes', nargs='+', choices=sorted(DRIVERS), default=['test_client', 'server'])
+    parser.add_argument('--database-url', action='append', default=[], metavar='PROJECT=URL',
+                        help='database of a project, Fyyur defaults to Postgres and the others to SQLite')
+    parser.add_argument('--out', help='file the JSON report is written to')
+    parser.add_argument('--baseline', help='earlier JSON report to compare with')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    unknown = set(args.projects) - set(PROJECTS)
+    if unknown:
+        parser.error('unknown projects: ' + ', '.join(sorted(unknown)))
+
+    if args.child:
+        # child process: --child holds the project, size, database and the file the results go to
+        project, size, database_url, out = json.loads(args.child)
+        results = run_project(project, size, database_url, args.modes,
+                              args.requests, args.concurrency, args.warmup)
+        with open(out, 'w') as f:
+            json.dump(results, f)
+        return
+
+    database_urls = dict(value.split('=', 1) for value in args.database_url)
+    report = {
+        'commit': commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': {'requests': args.requests, 'concurrency': args.concurrency,
+                     'warmup': args.warmup, 'modes': args.modes},
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for project in args.projects:
+            scenario = importlib.import_module(project)
+            database_url = database_urls.get(project, scenario.DEFAULT_DATABASE_URL.format(workdir=workdir))
+            for size in args.sizes:
+                out = os.path.join(workdir, '{}-{}.json'.format(project, size))
+                command = [sys.executable, os.path.join(BENCHMARKS_DIR, 'load.py'),
+                           '--child', json.dumps([project, size, database_url, out]),
+                           '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+                           '--warmup', str(args.warmup), '--modes'] + args.modes
+                run = {'project': project, 'size': size, 'database': database_url.split('://')[0]}
+                finished = subprocess.run(command, cwd=workdir, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.PIPE)
+                if finished.returncode == 0:
+                    with open(out) as f:
+                        run['results'] = json.load(f)
+                else:
+                    # the last line naming an exception, SQLAlchemy adds a link after it
+                    lines = [line for line in finished.stderr.decode(errors='replace').splitlines()
+                             if 'Error' in line or 'Exception' in line]
+                    run['error'] = lines[-1].strip() if lines else 'exit code {}'.format(finished.returncode)
+                report['runs'].append(run)
+                print_results(run)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+trivia
+    routes and dataset of the trivia API, SQLite works as well as Postgres
+'''
+import os
+import sys
+
+from harness import Route
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '02_trivia_api', 'starter', 'backend')
+# {workdir} is the temporary directory of the run
+DEFAULT_DATABASE_URL = 'sqlite:///{workdir}/trivia_bench.db'
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+
+def setup(database_url):
+    sys.path.insert(0, PROJECT_DIR)
+    # models reads DATABASE_URL when it is imported
+    os.environ['DATABASE_URL'] = database_url
+    from flaskr import create_app
+    return create_app()
+
+
+def seed(app, size, spare):
+    '''
+    size questions spread over the six categories, followed by the `spare`
+    questions the DELETE route removes
+    '''
+    from models import db, Question, Category, clear_question_caches
+    from flaskr import categories_cache
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'type': name} for name in CATEGORIES])
+        db.session.execute(Question.__table__.insert(), [
+            {'question': 'Question {}?'.format(i), 'answer': 'Answer {}'.format(i),
+             'category': str(i % len(CATEGORIES) + 1), 'difficulty': i % 5 + 1}
+            for i in range(size + spare)])
+        db.session.commit()
+    # the rows were inserted without the ORM, so the caches don't know about them
+    clear_question_caches()
+    categories_cache.invalidate()
+
+
+def routes(size, spare):
+    last_page = max(1, size // 10)
+    return [
+        Route('GET', '/categories'),
+        Route('GET', '/questions?page=1'),
+        Route('GET', '/questions?page={}'.format(last_page), name='GET /questions?page=<last>'),
+        Route('GET', '/questions?after_id={}'.format(size // 2), name='GET /questions?after_id=<id>'),
+        Route('GET', lambda i: '/categories/{}/questions'.format(i % len(CATEGORIES) + 1),
+              name='GET /categories/<id>/questions'),
+        Route('POST', '/questions/search', json={'searchTerm': 'Question 1'}),
+        Route('POST', '/questions', json=lambda i: {
+            'question': 'New question {}?'.format(i), 'answer': 'Answer', 'difficulty': 1, 'category': '1'}),
+        Route('DELETE', lambda i: '/questions/{}'.format(size + 1 + i), name='DELETE /questions/<id>'),
+        Route('POST', '/quizzes', name='POST /quizzes (all categories)',
+              json={'previous_questions': [], 'quiz_category': {'id': 0}}),
+        Route('POST', '/quizzes', name='POST /quizzes (one category)',
+              json={'previous_questions': list(range(1, 50)), 'quiz_category': {'id': 1}}),
+        Route('GET', '/metrics'),
+    ]
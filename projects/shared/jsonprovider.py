@@ -0,0 +1,208 @@
+'''
+jsonprovider
+    the JSON encoding of the Flask apps, done by orjson when it is installed
+
+    orjson encodes list payloads several times faster than the json module,
+    it is optional and the json module is used when it can't be imported:
+
+        pip install orjson
+
+    init_json(app) makes jsonify() and request.get_json() of the app go
+    through orjson: Flask 2.2 and later use the FastJSONProvider JSON
+    provider, older versions (e.g. the pinned Flask 1.0) have no providers
+    and use the FastJSONEncoder and FastJSONDecoder classes
+
+    the output keeps the sorted keys, HTTP dates and compact separators
+    (out of debug mode) of Flask, but orjson has no ensure_ascii option:
+    non-ASCII characters are written as UTF-8 instead of \\u escapes, which
+    decodes to the same values; the json module keeps escaping them
+
+    dumps() and loads() use the same backend outside of responses, and
+    RowEncoder encodes query rows straight to JSON, so list endpoints don't
+    have to load ORM objects, format() them and encode the dicts
+'''
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from flask import current_app
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    DefaultJSONProvider = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj, sort_keys=False, indent=False, default=None):
+    # encodes obj as a compact JSON str (2 spaces indented with indent=True)
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode()
+        except TypeError:
+            # e.g. integers over 64 bits, the json module encodes them
+            pass
+    if indent:
+        return json.dumps(obj, sort_keys=sort_keys, indent=2, default=default)
+    return json.dumps(obj, sort_keys=sort_keys, separators=(',', ':'), default=default)
+
+
+def loads(s):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
+if orjson is not None:
+    def encode_values(values):
+        # the JSON of each value (bytes), ints are formatted without orjson
+        if set(map(type, values)) == {int}:
+            return map(b'%d'.__mod__, values)
+        return map(orjson.dumps, values)
+else:
+    encode_value = json.JSONEncoder(separators=(',', ':')).encode
+
+    def encode_values(values):
+        # the JSON of each value (str), by the C encoder of their type when they have one
+        types = set(map(type, values))
+        if types == {str}:
+            return map(encode_basestring_ascii, values)
+        if types == {int}:
+            return map(int.__repr__, values)
+        return map(encode_value, values)
+
+
+class RowEncoder:
+    '''
+    RowEncoder(fields)
+        encodes rows (any tuples, e.g. the rows of db.session.query(Question.id,
+        Question.question, ...)) to the JSON objects keyed by fields, in the
+        order of the columns of the query, without building a dict per row
+
+        the keys are encoded once, sorted like jsonify() sorts them, in a
+        template of the object; the rows are encoded a column at a time by
+        the encoder of the type of its values, then put in the template
+        the values must be JSON types: str, int, float, bool or None
+    '''
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.order = sorted(range(len(self.fields)), key=lambda i: self.fields[i])
+        placeholder = '%b' if orjson is not None else '%s'
+        template = '{' + ','.join(dumps(self.fields[i]) + ':' + placeholder for i in self.order) + '}'
+        self.template = template.encode() if orjson is not None else template
+
+    def encode_rows(self, rows):
+        # the JSON object of each row, as bytes
+        columns = list(zip(*rows))
+        if not columns:
+            return []
+        encoded = map(self.template.__mod__, zip(*[encode_values(columns[i]) for i in self.order]))
+        if orjson is None:
+            encoded = map(str.encode, encoded)
+        return list(encoded)
+
+    def encode(self, row):
+        return self.encode_rows([row])[0]
+
+    def encode_list(self, rows):
+        # the JSON array of the rows, as bytes
+        return b'[' + b','.join(self.encode_rows(rows)) + b']'
+
+
+def jsonify_encoded(obj, **encoded):
+    '''
+    jsonify_encoded(obj, **encoded)
+        the response of jsonify(obj) with the already encoded JSON values of
+        encoded (bytes, e.g. of RowEncoder.encode_list()) under their keys;
+        the keys are sorted and the JSON is compact, like jsonify() does
+    '''
+    members = []
+    for key in sorted(set(obj) | set(encoded)):
+        value = encoded[key] if key in encoded else dumps(obj[key], sort_keys=True).encode()
+        members.append(dumps(key).encode() + b':' + value)
+    return current_app.response_class(b'{' + b','.join(members) + b'}\n', mimetype='application/json')
+
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        '''
+        FastJSONProvider
+            Flask's default JSON provider with orjson doing the encoding and
+            decoding; datetimes, Decimals and the other types orjson doesn't
+            know are still passed to the default() of Flask
+        '''
+        def dumps(self, obj, **kwargs):
+            if orjson is None or set(kwargs) - {'indent', 'separators'}:
+                # e.g. a cls= encoder, only the json module knows about it
+                return super().dumps(obj, **kwargs)
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode()
+            except TypeError:
+                return super().dumps(obj, **kwargs)
+
+        def loads(self, s, **kwargs):
+            if orjson is None or kwargs:
+                return super().loads(s, **kwargs)
+            return orjson.loads(s)
+
+    FastJSONEncoder = FastJSONDecoder = None
+else:
+    from flask.json import JSONEncoder, JSONDecoder
+
+    FastJSONProvider = None
+
+    class FastJSONEncoder(JSONEncoder):
+        '''
+        FastJSONEncoder
+            the JSON encoder of the apps on Flask versions without JSON
+            providers, Flask's default encoder with orjson doing the encoding;
+            jsonify() creates it with the sort_keys and indent of the app
+        '''
+        def encode(self, o):
+            if orjson is None:
+                return super().encode(o)
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if self.indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(o, default=self.default, option=option).decode()
+            except TypeError:
+                return super().encode(o)
+
+    class FastJSONDecoder(JSONDecoder):
+        '''
+        FastJSONDecoder
+            the JSON decoder of the apps on Flask versions without JSON
+            providers, request.get_json() decodes with orjson
+        '''
+        def decode(self, s, *args):
+            if orjson is None:
+                return super().decode(s, *args)
+            return orjson.loads(s)
+
+
+def init_json(app):
+    # makes the app encode and decode JSON with orjson, through the JSON
+    # provider of Flask 2.2 and later or the encoder classes of older versions
+    if FastJSONProvider is not None:
+        app.json = FastJSONProvider(app)
+    else:
+        app.json_encoder = FastJSONEncoder
+        app.json_decoder = FastJSONDecoder
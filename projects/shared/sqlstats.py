@@ -0,0 +1,208 @@
+'''
+sqlstats
+    per-request SQL instrumentation for the Flask apps
+
+    every statement run through a SQLAlchemy engine while a request is handled
+    is timed, and the response reports the number of queries and the DB time:
+
+        X-DB-Query-Count: 3
+        X-DB-Time-Ms: 4.21
+        Server-Timing: db;dur=4.21;desc="3 queries"
+
+    one structured (JSON) log line is written per request with the slowest
+    statements, and statements slower than SQLSTATS_SLOW_MS are logged as warnings
+
+    the headers of a streamed response are sent before its body is generated,
+    so they only count the queries run until then; its log line is written
+    when the response is closed and counts the queries of the whole body
+
+    settings (app.config):
+        SQLSTATS_SLOW_MS       statements slower than this are logged (default 100)
+        SQLSTATS_TOP           number of slowest statements in the log line (default 3)
+        SQLSTATS_QUERY_BUDGET  when set, the response carries it in an
+                               X-DB-Query-Budget header, and a request running
+                               more queries is logged as a warning with all
+                               its statements, meant for tests (default None)
+        SQLSTATS_STRICT        when true, the statement going over the budget
+                               raises QueryBudgetExceeded, so a test fails
+                               on the route that ran it (default False)
+
+    a route can have its own budget with the @query_budget(n) decorator
+'''
+import json
+import time
+import logging
+
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('sqlstats')
+
+
+class QueryBudgetExceeded(Exception):
+    '''
+    QueryBudgetExceeded
+        raised in SQLSTATS_STRICT mode by the statement going over the query budget
+    '''
+    def __init__(self, endpoint, budget, statements):
+        super().__init__('{} ran more than {} queries:\n{}'.format(endpoint, budget, '\n'.join(statements)))
+        self.endpoint = endpoint
+        self.budget = budget
+        self.statements = statements
+
+
+class QueryStats:
+    '''
+    QueryStats
+        the statements of one request with their durations, and its query budget
+    '''
+    def __init__(self, endpoint=None, budget=None, strict=False):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.strict = strict
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements.append((seconds, statement))
+
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    def slowest(self, top):
+        return sorted(self.statements, key=lambda item: item[0], reverse=True)[:top]
+
+
+def current_stats():
+    # returns the stats of the request being handled, or None outside requests
+    if has_app_context():
+        return g.get('query_stats')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.add(statement, time.perf_counter() - start)
+        if stats.strict and stats.over_budget():
+            raise QueryBudgetExceeded(stats.endpoint, stats.budget,
+                                      [statement for _, statement in stats.statements])
+
+
+def handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute, its start time
+    # is popped here so the list of the connection doesn't grow
+    conn = exception_context.connection
+    if isinstance(exception_context.original_exception, QueryBudgetExceeded):
+        # raised by after_cursor_execute, the statement was counted
+        return
+    if conn is None or not conn.info.get('query_start'):
+        return
+    start = conn.info['query_start'].pop()
+    stats = current_stats()
+    if stats is not None and exception_context.statement is not None:
+        stats.add(exception_context.statement, time.perf_counter() - start)
+
+
+# the listeners are on the Engine class so they cover the engines that
+# apps create later, e.g. in their create_app()
+if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(Engine, 'handle_error', handle_error)
+
+
+def query_budget(max_queries):
+    '''
+    query_budget(max_queries)
+        decorator setting the query budget of a single route
+    '''
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+def init_query_stats(app):
+    '''
+    init_query_stats(app)
+        starts collecting the SQL statements of every request of the app
+    '''
+    app.config.setdefault('SQLSTATS_SLOW_MS', 100)
+    app.config.setdefault('SQLSTATS_TOP', 3)
+    app.config.setdefault('SQLSTATS_QUERY_BUDGET', None)
+    app.config.setdefault('SQLSTATS_STRICT', False)
+
+    @app.before_request
+    def start_query_stats():
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', app.config['SQLSTATS_QUERY_BUDGET'])
+        g.query_stats = QueryStats(request.endpoint, budget, app.config['SQLSTATS_STRICT'])
+
+    @app.after_request
+    def report_query_stats(response):
+        # a streamed body can still run queries, g keeps its stats until the
+        # app context ends and they are logged when the response is closed
+        stats = g.get('query_stats') if response.is_streamed else g.pop('query_stats', None)
+        if stats is None:
+            return response
+        db_ms = round(stats.seconds * 1000, 2)
+        response.headers['X-DB-Query-Count'] = str(stats.count)
+        response.headers['X-DB-Time-Ms'] = str(db_ms)
+        response.headers.add('Server-Timing', 'db;dur={};desc="{} queries"'.format(db_ms, stats.count))
+
+        if stats.budget is not None:
+            response.headers['X-DB-Query-Budget'] = str(stats.budget)
+
+        log = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+        }
+        if response.is_streamed:
+            response.call_on_close(lambda: log_query_stats(app, stats, log))
+        else:
+            log_query_stats(app, stats, log)
+        return response
+
+
+def log_query_stats(app, stats, log):
+    # writes the log lines of a request, log has its method, path, endpoint and status
+    slow_ms = app.config['SQLSTATS_SLOW_MS']
+    for seconds, statement in stats.statements:
+        if seconds * 1000 >= slow_ms:
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'path': log['path'],
+                'ms': round(seconds * 1000, 2),
+                'statement': statement,
+            }))
+    logger.info(json.dumps(dict(
+        {'event': 'request_queries'},
+        **log,
+        queries=stats.count,
+        db_ms=round(stats.seconds * 1000, 2),
+        slowest=[{'ms': round(seconds * 1000, 2), 'statement': statement}
+                 for seconds, statement in stats.slowest(app.config['SQLSTATS_TOP'])],
+    )))
+
+    # raising here would turn a response that is already built, or already
+    # sent, into an error; SQLSTATS_STRICT raises while the request runs instead
+    if stats.over_budget():
+        logger.warning(json.dumps(dict(
+            {'event': 'query_budget_exceeded'},
+            **log,
+            queries=stats.count,
+            budget=stats.budget,
+            statements=[statement for _, statement in stats.statements],
+        )))
@@ -0,0 +1,108 @@
+'''
+sync
+    writes the modules of this directory into the projects that use them
+
+    the three apps are deployed on their own and import these modules from
+    their own package, so each project keeps a copy (vendoring); the copies
+    are generated from the files here, re-indented to the 2 spaces of Fyyur
+    and the trivia API, and must not be edited by hand
+
+        python sync.py          rewrites every copy
+        python sync.py --check  lists the copies that differ, exits with 1 if any
+'''
+import io
+import os
+import sys
+import tokenize
+import argparse
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECTS_DIR = os.path.dirname(SHARED_DIR)
+
+FYYUR = ('01_fyyur/starter_code', 2)
+TRIVIA = ('02_trivia_api/starter/backend/flaskr', 2)
+COFFEE = ('03_coffee_shop_full_stack/starter_code/backend/src', 4)
+
+# module: the (directory, indentation) of the projects that use it
+MODULES = {
+    'sqlstats.py': (FYYUR, TRIVIA, COFFEE),
+    'metrics.py': (FYYUR, TRIVIA, COFFEE),
+    'streaming.py': (FYYUR, TRIVIA, COFFEE),
+    'jsonprovider.py': (TRIVIA, COFFEE),
+}
+
+HEADER = '# generated from projects/shared/{} by projects/shared/sync.py, edit that file instead\n'
+
+
+def reindent(source, width):
+    '''
+    returns source, indented with 4 spaces, indented with width spaces
+    every physical line of a logical line (continuation lines and the lines
+    of its docstring too) moves left by the same number of spaces
+    '''
+    lines = source.splitlines(keepends=True)
+    shifts = [0] * len(lines)
+    start = None
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type in (tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER):
+            continue
+        if start is None and token.type not in (tokenize.NL, tokenize.NEWLINE):
+            start = token
+        if token.type == tokenize.NEWLINE or (token.type == tokenize.NL and start is not None
+                                              and start.type == tokenize.COMMENT):
+            shift = start.start[1] // 4 * (4 - width)
+            for row in range(start.start[0], token.end[0] + 1):
+                shifts[row - 1] = shift
+            start = None
+
+    output = []
+    for line, shift in zip(lines, shifts):
+        spaces = len(line) - len(line.lstrip(' '))
+        output.append(line[min(shift, spaces):])
+    return ''.join(output)
+
+
+def generated(module, width):
+    with open(os.path.join(SHARED_DIR, module)) as file:
+        source = file.read()
+    return HEADER.format(module) + (reindent(source, width) if width != 4 else source)
+
+
+def copies():
+    # yields (path of a copy, its expected content)
+    for module, projects in MODULES.items():
+        for directory, width in projects:
+            yield os.path.join(PROJECTS_DIR, directory, module), generated(module, width)
+
+
+def stale_copies():
+    stale = []
+    for path, content in copies():
+        if not os.path.exists(path):
+            stale.append(path)
+            continue
+        with open(path) as file:
+            if file.read() != content:
+                stale.append(path)
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='only list the copies that differ')
+    args = parser.parse_args()
+
+    if args.check:
+        stale = stale_copies()
+        for path in stale:
+            print('out of date: ' + os.path.relpath(path, PROJECTS_DIR))
+        sys.exit(1 if stale else 0)
+
+    for path, content in copies():
+        with open(path, 'w') as file:
+            file.write(content)
+        print('wrote ' + os.path.relpath(path, PROJECTS_DIR))
+
+
+if __name__ == '__main__':
+    main()
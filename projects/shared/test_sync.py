@@ -0,0 +1,47 @@
+import unittest
+
+import sync
+
+
+class SyncTestCase(unittest.TestCase):
+    """This class represents the vendored modules test case"""
+
+    def test_copies_are_up_to_date(self):
+        """ Test every project's copy is the one generated from projects/shared """
+        self.assertEqual(sync.stale_copies(), [],
+                         'edit the module in projects/shared and run python sync.py')
+
+    def test_reindent(self):
+        """ Test statements, continuation lines, docstrings and comments keep their structure """
+        source = (
+            'class A:\n'
+            '    """\n'
+            '    A\n'
+            '        a class\n'
+            '    """\n'
+            '    def f(self, x,\n'
+            '          y):\n'
+            '        # a comment\n'
+            '        return {\n'
+            '            x: y,\n'
+            '        }\n'
+        )
+        expected = (
+            'class A:\n'
+            '  """\n'
+            '  A\n'
+            '      a class\n'
+            '  """\n'
+            '  def f(self, x,\n'
+            '        y):\n'
+            '    # a comment\n'
+            '    return {\n'
+            '        x: y,\n'
+            '    }\n'
+        )
+        self.assertEqual(sync.reindent(source, 2), expected)
+        compile(sync.reindent(source, 2), 'reindented', 'exec')
+
+
+if __name__ == "__main__":
+    unittest.main()